@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TuSimple 标注文件的流式比较与三方合并。
+
+按 raw_file 关联记录（RawFileIndex 哈希索引），以基准文件为主线按字节分段并行处理，
+每个进程只持有当前一行记录，内存与文件大小基本无关。
+
+命令行用法：
+    python anno_merge.py diff a.json b.json --tol 2
+    python anno_merge.py merge base.json copy1.json copy2.json -o merged.json --conflicts conflicts.json
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from tusimple_io import RawFileIndex, split_line_ranges, iter_lines
+
+PREFER_BASE = "base"
+PREFER_FIRST = "first"
+
+
+def lanes_equal(a, b, tol=0):
+    """两条车道线在容差 tol 像素内是否一致；None 表示车道线不存在"""
+    if a is None or b is None:
+        return a is None and b is None
+    if len(a) != len(b):
+        return False
+    a = np.asarray(a)
+    b = np.asarray(b)
+    valid_a = a >= 0
+    if not np.array_equal(valid_a, b >= 0):
+        return False
+    return bool(np.all(np.abs(a[valid_a] - b[valid_a]) <= tol))
+
+
+def _lane_at(ann, j):
+    lanes = ann.get("lanes", [])
+    return lanes[j] if j < len(lanes) else None
+
+
+def diff_record(a, b, tol=0):
+    """比较两条记录，返回差异列表（为空表示一致）"""
+    diffs = []
+    if a.get("h_samples") != b.get("h_samples"):
+        diffs.append({"kind": "h_samples"})
+    for j in range(max(len(a.get("lanes", [])), len(b.get("lanes", [])))):
+        lane_a, lane_b = _lane_at(a, j), _lane_at(b, j)
+        if lanes_equal(lane_a, lane_b, tol):
+            continue
+        if lane_a is None:
+            diffs.append({"kind": "added", "lane": j})
+        elif lane_b is None:
+            diffs.append({"kind": "removed", "lane": j})
+        else:
+            xa, xb = np.asarray(lane_a), np.asarray(lane_b)
+            if len(xa) != len(xb):
+                # 点数不同（h_samples 不一致）时无法逐点比较
+                diffs.append({"kind": "length", "lane": j, "len_a": len(xa), "len_b": len(xb)})
+                continue
+            both = (xa >= 0) & (xb >= 0)
+            max_dx = int(np.max(np.abs(xa[both] - xb[both]))) if both.any() else 0
+            points = int(np.sum((xa >= 0) != (xb >= 0)) + np.sum(np.abs(xa - xb)[both] > tol))
+            diffs.append({"kind": "changed", "lane": j, "max_dx": max_dx, "points": points})
+    return diffs
+
+
+def format_diff(diffs):
+    """差异列表转为一行可读文本"""
+    parts = []
+    for d in diffs:
+        if d["kind"] == "h_samples":
+            parts.append("h_samples differ")
+        elif d["kind"] == "changed":
+            parts.append(f"lane {d['lane'] + 1} changed ({d['points']} pts, max {d['max_dx']}px)")
+        elif d["kind"] == "length":
+            parts.append(f"lane {d['lane'] + 1} length differs ({d['len_a']} vs {d['len_b']} pts)")
+        else:
+            parts.append(f"lane {d['lane'] + 1} {d['kind']}")
+    return "; ".join(parts)
+
+
+def merge_record(base, copies, tol=0, prefer=PREFER_BASE):
+    """
+    三方合并单条记录，按车道线位置逐条合并。
+    只有一方修改则采用修改；多方修改且结果一致则采用；否则记为冲突，按 prefer 取基准或第一个修改。
+    返回 (合并后记录, 冲突车道线下标列表)。
+    """
+    copies = [c for c in copies if c is not None]
+    changed = [c for c in copies if diff_record(base, c, tol)]
+    if not changed:
+        return base, []
+    first = changed[0]
+    if all(not diff_record(first, c, tol) for c in changed[1:]):
+        return first, []
+    if any(c.get("h_samples") != base.get("h_samples") for c in changed):
+        # h_samples 不一致时无法逐条车道线合并，整条记录冲突
+        return (base if prefer == PREFER_BASE else first), [-1]
+
+    merged_lanes, conflicts = [], []
+    lane_count = max(len(c.get("lanes", [])) for c in [base] + changed)
+    for j in range(lane_count):
+        base_lane = _lane_at(base, j)
+        versions = [_lane_at(c, j) for c in changed]
+        edits = [v for v in versions if not lanes_equal(v, base_lane, tol)]
+        if not edits:
+            lane = base_lane
+        elif all(lanes_equal(edits[0], v, tol) for v in edits[1:]):
+            lane = edits[0]
+        else:
+            conflicts.append(j)
+            lane = base_lane if prefer == PREFER_BASE else edits[0]
+        if lane is not None:
+            merged_lanes.append(lane)
+    merged = dict(base)
+    merged["lanes"] = merged_lanes
+    return merged, conflicts
+
+
+# ---- 并行处理：每个进程处理基准文件的一段字节范围 ----
+_worker_indices = None
+
+
+def _init_worker(indices):
+    global _worker_indices
+    _worker_indices = indices
+
+
+def _diff_range(args):
+    path_a, start, end, tol = args
+    index_b = _worker_indices[0]
+    count, rows, missing = 0, [], []
+    for _, line in iter_lines(path_a, start, end):
+        ann = json.loads(line)
+        other = index_b.get(ann.get("raw_file", ""))
+        if other is None:
+            missing.append((count, ann.get("raw_file", "")))
+        else:
+            diffs = diff_record(ann, other, tol)
+            if diffs:
+                rows.append((count, ann.get("raw_file", ""), diffs))
+        count += 1
+    return count, rows, missing
+
+
+def _merge_range(args):
+    base_path, start, end, tol, prefer, part_path = args
+    count, changed, conflicts = 0, 0, []
+    with open(part_path, "w") as out:
+        for _, line in iter_lines(base_path, start, end):
+            base = json.loads(line)
+            raw_file = base.get("raw_file", "")
+            merged, lane_conflicts = merge_record(
+                base, [index.get(raw_file) for index in _worker_indices], tol, prefer)
+            if merged is not base:
+                changed += 1
+            if lane_conflicts:
+                conflicts.append((count, raw_file, lane_conflicts))
+            json.dump(merged, out)
+            out.write("\n")
+            count += 1
+    return count, changed, conflicts
+
+
+def _run_ranges(func, tasks, indices, workers):
+    if workers <= 1:
+        _init_worker(indices)
+        return [func(t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(indices,)) as pool:
+        return list(pool.map(func, tasks))
+
+
+def _build_indices(paths, workers):
+    if workers <= 1 or len(paths) <= 1:
+        return [RawFileIndex(p) for p in paths]
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        return list(pool.map(RawFileIndex, paths))
+
+
+def diff_files(path_a, path_b, tol=0, workers=None):
+    """
+    比较两个标注文件。返回 (差异行列表[(下标, raw_file, diffs)], 仅在a中的[(下标, raw_file)], 仅在b中的记录数)，
+    下标为记录在 a 中的行号。
+    """
+    workers = workers or os.cpu_count() or 1
+    index_a, index_b = _build_indices([path_a, path_b], workers)
+    tasks = [(path_a, start, end, tol) for start, end in split_line_ranges(path_a, workers)]
+    rows, missing, base = [], [], 0
+    for count, part_rows, part_missing in _run_ranges(_diff_range, tasks, [index_b], workers):
+        rows.extend((base + i, raw_file, diffs) for i, raw_file, diffs in part_rows)
+        missing.extend((base + i, raw_file) for i, raw_file in part_missing)
+        base += count
+    only_in_b = len(np.setdiff1d(index_b.hashes, index_a.hashes))
+    return rows, missing, only_in_b
+
+
+def merge_files(base_path, copy_paths, out_path, tol=0, prefer=PREFER_BASE, workers=None):
+    """
+    以 base_path 为共同祖先，把多个副本三方合并写入 out_path（保持基准文件的记录顺序）。
+    只在副本中存在的记录（raw_file 不在基准文件中）按副本顺序追加在基准记录之后；
+    多个副本新增同一 raw_file 且内容不同时取第一个，并记为整条记录冲突。
+    返回 (记录数, 有修改的记录数, 冲突列表[(下标, raw_file, 冲突车道线)], 新增列表[(下标, raw_file)])，
+    记录数和下标都包含新增记录。
+    """
+    workers = workers or os.cpu_count() or 1
+    indices = _build_indices([base_path] + list(copy_paths), workers)
+    base_index, indices = indices[0], indices[1:]
+    ranges = split_line_ranges(base_path, workers)
+    part_paths = [f"{out_path}.part{i:03d}" for i in range(len(ranges))]
+    tasks = [(base_path, start, end, tol, prefer, part)
+             for (start, end), part in zip(ranges, part_paths)]
+    total, changed, conflicts = 0, 0, []
+    try:
+        results = _run_ranges(_merge_range, tasks, indices, workers)
+        with open(out_path + ".tmp", "wb") as out:
+            for part in part_paths:
+                with open(part, "rb") as f:
+                    shutil.copyfileobj(f, out)
+            extra = _append_new_records(out, base_index, copy_paths, tol)
+        os.replace(out_path + ".tmp", out_path)
+    finally:
+        for part in part_paths:
+            if os.path.exists(part):
+                os.remove(part)
+    for count, part_changed, part_conflicts in results:
+        conflicts.extend((total + i, raw_file, lanes) for i, raw_file, lanes in part_conflicts)
+        changed += part_changed
+        total += count
+    added = []
+    for i, (raw_file, conflicted) in enumerate(extra):
+        added.append((total + i, raw_file))
+        if conflicted:
+            conflicts.append((total + i, raw_file, [-1]))
+    return total + len(extra), changed, conflicts, added
+
+
+def _append_new_records(out, base_index, copy_paths, tol=0):
+    """把只在副本中存在的记录追加到 out，返回 [(raw_file, 是否冲突)]；只在内存中保留新增的记录"""
+    added = {}  # raw_file -> [记录, 是否冲突]
+    for path in copy_paths:
+        for _, line in iter_lines(path):
+            ann = json.loads(line)
+            raw_file = ann.get("raw_file", "")
+            if raw_file in base_index:
+                continue
+            entry = added.get(raw_file)
+            if entry is None:
+                added[raw_file] = [ann, False]
+                out.write(line if line.endswith(b"\n") else line + b"\n")
+            elif diff_record(entry[0], ann, tol):
+                entry[1] = True
+    return [(raw_file, entry[1]) for raw_file, entry in added.items()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Diff and three-way merge TuSimple annotation files")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_diff = sub.add_parser("diff", help="report per-record lane differences")
+    p_diff.add_argument("file_a")
+    p_diff.add_argument("file_b")
+    p_diff.add_argument("--tol", type=int, default=0, help="pixel tolerance")
+    p_diff.add_argument("--workers", type=int, default=None)
+
+    p_merge = sub.add_parser("merge", help="three-way merge labeler copies against the original file")
+    p_merge.add_argument("base")
+    p_merge.add_argument("copies", nargs="+")
+    p_merge.add_argument("-o", "--output", required=True)
+    p_merge.add_argument("--tol", type=int, default=0, help="pixel tolerance")
+    p_merge.add_argument("--prefer", choices=[PREFER_BASE, PREFER_FIRST], default=PREFER_BASE,
+                         help="which side wins a conflicting lane")
+    p_merge.add_argument("--conflicts", help="write the conflict list to this JSON file")
+    p_merge.add_argument("--workers", type=int, default=None)
+
+    args = parser.parse_args(argv)
+    if args.command == "diff":
+        rows, missing, only_in_b = diff_files(args.file_a, args.file_b, args.tol, args.workers)
+        for idx, raw_file, diffs in rows:
+            print(f"{idx}\t{raw_file}\t{format_diff(diffs)}")
+        for idx, raw_file in missing:
+            print(f"{idx}\t{raw_file}\tmissing in {args.file_b}")
+        print(f"{len(rows)} records differ, {len(missing)} only in {args.file_a}, "
+              f"{only_in_b} only in {args.file_b}", file=sys.stderr)
+        return 1 if rows or missing or only_in_b else 0
+
+    total, changed, conflicts, added = merge_files(args.base, args.copies, args.output,
+                                                   args.tol, args.prefer, args.workers)
+    for idx, raw_file in added:
+        print(f"ADDED {idx}\t{raw_file}\tonly in copies")
+    for idx, raw_file, lanes in conflicts:
+        lane_text = "whole record" if lanes == [-1] else ", ".join(str(j + 1) for j in lanes)
+        print(f"CONFLICT {idx}\t{raw_file}\tlanes: {lane_text}")
+    if args.conflicts:
+        with open(args.conflicts, "w") as f:
+            json.dump([{"index": idx, "raw_file": raw_file, "lanes": lanes}
+                       for idx, raw_file, lanes in conflicts], f, indent=4)
+    print(f"merged {total} records into {args.output}: {changed} changed, {len(added)} added, "
+          f"{len(conflicts)} with conflicts", file=sys.stderr)
+    return 1 if conflicts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
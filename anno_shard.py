@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+把 TuSimple 标注文件按工作量拆分给多名标注员，并把各自的副本按原顺序拼回。
+
+拆分：
+    第一遍流式读取，按 clip（raw_file 所在目录）累计估算工作量：每帧 1，每条已有车道线
+    --lane-weight，没有车道线的帧 --unlabeled-weight；然后按工作量从大到小把 clip 分给
+    当前最轻的分片（同一 clip 不会跨分片）。第二遍流式写出分片，并生成 manifest：
+    记录原文件中各条记录依次属于哪个分片（游程编码），以及每个分片的记录数和校验和。
+拼回：
+    按 manifest 的游程依次从各分片读取，恢复原顺序；逐分片核对 raw_file 序列的校验和，
+    全部一致才替换输出文件。分片可以用标注员保存的 _{project_id}_tmp.json 副本代替。
+两个过程都只逐行处理，内存只与 clip 数和分片数有关。
+
+命令行用法：
+    python anno_shard.py shard label.json -n 8 --out-dir shards/
+    python anno_shard.py reassemble shards/manifest.json -o merged.json --project-id tusimple_lane
+"""
+import os
+import sys
+import json
+import heapq
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from tusimple_io import extract_raw_file, split_line_ranges, iter_lines
+
+MANIFEST_NAME = "manifest.json"
+LANE_WEIGHT = 0.5
+UNLABELED_WEIGHT = 4.0
+IO_BUFFER = 1 << 20
+
+
+def _lines(path, start=0, end=None):
+    """逐行读取非空行（原始字节），大缓冲区减少系统调用"""
+    if start or end is not None:
+        # 指定字节范围时按行首偏移判断范围（与 split_line_ranges 对齐）
+        for _, line in iter_lines(path, start, end):
+            yield line
+        return
+    with open(path, "rb", buffering=IO_BUFFER) as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+
+def _raw_file_bytes(line):
+    """取出 raw_file 的原始字节；用 bytes.find 定位，比正则快，含转义时退回 JSON 解析"""
+    pos = line.rfind(b'"raw_file"')  # TuSimple 中 raw_file 通常在行尾
+    if pos >= 0:
+        start = line.find(b'"', line.find(b":", pos + 10)) + 1
+        end = line.find(b'"', start)
+        raw_file = line[start:end]
+        if start > 0 and end > 0 and b"\\" not in raw_file:
+            return raw_file
+    return extract_raw_file(line).encode("utf-8")
+
+
+def clip_of(raw_file):
+    """raw_file（字节）所属的 clip：所在目录"""
+    return raw_file[:raw_file.rfind(b"/") + 1]
+
+
+def count_lanes(line):
+    """不做完整 JSON 解析，统计一行记录中的车道线数"""
+    pos = line.find(b'"lanes"')
+    start = line.find(b"[", pos) + 1
+    if pos < 0 or start == 0:
+        return len(json.loads(line).get("lanes", []))
+    first = line[start:start + 16].lstrip()[:1]
+    if first == b"]":
+        return 0
+    end = line.find(b"]]", start)
+    if first != b"[" or end < 0:
+        return len(json.loads(line).get("lanes", []))
+    return line.count(b"[", start, end)
+
+
+def record_effort(lanes, lane_weight=LANE_WEIGHT, unlabeled_weight=UNLABELED_WEIGHT):
+    return 1.0 + (unlabeled_weight if lanes == 0 else lane_weight * lanes)
+
+
+class _Checksum:
+    """分片的校验：记录数、raw_file 序列摘要（副本修改车道线后不变）、文件内容 sha256"""
+
+    def __init__(self):
+        self.records = 0
+        self.raw_files = hashlib.blake2b(digest_size=16)
+        self.content = hashlib.sha256()
+
+    def update(self, raw_file, line):
+        self.records += 1
+        self.raw_files.update(raw_file + b"\n")
+        self.content.update(line)
+
+
+def _with_newline(line):
+    return line if line.endswith(b"\n") else line + b"\n"
+
+
+def assign_clips(efforts, shards):
+    """efforts: {clip: 工作量}。按工作量从大到小分给当前最轻的分片，返回 ({clip: 分片}, 各分片工作量)"""
+    heap = [(0.0, i) for i in range(shards)]
+    loads = [0.0] * shards
+    assignment = {}
+    for clip, effort in sorted(efforts.items(), key=lambda kv: (-kv[1], kv[0])):
+        load, i = heapq.heappop(heap)
+        assignment[clip] = i
+        loads[i] = load + effort
+        heapq.heappush(heap, (loads[i], i))
+    return assignment, loads
+
+
+def _clip_efforts(args):
+    """统计一段字节范围内各 clip 的工作量"""
+    path, start, end, lane_weight, unlabeled_weight = args
+    efforts = {}
+    for line in _lines(path, start, end):
+        clip = clip_of(_raw_file_bytes(line))
+        efforts[clip] = efforts.get(clip, 0.0) + record_effort(count_lanes(line), lane_weight, unlabeled_weight)
+    return efforts
+
+
+def shard_file(json_path, shards, out_dir, lane_weight=LANE_WEIGHT, unlabeled_weight=UNLABELED_WEIGHT,
+               workers=None):
+    """
+    把 json_path 拆成 shards 个分片写入 out_dir，返回 manifest（同时写入 out_dir/manifest.json）。
+    工作量统计按字节分段多进程并行；写出分片需要保持原顺序，单进程流式进行。
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        parts = [_clip_efforts((json_path, 0, None, lane_weight, unlabeled_weight))]
+    else:
+        tasks = [(json_path, start, end, lane_weight, unlabeled_weight)
+                 for start, end in split_line_ranges(json_path, workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_clip_efforts, tasks))
+    efforts = {}
+    for part in parts:
+        for clip, effort in part.items():
+            efforts[clip] = efforts.get(clip, 0.0) + effort
+    shards = max(1, min(shards, len(efforts)))
+    assignment, loads = assign_clips(efforts, shards)
+
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.splitext(os.path.basename(json_path))[0]
+    names = [f"{base}_shard{i:03d}.json" for i in range(shards)]
+    outs = [open(os.path.join(out_dir, name), "wb", buffering=IO_BUFFER) for name in names]
+    sums = [_Checksum() for _ in range(shards)]
+    runs = []  # [分片, 连续记录数, 分片, 连续记录数, ...]
+    last = -1
+    try:
+        for line in _lines(json_path):
+            raw_file = _raw_file_bytes(line)
+            i = assignment[clip_of(raw_file)]
+            line = _with_newline(line)
+            outs[i].write(line)
+            sums[i].update(raw_file, line)
+            if i == last:
+                runs[-1] += 1
+            else:
+                runs += [i, 1]
+                last = i
+    finally:
+        for out in outs:
+            out.close()
+
+    clips_per_shard = [0] * shards
+    for i in assignment.values():
+        clips_per_shard[i] += 1
+    manifest = {
+        "source": os.path.abspath(json_path),
+        "records": sum(s.records for s in sums),
+        "weights": {"lane": lane_weight, "unlabeled": unlabeled_weight},
+        "shards": [{"path": names[i], "records": sums[i].records, "clips": clips_per_shard[i],
+                    "effort": round(loads[i], 2), "raw_file_digest": sums[i].raw_files.hexdigest(),
+                    "sha256": sums[i].content.hexdigest()} for i in range(shards)],
+        "runs": runs,
+    }
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+class ShardMismatch(Exception):
+    """分片与 manifest 不一致（记录缺失、多出或顺序改变）"""
+
+
+def reassemble(manifest_path, out_path, project_id=None):
+    """
+    按 manifest 把分片拼回原顺序写入 out_path。project_id 不为 None 时，存在
+    <分片>_{project_id}_tmp.json 副本的分片用副本代替。
+    返回 [(分片路径, 是否有修改)]；校验失败抛出 ShardMismatch，不会留下不完整的输出文件。
+    """
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    paths = []
+    for shard in manifest["shards"]:
+        path = os.path.join(base_dir, shard["path"])
+        if project_id:
+            copy_path = f"{path}_{project_id}_tmp.json"
+            if os.path.exists(copy_path):
+                path = copy_path
+        paths.append(path)
+    readers = [_lines(p) for p in paths]
+    sums = [_Checksum() for _ in paths]
+    runs = manifest["runs"]
+    tmp_path = out_path + ".tmp"
+    try:
+        with open(tmp_path, "wb", buffering=IO_BUFFER) as out:
+            for k in range(0, len(runs), 2):
+                i, count = runs[k], runs[k + 1]
+                for _ in range(count):
+                    line = next(readers[i], None)
+                    if line is None:
+                        raise ShardMismatch(f"{paths[i]}: fewer records than the manifest")
+                    line = _with_newline(line)
+                    sums[i].update(_raw_file_bytes(line), line)
+                    out.write(line)
+        for i, shard in enumerate(manifest["shards"]):
+            if next(readers[i], None) is not None:
+                raise ShardMismatch(f"{paths[i]}: more records than the manifest")
+            if sums[i].raw_files.hexdigest() != shard["raw_file_digest"]:
+                raise ShardMismatch(f"{paths[i]}: records differ from the manifest (raw_file order or content)")
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, out_path)
+    return [(paths[i], sums[i].content.hexdigest() != shard["sha256"])
+            for i, shard in enumerate(manifest["shards"])]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split a TuSimple file into labeler shards and reassemble them")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_shard = sub.add_parser("shard", help="split by estimated effort, keeping each clip in one shard")
+    p_shard.add_argument("json_file")
+    p_shard.add_argument("-n", "--shards", type=int, required=True)
+    p_shard.add_argument("--out-dir", help="output directory (default: <json_file>_shards)")
+    p_shard.add_argument("--lane-weight", type=float, default=LANE_WEIGHT,
+                         help="effort per existing lane (a frame counts 1)")
+    p_shard.add_argument("--unlabeled-weight", type=float, default=UNLABELED_WEIGHT,
+                         help="extra effort for a frame without lanes")
+    p_shard.add_argument("--workers", type=int, default=None)
+
+    p_join = sub.add_parser("reassemble", help="stream shards back into the original order")
+    p_join.add_argument("manifest")
+    p_join.add_argument("-o", "--output", required=True)
+    p_join.add_argument("--project-id", help="use <shard>_<project-id>_tmp.json copies where present")
+
+    args = parser.parse_args(argv)
+    if args.command == "shard":
+        out_dir = args.out_dir or os.path.splitext(args.json_file)[0] + "_shards"
+        manifest = shard_file(args.json_file, args.shards, out_dir, args.lane_weight, args.unlabeled_weight,
+                              args.workers)
+        for shard in manifest["shards"]:
+            print(f"{shard['path']}\t{shard['records']} records\t{shard['clips']} clips\teffort {shard['effort']}")
+        print(f"{manifest['records']} records -> {len(manifest['shards'])} shards in {out_dir}", file=sys.stderr)
+        return 0
+
+    try:
+        results = reassemble(args.manifest, args.output, args.project_id)
+    except ShardMismatch as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    for path, modified in results:
+        print(f"{'modified' if modified else 'unchanged'}\t{path}")
+    print(f"reassembled {len(results)} shards into {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite(WAL) 标注存储。
+
+每条 TuSimple 记录保存为一行，并对 raw_file、车道线数、编辑状态和修改时间建立索引，
+可以直接替代 LaneLabelTool.annotation_data 列表使用（支持 len / 下标读写 / 迭代），
+下标写入即为一次独立事务。每次写入使记录的版本号加 1（协作服务端用它拒绝过期的保存）。
+
+命令行用法：
+    python annotation_store.py import label.json [label.json.db]
+    python annotation_store.py export label.json.db out.json
+    python annotation_store.py query label.json.db --max-lanes 1 --status unedited
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import argparse
+
+# 记录编辑状态
+STATUS_UNEDITED = 0
+STATUS_EDITED = 1
+STATUS_NAMES = {"unedited": STATUS_UNEDITED, "edited": STATUS_EDITED}
+
+STORE_SUFFIX = ".db"
+IMPORT_BATCH_SIZE = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    idx INTEGER PRIMARY KEY,
+    raw_file TEXT NOT NULL,
+    lane_count INTEGER NOT NULL,
+    point_count INTEGER NOT NULL,
+    status INTEGER NOT NULL DEFAULT 0,
+    mtime REAL NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_records_raw_file ON records(raw_file);
+CREATE INDEX IF NOT EXISTS idx_records_lane_count ON records(lane_count, idx);
+CREATE INDEX IF NOT EXISTS idx_records_status ON records(status, idx);
+CREATE INDEX IF NOT EXISTS idx_records_mtime ON records(mtime);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def lane_stats(ann):
+    """返回 (车道线数, 有效像素点数)，x < 0 的点不计入"""
+    lanes = ann.get("lanes", [])
+    point_count = 0
+    for lane in lanes:
+        for x in lane:
+            if x >= 0:
+                point_count += 1
+    return len(lanes), point_count
+
+
+def store_path_for(json_path):
+    """标注文件对应的 SQLite 旁路文件路径"""
+    return json_path + STORE_SUFFIX
+
+
+def is_store_path(path):
+    return bool(path) and path.endswith(STORE_SUFFIX)
+
+
+class AnnotationStore:
+    """以 SQLite 为后端的标注记录序列，下标即原 JSON 文件中的行号"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(records)")}
+        if "version" not in columns:
+            # 旧版本创建的存储没有 version 列
+            with self.conn:
+                self.conn.execute("ALTER TABLE records ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._count = self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    # ---- 序列接口，兼容原 annotation_data 列表 ----
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def _check_index(self, idx):
+        if idx < 0:
+            idx += self._count
+        if not 0 <= idx < self._count:
+            raise IndexError(f"record index out of range: {idx}")
+        return idx
+
+    def __getitem__(self, idx):
+        idx = self._check_index(idx)
+        row = self.conn.execute("SELECT data FROM records WHERE idx = ?", (idx,)).fetchone()
+        return json.loads(row[0])
+
+    def __setitem__(self, idx, ann):
+        """单条记录写入，独立事务；版本号加 1，内容有变化时标记为已编辑并更新修改时间"""
+        idx = self._check_index(idx)
+        data = json.dumps(ann)
+        lane_count, point_count = lane_stats(ann)
+        with self.conn:
+            self.conn.execute(
+                "UPDATE records SET raw_file = ?, lane_count = ?, point_count = ?, "
+                "status = CASE WHEN data != ? THEN ? ELSE status END, "
+                "mtime = CASE WHEN data != ? THEN ? ELSE mtime END, "
+                "data = ?, version = version + 1 WHERE idx = ?",
+                (ann.get("raw_file", ""), lane_count, point_count,
+                 data, STATUS_EDITED, data, time.time(), data, idx))
+
+    def __iter__(self):
+        cursor = self.conn.execute("SELECT data FROM records ORDER BY idx")
+        for (data,) in cursor:
+            yield json.loads(data)
+
+    # ---- 查询 ----
+    def get_status(self, idx):
+        idx = self._check_index(idx)
+        return self.conn.execute("SELECT status FROM records WHERE idx = ?", (idx,)).fetchone()[0]
+
+    def get_version(self, idx):
+        idx = self._check_index(idx)
+        return self.conn.execute("SELECT version FROM records WHERE idx = ?", (idx,)).fetchone()[0]
+
+    def set_status(self, idx, status):
+        idx = self._check_index(idx)
+        with self.conn:
+            self.conn.execute("UPDATE records SET status = ? WHERE idx = ?", (status, idx))
+
+    def stat_rows(self):
+        """按下标顺序返回每条记录的 (车道线数, 点数, 编辑状态, raw_file)，不解析记录内容"""
+        return self.conn.execute(
+            "SELECT lane_count, point_count, status, raw_file FROM records ORDER BY idx").fetchall()
+
+    def find_raw_file(self, raw_file):
+        """按 raw_file 查找记录下标，找不到返回 None"""
+        row = self.conn.execute(
+            "SELECT idx FROM records WHERE raw_file = ? ORDER BY idx LIMIT 1", (raw_file,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _build_where(min_lanes=None, max_lanes=None, status=None, modified_since=None,
+                     raw_file_prefix=None):
+        clauses, params = [], []
+        if min_lanes is not None:
+            clauses.append("lane_count >= ?")
+            params.append(min_lanes)
+        if max_lanes is not None:
+            clauses.append("lane_count <= ?")
+            params.append(max_lanes)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if modified_since is not None:
+            clauses.append("mtime >= ?")
+            params.append(modified_since)
+        if raw_file_prefix is not None:
+            # 前缀匹配用区间比较，可以走 raw_file 索引
+            clauses.append("raw_file >= ? AND raw_file < ?")
+            params.extend([raw_file_prefix, raw_file_prefix + "\uffff"])
+        return clauses, params
+
+    def query(self, limit=None, **filters):
+        """按条件返回匹配的记录下标列表（升序）"""
+        clauses, params = self._build_where(**filters)
+        sql = "SELECT idx FROM records"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY idx"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [row[0] for row in self.conn.execute(sql, params)]
+
+    def count(self, **filters):
+        clauses, params = self._build_where(**filters)
+        sql = "SELECT COUNT(*) FROM records"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return self.conn.execute(sql, params).fetchone()[0]
+
+    def next_index(self, current, step=1, **filters):
+        """从 current 开始向前(step=1)或向后(step=-1)查找下一条匹配记录，找不到返回 None"""
+        clauses, params = self._build_where(**filters)
+        if step > 0:
+            clauses.insert(0, "idx > ?")
+            order = "ASC"
+        else:
+            clauses.insert(0, "idx < ?")
+            order = "DESC"
+        params.insert(0, current)
+        sql = f"SELECT idx FROM records WHERE {' AND '.join(clauses)} ORDER BY idx {order} LIMIT 1"
+        row = self.conn.execute(sql, params).fetchone()
+        return row[0] if row else None
+
+    # ---- 导入导出 ----
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, str(value)))
+
+    def import_jsonl(self, json_path):
+        """
+        从 TuSimple JSON-lines 文件导入，覆盖已有记录；流式读取，分批写入。
+        重新导入时所有记录的版本号取原最大版本号加 1，导入前读取的记录保存时会被视为过期。
+        """
+        logging.info(f"导入标注文件到 SQLite: {json_path} -> {self.db_path}")
+        count = 0
+        with self.conn:
+            version = self.conn.execute("SELECT MAX(version) + 1 FROM records").fetchone()[0] or 0
+            self.conn.execute("DELETE FROM records")
+            batch = []
+            with open(json_path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    ann = json.loads(line)
+                    lane_count, point_count = lane_stats(ann)
+                    # 按 __setitem__ 的格式重新序列化，否则格式不同（如紧凑分隔符）的源文件保存未改动的记录也会被标记为已编辑
+                    batch.append((count, ann.get("raw_file", ""), lane_count, point_count, json.dumps(ann),
+                                  version))
+                    count += 1
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        self.conn.executemany(
+                            "INSERT INTO records(idx, raw_file, lane_count, point_count, data, version) "
+                            "VALUES (?, ?, ?, ?, ?, ?)", batch)
+                        batch = []
+            if batch:
+                self.conn.executemany(
+                    "INSERT INTO records(idx, raw_file, lane_count, point_count, data, version) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", batch)
+            self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+                              ("source_path", os.path.abspath(json_path)))
+            self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+                              ("source_mtime", str(os.path.getmtime(json_path))))
+        self._count = count
+        return count
+
+    def export_jsonl(self, out_path):
+        """按原顺序导出为 TuSimple JSON-lines 文件（先写临时文件再替换）"""
+        tmp_path = out_path + ".tmp"
+        count = 0
+        with open(tmp_path, "w") as f:
+            for (data,) in self.conn.execute("SELECT data FROM records ORDER BY idx"):
+                f.write(data)
+                f.write("\n")
+                count += 1
+        os.replace(tmp_path, out_path)
+        return count
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class StaleStoreError(Exception):
+    """源文件在导入后被修改，而存储中有只保存在存储里的已编辑记录，重新导入会丢失它们"""
+
+    def __init__(self, json_path, edited):
+        super().__init__(f"{json_path} changed after import, and {edited} records edited in the store "
+                         f"would be lost by re-importing")
+        self.json_path = json_path
+        self.edited = edited
+
+
+def open_store_for(json_path, reimport=None):
+    """
+    打开标注文件对应的 SQLite 旁路存储。不存在时导入；源文件比上次导入时更新时：
+    reimport 为 None 则在没有已编辑记录时重新导入、有则抛出 StaleStoreError，
+    True 总是重新导入（丢弃存储中的修改），False 保留存储不重新导入。
+    """
+    db_path = store_path_for(json_path)
+    store = AnnotationStore(db_path)
+    source_mtime = store.get_meta("source_mtime")
+    if len(store) == 0 or source_mtime is None:
+        store.import_jsonl(json_path)
+    elif float(source_mtime) < os.path.getmtime(json_path) and reimport is not False:
+        edited = store.count(status=STATUS_EDITED)
+        if edited and reimport is None:
+            store.close()
+            raise StaleStoreError(json_path, edited)
+        store.import_jsonl(json_path)
+    return store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SQLite-backed TuSimple annotation store")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="import a TuSimple JSON-lines file")
+    p_import.add_argument("json_file")
+    p_import.add_argument("db_file", nargs="?")
+
+    p_export = sub.add_parser("export", help="export the store to a TuSimple JSON-lines file")
+    p_export.add_argument("db_file")
+    p_export.add_argument("json_file")
+
+    p_query = sub.add_parser("query", help="list record indices matching the filters")
+    p_query.add_argument("db_file")
+    p_query.add_argument("--min-lanes", type=int)
+    p_query.add_argument("--max-lanes", type=int)
+    p_query.add_argument("--status", choices=sorted(STATUS_NAMES))
+    p_query.add_argument("--modified-since", type=float, help="unix timestamp")
+    p_query.add_argument("--raw-file-prefix")
+    p_query.add_argument("--limit", type=int)
+
+    args = parser.parse_args(argv)
+    if args.command == "import":
+        store = AnnotationStore(args.db_file or store_path_for(args.json_file))
+        start = time.perf_counter()
+        count = store.import_jsonl(args.json_file)
+        print(f"imported {count} records into {store.db_path} in {time.perf_counter() - start:.2f}s")
+    elif args.command == "export":
+        store = AnnotationStore(args.db_file)
+        count = store.export_jsonl(args.json_file)
+        print(f"exported {count} records to {args.json_file}")
+    else:
+        store = AnnotationStore(args.db_file)
+        status = STATUS_NAMES[args.status] if args.status else None
+        indices = store.query(limit=args.limit, min_lanes=args.min_lanes, max_lanes=args.max_lanes,
+                              status=status, modified_since=args.modified_since,
+                              raw_file_prefix=args.raw_file_prefix)
+        for idx in indices:
+            print(idx)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地多人协作：一个服务进程持有 SQLite 标注存储（AnnotationStore），多个编辑器作为客户端连接
+（multiprocessing.connection，带 authkey；消息为 UTF-8 JSON），按记录租用、按记录保存。
+
+    - 租约（lease）：编辑某条记录前先租用，同一时刻只有一个客户端持有；超过 lease_seconds
+      未续租或客户端断开时自动释放。
+    - 保存：只写一条记录（SQLite 单条事务），不重写整个文件；带上编辑器载入记录时的版本号，
+      版本不一致（期间被别人改过）时拒绝。版本号保存在存储中，服务端重启后仍然有效。
+    - 通知：记录被保存、租用或释放后，服务端主动推送给其他客户端，客户端据此丢弃缓存。
+请求消息带 "id"，应答原样带回；推送消息没有 "id"。
+
+客户端 RemoteAnnotationStore 实现与 AnnotationStore 相同的序列接口（len / 下标读写 / 迭代），
+编辑器用地址 collab://用户名@host:port 打开即可。
+默认 authkey 是公开的，监听非本机地址时必须通过环境变量 LANE_COLLAB_AUTHKEY 设置。
+
+命令行用法：
+    python collab_server.py serve label.json --port 6200
+    python collab_server.py bench label.json --clients 32 --saves 50
+"""
+import os
+import sys
+import json
+import time
+import socket
+import getpass
+import logging
+import argparse
+import ipaddress
+import threading
+from collections import OrderedDict
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, deliver_challenge, answer_challenge
+
+from annotation_store import AnnotationStore, StaleStoreError, open_store_for, is_store_path
+
+COLLAB_SCHEME = "collab://"
+DEFAULT_PORT = 6200
+AUTHKEY_ENV = "LANE_COLLAB_AUTHKEY"
+DEFAULT_AUTHKEY = b"lane-collab"  # 只监听本机时使用；跨机器请通过环境变量设置
+LEASE_SECONDS = 600
+RANGE_LIMIT = 1000  # 一次批量读取的最大记录数
+REQUEST_TIMEOUT = 10
+MAX_MESSAGE_BYTES = 64 << 20  # 服务端拒绝更大的消息
+
+
+def authkey_from_env():
+    value = os.environ.get(AUTHKEY_ENV)
+    return value.encode("utf-8") if value else DEFAULT_AUTHKEY
+
+
+def is_loopback(host):
+    """host 是否只在本机可达；无法解析的主机名按非本机处理"""
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def is_collab_url(path):
+    return bool(path) and path.startswith(COLLAB_SCHEME)
+
+
+def parse_collab_url(url):
+    """collab://[用户名@]host:port -> (用户名 或 None, (host, port))"""
+    rest = url[len(COLLAB_SCHEME):].rstrip("/")
+    user, _, hostport = rest.rpartition("@")
+    host, _, port = hostport.rpartition(":")
+    return user or None, (host or "127.0.0.1", int(port or DEFAULT_PORT))
+
+
+def _set_nodelay(conn):
+    """
+    关闭 Nagle：服务端会在应答之间插入推送消息，不关闭时小包会等待对方的延迟 ACK（约 40ms）
+    """
+    sock = socket.socket(fileno=os.dup(conn.fileno()))
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    finally:
+        sock.close()
+
+
+def _send(conn, msg):
+    conn.send_bytes(json.dumps(msg, separators=(",", ":")).encode("utf-8"))
+
+
+def _recv(conn, maxlength=None):
+    msg = json.loads(conn.recv_bytes(maxlength))
+    if not isinstance(msg, dict):
+        raise ValueError(f"unexpected message: {type(msg).__name__}")
+    return msg
+
+
+class LeaseError(Exception):
+    """保存被拒绝：记录被别人租用，或版本已过期"""
+
+
+# ---- 服务端 ----
+class _Session:
+    def __init__(self, sid, conn):
+        self.sid = sid
+        self.conn = conn
+        self.user = f"client{sid}"
+        self.send_lock = threading.Lock()
+
+    def send(self, msg):
+        with self.send_lock:
+            _send(self.conn, msg)
+
+
+class CollabServer:
+    """持有标注存储的服务端，每个客户端连接一个线程；存储和租约由同一把锁保护"""
+
+    def __init__(self, store, address=("127.0.0.1", DEFAULT_PORT), authkey=DEFAULT_AUTHKEY,
+                 lease_seconds=LEASE_SECONDS):
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.authkey = authkey
+        # 认证放到各连接线程中做，accept 不会被握手慢的客户端阻塞；backlog 容纳同时连接的客户端
+        self.listener = Listener(address, backlog=64)
+        self.address = self.listener.address
+        self.lock = threading.Lock()
+        self.leases = {}  # 记录下标 -> [会话号, 用户名, 到期时间]
+        self.sessions = {}
+        self._next_sid = 0
+        self._closed = False
+
+    def serve_forever(self):
+        while not self._closed:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                if self._closed:
+                    return
+                logging.exception("接受协作连接失败")
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def close(self):
+        self._closed = True
+        self.listener.close()
+
+    def _handle(self, conn):
+        try:
+            deliver_challenge(conn, self.authkey)
+            answer_challenge(conn, self.authkey)
+            _set_nodelay(conn)
+        except (AuthenticationError, EOFError, OSError):
+            logging.warning("协作客户端认证失败，已断开")
+            conn.close()
+            return
+        with self.lock:
+            self._next_sid += 1
+            session = _Session(self._next_sid, conn)
+            self.sessions[session.sid] = session
+        try:
+            while True:
+                msg = _recv(session.conn, MAX_MESSAGE_BYTES)
+                if msg.get("op") == "bye":
+                    break
+                try:
+                    reply, pushes = self._dispatch(session, msg)
+                except Exception as e:
+                    logging.exception(f"处理协作请求失败: {msg.get('op')}")
+                    reply, pushes = {"ok": False, "error": str(e)}, []
+                reply["id"] = msg.get("id")
+                session.send(reply)
+                self._broadcast(pushes, exclude=session.sid)
+        except (EOFError, OSError, ValueError):
+            pass  # 断开或收到无法解析的消息
+        finally:
+            with self.lock:
+                self.sessions.pop(session.sid, None)
+                released = [idx for idx, lease in self.leases.items() if lease[0] == session.sid]
+                for idx in released:
+                    del self.leases[idx]
+            self._broadcast([{"op": "released", "idx": idx, "user": session.user} for idx in released])
+            session.conn.close()
+
+    def _broadcast(self, pushes, exclude=None):
+        if not pushes:
+            return
+        with self.lock:
+            targets = [s for sid, s in self.sessions.items() if sid != exclude]
+        for session in targets:
+            for msg in pushes:
+                try:
+                    session.send(msg)
+                except OSError:
+                    break  # 连接已断开，由其处理线程清理
+
+    def _holder(self, idx, now):
+        lease = self.leases.get(idx)
+        if lease is not None and lease[2] < now:
+            del self.leases[idx]
+            return None
+        return lease
+
+    def _dispatch(self, session, msg):
+        """返回 (应答, 推送给其他客户端的消息列表)"""
+        op = msg.get("op")
+        now = time.time()
+        with self.lock:
+            if op == "hello":
+                session.user = msg.get("user") or session.user
+                return {"ok": True, "count": len(self.store), "lease_seconds": self.lease_seconds}, []
+            if op == "get":
+                idx = msg["idx"]
+                holder = self._holder(idx, now)
+                return {"ok": True, "record": self.store[idx], "version": self.store.get_version(idx),
+                        "holder": holder[1] if holder else None}, []
+            if op == "range":
+                start = msg["start"]
+                stop = min(msg["stop"], start + RANGE_LIMIT, len(self.store))
+                rows = self.store.conn.execute(
+                    "SELECT data FROM records WHERE idx >= ? AND idx < ? ORDER BY idx", (start, stop)).fetchall()
+                return {"ok": True, "records": [r[0] for r in rows]}, []
+            if op == "stats":
+                rows = self.store.stat_rows()
+                return {"ok": True, "rows": [list(row) for row in rows]}, []
+            if op == "lease":
+                idx = msg["idx"]
+                holder = self._holder(idx, now)
+                if holder is not None and holder[0] != session.sid:
+                    return {"ok": False, "holder": holder[1], "version": self.store.get_version(idx)}, []
+                self.leases[idx] = [session.sid, session.user, now + self.lease_seconds]
+                pushes = [] if holder else [{"op": "leased", "idx": idx, "user": session.user}]
+                return {"ok": True, "holder": session.user, "version": self.store.get_version(idx)}, pushes
+            if op == "release":
+                idx = msg["idx"]
+                holder = self._holder(idx, now)
+                if holder is None or holder[0] != session.sid:
+                    return {"ok": False}, []
+                del self.leases[idx]
+                return {"ok": True}, [{"op": "released", "idx": idx, "user": session.user}]
+            if op == "save":
+                idx = msg["idx"]
+                holder = self._holder(idx, now)
+                if holder is None or holder[0] != session.sid:
+                    return {"ok": False, "error": "lease", "holder": holder[1] if holder else None}, []
+                version = self.store.get_version(idx)
+                if msg.get("version") is not None and msg["version"] != version:
+                    return {"ok": False, "error": "conflict", "version": version}, []
+                self.store[idx] = msg["record"]  # 存储中的版本号随之加 1
+                holder[2] = now + self.lease_seconds  # 保存即续租
+                return {"ok": True, "version": version + 1}, [
+                    {"op": "changed", "idx": idx, "version": version + 1, "user": session.user}]
+        return {"ok": False, "error": f"unknown op: {op}"}, []
+
+
+def open_server_store(path, reimport=None):
+    """服务端存储：.db 直接打开，JSON 文件导入到旁路 SQLite 存储（reimport 见 open_store_for）"""
+    return AnnotationStore(path) if is_store_path(path) else open_store_for(path, reimport)
+
+
+# ---- 客户端 ----
+class CollabClient:
+    """与服务端的一条连接；请求同步等待应答，推送消息交给 on_push(msg)（在读取线程中调用）"""
+
+    def __init__(self, address, user=None, authkey=None, on_push=None):
+        self.conn = Client(address, authkey=authkey or authkey_from_env())
+        _set_nodelay(self.conn)
+        self.on_push = on_push
+        self._next_id = 0
+        self._pending = {}  # 请求号 -> [Event, 应答]
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+        self.info = self.request("hello", user=user or getpass.getuser())
+
+    def _read_loop(self):
+        while True:
+            try:
+                msg = _recv(self.conn)
+            except (EOFError, OSError, ValueError):
+                break
+            if msg.get("id") is None:
+                if self.on_push is not None:
+                    self.on_push(msg)
+                continue
+            with self._lock:
+                waiter = self._pending.pop(msg["id"], None)
+            if waiter is not None:
+                waiter[1] = msg
+                waiter[0].set()
+        with self._lock:
+            waiters, self._pending = list(self._pending.values()), {}
+        for waiter in waiters:
+            waiter[0].set()  # 连接断开，唤醒等待中的请求
+
+    def request(self, op, timeout=REQUEST_TIMEOUT, **fields):
+        waiter = [threading.Event(), None]
+        with self._lock:
+            self._next_id += 1
+            req_id = self._next_id
+            self._pending[req_id] = waiter
+            _send(self.conn, dict(fields, op=op, id=req_id))
+        if not waiter[0].wait(timeout) or waiter[1] is None:
+            with self._lock:
+                self._pending.pop(req_id, None)
+            raise ConnectionError(f"collaboration server did not answer '{op}'")
+        return waiter[1]
+
+    def close(self):
+        """请服务端关闭连接，读取线程收到 EOF 后退出，再关闭本端"""
+        try:
+            with self._lock:
+                _send(self.conn, {"op": "bye"})
+        except OSError:
+            pass
+        self._reader.join(REQUEST_TIMEOUT)
+        self.conn.close()
+
+
+class RemoteAnnotationStore:
+    """
+    服务端标注存储的客户端视图，可替代 annotation_data 列表使用。
+    读取的记录按 LRU 缓存，收到其他客户端的修改通知时丢弃对应缓存；写入前自动租用该记录。
+    编辑器用 load(idx) 载入记录，保存时带上载入时的版本号，期间被别人改过则保存被拒绝；
+    没有 load 过的记录保存时不检查版本。
+    """
+
+    def __init__(self, url, on_change=None, cache_size=256):
+        user, address = parse_collab_url(url)
+        self.url = url
+        self.db_path = url  # 与 AnnotationStore 一致，保存时作为"工作副本"路径
+        self.on_change = on_change  # on_change(msg)：其他客户端的 changed/leased/released 通知
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # 下标 -> (记录, 版本)
+        self._cache_lock = threading.Lock()
+        self.loaded_versions = {}  # 下标 -> load 时（或本客户端上次保存后）的版本号
+        self.focused = None  # 当前租用的记录下标
+        self.client = CollabClient(address, user, on_push=self._on_push)
+        self._count = self.client.info["count"]
+
+    def _on_push(self, msg):
+        if msg.get("op") == "changed":
+            with self._cache_lock:
+                self._cache.pop(msg["idx"], None)
+        if self.on_change is not None:
+            self.on_change(msg)
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def _fetch(self, idx):
+        with self._cache_lock:
+            cached = self._cache.get(idx)
+            if cached is not None:
+                self._cache.move_to_end(idx)
+                return cached
+        reply = self.client.request("get", idx=idx)
+        if not reply["ok"]:
+            raise IndexError(reply.get("error", idx))
+        cached = (reply["record"], reply["version"])
+        with self._cache_lock:
+            self._cache[idx] = cached
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return cached
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self._count
+        # 返回副本：调用方会就地修改记录后再写回
+        record = self._fetch(idx)[0]
+        return dict(record, lanes=[list(lane) for lane in record.get("lanes", [])])
+
+    def load(self, idx):
+        """读取记录并记下其版本号，之后保存该记录时以此检查是否被别人改过"""
+        if idx < 0:
+            idx += self._count
+        version = self._fetch(idx)[1]
+        self.loaded_versions[idx] = version
+        return self[idx]
+
+    def __setitem__(self, idx, ann):
+        if idx < 0:
+            idx += self._count
+        if self.focused != idx:
+            self.focus(idx)
+        reply = self.client.request("save", idx=idx, record=ann, version=self.loaded_versions.get(idx))
+        if not reply["ok"]:
+            with self._cache_lock:
+                self._cache.pop(idx, None)
+            raise LeaseError(reply.get("holder") or reply.get("error"))
+        self.loaded_versions[idx] = reply["version"]
+        with self._cache_lock:
+            self._cache[idx] = (ann, reply["version"])
+
+    def __iter__(self):
+        for start in range(0, self._count, RANGE_LIMIT):
+            reply = self.client.request("range", start=start, stop=start + RANGE_LIMIT)
+            for data in reply["records"]:
+                yield json.loads(data)
+
+    def stat_rows(self):
+        """(车道线数, 点数, 状态, raw_file) 列表，用于构建特征索引"""
+        return self.client.request("stats", timeout=60)["rows"]
+
+    def focus(self, idx):
+        """切换到 idx：释放之前租用的记录并租用 idx，返回 (是否租到, 持有者)"""
+        if self.focused is not None and self.focused != idx:
+            self.client.request("release", idx=self.focused)
+        self.focused = None
+        reply = self.client.request("lease", idx=idx)
+        if reply["ok"]:
+            self.focused = idx
+        with self._cache_lock:
+            cached = self._cache.get(idx)
+            if cached is not None and cached[1] != reply["version"]:
+                self._cache.pop(idx, None)
+        return reply["ok"], reply["holder"]
+
+    def close(self):
+        self.client.close()
+
+
+def benchmark(path, clients, saves):
+    """启动服务进程，clients 个客户端线程各自租用不同记录并反复保存，返回保存往返耗时列表（毫秒）"""
+    import subprocess
+    port = DEFAULT_PORT + 1
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", path, "--port", str(port)])
+    url = f"{COLLAB_SCHEME}bench@127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                probe = RemoteAnnotationStore(url)
+                break
+            except (ConnectionRefusedError, FileNotFoundError):
+                time.sleep(0.1)
+        else:
+            raise RuntimeError("collaboration server did not start")
+        count = len(probe)
+        probe.close()
+        if clients > count:
+            raise ValueError(f"need at least {clients} records, one per client")
+        latencies = []
+        lock = threading.Lock()
+
+        def run(k):
+            store = RemoteAnnotationStore(url)
+            idx = k % count
+            store.focus(idx)
+            ann = store.load(idx)
+            local = []
+            for _ in range(saves):
+                start = time.perf_counter()
+                store[idx] = ann
+                local.append((time.perf_counter() - start) * 1000)
+            store.close()
+            with lock:
+                latencies.extend(local)
+
+        threads = [threading.Thread(target=run, args=(k,)) for k in range(clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return latencies
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local multi-user annotation server with record leases")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_serve = sub.add_parser("serve", help="serve a .json (imported to SQLite) or .db annotation store")
+    p_serve.add_argument("path")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p_serve.add_argument("--lease-seconds", type=int, default=LEASE_SECONDS)
+    group = p_serve.add_mutually_exclusive_group()
+    group.add_argument("--reimport", dest="reimport", action="store_const", const=True,
+                       help="re-import a changed .json, discarding edits made in the store")
+    group.add_argument("--keep-store", dest="reimport", action="store_const", const=False,
+                       help="serve the existing store even if the .json changed")
+
+    p_bench = sub.add_parser("bench", help="measure save round-trips with many concurrent clients")
+    p_bench.add_argument("path")
+    p_bench.add_argument("--clients", type=int, default=32)
+    p_bench.add_argument("--saves", type=int, default=50)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        logging.basicConfig(level=logging.INFO)
+        if not is_loopback(args.host) and not os.environ.get(AUTHKEY_ENV):
+            parser.error(f"set {AUTHKEY_ENV} before listening on non-loopback host {args.host}")
+        try:
+            store = open_server_store(args.path, args.reimport)
+        except StaleStoreError as e:
+            print(f"{e}; pass --reimport or --keep-store", file=sys.stderr)
+            return 1
+        server = CollabServer(store, (args.host, args.port), authkey_from_env(), args.lease_seconds)
+        host, port = server.address
+        print(f"serving {len(store)} records at {COLLAB_SCHEME}{host}:{port}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            store.close()
+        return 0
+
+    latencies = sorted(benchmark(args.path, args.clients, args.saves))
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{args.clients} clients x {args.saves} saves: p50 {p50:.1f} ms, p95 {p95:.1f} ms, "
+          f"max {latencies[-1]:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按记录预计算的列式特征索引，以及导航过滤用的简单查询语法。
+
+查询由若干条件组成，空格或 & 分隔，全部满足才算匹配，例如：
+    lanes<2 unedited
+    lane_points<10 & raw_file~0531
+支持的字段：lanes（车道线数）、lane_points（有效像素点总数）、index（记录下标），
+比较符 < <= > >= = == !=；raw_file~子串 / raw_file!~子串；标志 edited / unedited。
+"""
+import re
+import numpy as np
+
+from annotation_store import STATUS_EDITED, lane_stats
+
+NUMERIC_FIELDS = ("lanes", "lane_points", "index")
+FLAG_TERMS = ("edited", "unedited")
+
+_TERM_RE = re.compile(r"^(\w+)\s*(<=|>=|==|!=|!~|<|>|=|~)\s*(.+)$")
+
+
+class QueryError(ValueError):
+    """过滤表达式无法解析"""
+
+
+class FeatureIndex:
+    """每条记录一行的特征列：车道线数、有效点数、是否已编辑、raw_file"""
+
+    def __init__(self, lanes, lane_points, edited, raw_files):
+        self.lanes = lanes
+        self.lane_points = lane_points
+        self.edited = edited
+        self.raw_files = raw_files
+        self._raw_text = None
+        self._raw_starts = None
+
+    @classmethod
+    def build(cls, annotation_data):
+        """从 annotation_data（列表、AnnotationStore 或远程存储）构建特征索引"""
+        if hasattr(annotation_data, "stat_rows"):
+            return cls.from_store(annotation_data)
+        n = len(annotation_data)
+        lanes = np.zeros(n, dtype=np.int32)
+        lane_points = np.zeros(n, dtype=np.int32)
+        raw_files = []
+        for i, ann in enumerate(annotation_data):
+            lanes[i], lane_points[i] = lane_stats(ann)
+            raw_files.append(ann.get("raw_file", ""))
+        return cls(lanes, lane_points, np.zeros(n, dtype=bool), raw_files)
+
+    @classmethod
+    def from_store(cls, store):
+        """直接读取存储中已有的统计列，不解析记录内容"""
+        rows = store.stat_rows()
+        n = len(rows)
+        lanes = np.fromiter((r[0] for r in rows), dtype=np.int32, count=n)
+        lane_points = np.fromiter((r[1] for r in rows), dtype=np.int32, count=n)
+        edited = np.fromiter((r[2] == STATUS_EDITED for r in rows), dtype=bool, count=n)
+        return cls(lanes, lane_points, edited, [r[3] for r in rows])
+
+    def __len__(self):
+        return len(self.raw_files)
+
+    def update(self, idx, ann, edited=True):
+        """保存单条记录后增量更新对应行"""
+        self.lanes[idx], self.lane_points[idx] = lane_stats(ann)
+        self.edited[idx] = self.edited[idx] or edited
+        raw_file = ann.get("raw_file", "")
+        if raw_file != self.raw_files[idx]:
+            self.raw_files[idx] = raw_file
+            self._raw_text = None
+
+    def _raw_file_contains(self, needle):
+        """所有 raw_file 拼成一个文本做子串搜索，再用偏移量映射回记录下标"""
+        if self._raw_text is None:
+            self._raw_text = "\n".join(self.raw_files)
+            lengths = np.fromiter((len(r) + 1 for r in self.raw_files), dtype=np.int64,
+                                  count=len(self.raw_files))
+            self._raw_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        mask = np.zeros(len(self), dtype=bool)
+        if not needle:
+            mask[:] = True
+            return mask
+        positions = [m.start() for m in re.finditer(re.escape(needle), self._raw_text)]
+        if positions:
+            mask[np.searchsorted(self._raw_starts, positions, side="right") - 1] = True
+        return mask
+
+    def _column(self, field):
+        if field == "index":
+            return np.arange(len(self))
+        return getattr(self, field)
+
+    def _term_mask(self, term):
+        if term in FLAG_TERMS:
+            return self.edited.copy() if term == "edited" else ~self.edited
+        m = _TERM_RE.match(term)
+        if not m:
+            raise QueryError(f"cannot parse filter term: {term}")
+        field, op, value = m.groups()
+        if field == "raw_file":
+            if op == "~":
+                return self._raw_file_contains(value)
+            if op == "!~":
+                return ~self._raw_file_contains(value)
+            if op in ("=", "=="):
+                return np.array([r == value for r in self.raw_files], dtype=bool)
+            raise QueryError(f"unsupported operator for raw_file: {op}")
+        if field not in NUMERIC_FIELDS or op in ("~", "!~"):
+            raise QueryError(f"unsupported filter term: {term}")
+        try:
+            number = int(value)
+        except ValueError:
+            raise QueryError(f"expected an integer in: {term}")
+        col = self._column(field)
+        if op == "<":
+            return col < number
+        if op == "<=":
+            return col <= number
+        if op == ">":
+            return col > number
+        if op == ">=":
+            return col >= number
+        if op == "!=":
+            return col != number
+        return col == number
+
+    def query(self, expression):
+        """返回满足表达式的记录下标数组（升序）"""
+        terms = [t for t in re.split(r"[\s&]+", re.sub(r"\s*(<=|>=|==|!=|!~|<|>|=|~)\s*", r"\1",
+                                                          expression.strip())) if t]
+        mask = np.ones(len(self), dtype=bool)
+        for term in terms:
+            mask &= self._term_mask(term)
+        return np.flatnonzero(mask)
+
+
+def next_match(indices, current, step=1):
+    """在升序的匹配下标数组中找 current 之后(step=1)或之前(step=-1)的一个，找不到返回 None"""
+    if indices is None or len(indices) == 0:
+        return None
+    if step > 0:
+        pos = np.searchsorted(indices, current, side="right")
+        return int(indices[pos]) if pos < len(indices) else None
+    pos = np.searchsorted(indices, current, side="left") - 1
+    return int(indices[pos]) if pos >= 0 else None
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图像根目录索引：并行扫描一次数据集目录树，之后按 raw_file 查找图像路径不再访问文件系统。
+
+目录列表按目录 mtime 缓存在磁盘，再次扫描时 mtime 未变的目录直接复用缓存（只 stat 目录本身，
+不列目录）；增删文件会改变所在目录的 mtime，因此会被重新列出。
+raw_file 依次在多个根目录中查找，也会尝试去掉开头的 "./"、"/" 和多余的上级目录
+（至少保留图像所在的目录，TuSimple 各片段目录下的文件名是重复的）。
+图像尺寸从 JPEG/PNG 文件头读取（按文件 size/mtime 缓存），用于提前发现缺失或尺寸不符的图像。
+
+命令行用法：
+    python image_index.py label.json --image-root datasets/TUSimple/tusimple --image-root /mnt/backup/tusimple
+"""
+import os
+import sys
+import json
+import struct
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_FILE = "image_index.json"
+
+
+def _normalize(raw_file):
+    path = raw_file.replace("\\", "/")
+    while path.startswith("./"):
+        path = path[2:]
+    return path.lstrip("/")
+
+
+def read_image_size(path):
+    """只读文件头获取 JPEG/PNG 的 (宽, 高)，无法识别时返回 None"""
+    with open(path, "rb") as f:
+        head = f.read(32)
+        if head[:8] == b"\x89PNG\r\n\x1a\n":
+            w, h = struct.unpack(">II", head[16:24])
+            return w, h
+        if head[:2] != b"\xff\xd8":
+            return None
+        f.seek(2)
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            while marker[1] == 0xFF:  # 填充字节
+                marker = marker[1:] + f.read(1)
+            code = marker[1]
+            if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+                continue  # 无长度字段的标记
+            length = struct.unpack(">H", f.read(2))[0]
+            # SOF0-SOF15，排除 DHT(C4)、JPG(C8)、DAC(CC)
+            if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+                h, w = struct.unpack(">xHH", f.read(5))
+                return w, h
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+class ImageRootIndex:
+    """一个或多个图像根目录下所有文件的相对路径索引"""
+
+    def __init__(self, roots, cache_path=CACHE_FILE):
+        self.roots = [os.path.abspath(r) for r in roots if r]
+        self.cache_path = cache_path
+        self.dirs = {}  # 目录绝对路径 -> [mtime, 文件名列表, 子目录名列表]
+        self.sizes = {}  # 图像绝对路径 -> [size, mtime, 宽, 高]
+        self.files = {}  # 规范化相对路径 -> 绝对路径（靠前的根目录优先）
+        self.sizes_changed = False  # 读取过新的图像尺寸，缓存需要写回
+        self._load_cache()
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r") as f:
+                data = json.load(f)
+            self.dirs = data.get("dirs", {})
+            self.sizes = data.get("sizes", {})
+        except Exception as e:
+            logging.warning(f"读取图像索引缓存失败: {self.cache_path} : {e}")
+
+    def save_cache(self):
+        if not self.cache_path:
+            return
+        # 只保存当前根目录下的目录，避免缓存随切换数据集无限增长
+        prefixes = tuple(os.path.join(r, "") for r in self.roots)
+        dirs = {d: v for d, v in self.dirs.items() if d in self.roots or d.startswith(prefixes)}
+        sizes = {p: v for p, v in self.sizes.items() if p.startswith(prefixes)}
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dirs": dirs, "sizes": sizes}, f)
+        os.replace(tmp_path, self.cache_path)
+        self.sizes_changed = False
+
+    def _scan_dir(self, path):
+        """返回 (目录, [mtime, 文件, 子目录], 是否重新列出)；目录不存在返回 None"""
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return path, None, False
+        cached = self.dirs.get(path)
+        if cached and cached[0] == mtime:
+            return path, cached, False
+        files, subdirs = [], []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        subdirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+        except OSError as e:
+            logging.warning(f"无法读取目录: {path} : {e}")
+        return path, [mtime, files, subdirs], True
+
+    def scan(self, workers=None):
+        """按层并行扫描所有根目录，返回重新列出的目录数"""
+        workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        listed = 0
+        files = {}
+        visited = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for root in reversed(self.roots):  # 后扫描的根目录覆盖前面的，靠前的根目录优先
+                frontier = [root]
+                while frontier:
+                    next_frontier = []
+                    for path, entry, fresh in pool.map(self._scan_dir, frontier):
+                        if entry is None:
+                            continue
+                        visited[path] = entry
+                        listed += fresh
+                        rel = os.path.relpath(path, root).replace(os.sep, "/")
+                        prefix = "" if rel == "." else rel + "/"
+                        for name in entry[1]:
+                            files[prefix + name] = os.path.join(path, name)
+                        next_frontier.extend(os.path.join(path, d) for d in entry[2])
+                    frontier = next_frontier
+        self.files = files
+        # 已删除的子目录不会再被访问到，只保留本次扫描到的目录
+        stale = len(self.dirs) != len(visited)
+        self.dirs = visited
+        if listed or stale:
+            self.save_cache()
+        logging.info(f"图像索引: {len(self.files)} 个文件, 重新列出 {listed} 个目录")
+        return listed
+
+    def resolve(self, raw_file):
+        """返回 raw_file 对应图像的绝对路径，找不到返回 None；不访问文件系统"""
+        path = _normalize(raw_file)
+        found = self.files.get(path)
+        if found is not None:
+            return found
+        # raw_file 可能带有多余的上级目录（如 "tusimple/clips/..."），逐级去掉再试；
+        # 最少保留 "片段目录/文件名"，只剩文件名会匹配到其他片段的同名图像
+        parts = path.split("/")
+        for i in range(1, len(parts) - 1):
+            found = self.files.get("/".join(parts[i:]))
+            if found is not None:
+                return found
+        return None
+
+    def image_size(self, path):
+        """图像尺寸，按文件 size/mtime 缓存；读取失败返回 None"""
+        try:
+            st = os.stat(path)
+            cached = self.sizes.get(path)
+            if cached and cached[0] == st.st_size and cached[1] == st.st_mtime:
+                return cached[2], cached[3]
+            size = read_image_size(path)
+        except (OSError, struct.error):
+            return None
+        if size is not None:
+            self.sizes[path] = [st.st_size, st.st_mtime, size[0], size[1]]
+            self.sizes_changed = True
+        return size
+
+    def check(self, raw_files, expected_sizes=None, aspect_only=False, workers=None):
+        """
+        检查记录对应的图像。返回 (缺失的记录下标, 尺寸不符的记录下标)；
+        expected_sizes 为所有记录共用的 (宽, 高)，或逐条记录的列表（元素为 None 表示不检查），
+        None 表示不检查尺寸。aspect_only 为 True 时只检查宽高比（分辨率不同可以按比例换算）。
+        """
+        missing, mis_sized = [], []
+        paths = [self.resolve(r) for r in raw_files]
+        for idx, path in enumerate(paths):
+            if path is None:
+                missing.append(idx)
+        if expected_sizes is None:
+            return missing, mis_sized
+        if isinstance(expected_sizes, tuple):
+            expected_sizes = [expected_sizes] * len(raw_files)
+        workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        checked = [(idx, p) for idx, p in enumerate(paths)
+                   if p is not None and expected_sizes[idx] is not None]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            sizes = list(pool.map(self.image_size, [p for _, p in checked]))
+        for (idx, _), size in zip(checked, sizes):
+            if size is None:
+                continue
+            ew, eh = expected_sizes[idx]
+            if aspect_only:
+                if abs(size[0] * eh - size[1] * ew) > 0.01 * ew * size[1]:
+                    mis_sized.append(idx)
+            elif (size[0], size[1]) != (ew, eh):
+                mis_sized.append(idx)
+        if self.sizes_changed:
+            self.save_cache()
+        return missing, mis_sized
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index image roots and report missing or mis-sized images")
+    parser.add_argument("json_file")
+    parser.add_argument("--image-root", action="append", required=True,
+                        help="image root directory; repeat to add fallbacks in priority order")
+    parser.add_argument("--size", default="record",
+                        help="expected WxH, 'record' to use each record's width/height, or 'any'")
+    parser.add_argument("--cache", default=CACHE_FILE)
+    args = parser.parse_args(argv)
+
+    with open(args.json_file, "r") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    raw_files = [ann["raw_file"] for ann in records]
+    index = ImageRootIndex(args.image_root, args.cache)
+    index.scan()
+    if args.size == "any":
+        expected = None
+    elif args.size == "record":
+        expected = [(ann["width"], ann["height"]) if "width" in ann and "height" in ann else None
+                    for ann in records]
+    else:
+        expected = tuple(int(v) for v in args.size.lower().split("x"))
+    missing, mis_sized = index.check(raw_files, expected)
+    for idx in missing:
+        print(f"MISSING\t{idx}\t{raw_files[idx]}")
+    for idx in mis_sized:
+        print(f"SIZE\t{idx}\t{raw_files[idx]}")
+    print(f"{len(raw_files)} records, {len(missing)} missing, {len(mis_sized)} mis-sized",
+          file=sys.stderr)
+    return 1 if missing or mis_sized else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
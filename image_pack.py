@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图像打包：把标注文件引用的所有图片写入一个带偏移表的连续文件，编辑器通过 mmap 读取，
+避免逐个小文件 open/stat/read（在 NFS 上这部分开销远大于解码本身）。
+
+文件结构：
+    头部    magic, 模式, 条目数, 偏移表位置
+    数据    每张图片一段，起始位置按页 (4096) 对齐
+    偏移表  按 raw_file 哈希排序的 (哈希, 偏移, 长度, 原宽, 原高, 存储宽, 存储高)
+模式 ENCODED 保存原始文件字节（JPEG/PNG），读取时从 mmap 视图直接解码；
+模式 RGB 保存预先解码（并可缩放到画布分辨率）的 RGB 像素，读取时直接返回 mmap 上的只读数组，不复制。
+打开时只映射文件，不解析任何条目；查找为对哈希列的二分查找。
+
+命令行用法：
+    python image_pack.py label.json --image-root datasets/TUSimple/tusimple
+    python image_pack.py label.json --image-root datasets/TUSimple/tusimple --decode 1280x720
+"""
+import os
+import sys
+import mmap
+import struct
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from tusimple_io import iter_lines, extract_raw_file, raw_file_hash
+
+PACK_SUFFIX = ".imgpack"
+ENCODED = 0
+RGB = 1
+ALIGN = 4096
+CHUNK_IMAGES = 256  # 并行读取/解码的批大小，限制同时驻留内存的图片数
+
+_MAGIC = b"LIP1"
+_HEADER = struct.Struct("<4sIIQ")  # magic, 模式, 条目数, 偏移表位置
+_ENTRY = np.dtype([("hash", "<u8"), ("offset", "<u8"), ("length", "<u8"),
+                   ("width", "<u4"), ("height", "<u4"), ("stored_width", "<u4"), ("stored_height", "<u4")])
+
+
+class ImagePack:
+    """只读的打包图像文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.mode, count, table_offset = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"not an image pack: {path}")
+        self.table = np.frombuffer(self._mmap, dtype=_ENTRY, count=count, offset=table_offset)
+
+    def __len__(self):
+        return len(self.table)
+
+    def find(self, raw_file):
+        """raw_file 对应的条目下标，不存在返回 None"""
+        h = raw_file_hash(raw_file)
+        i = int(np.searchsorted(self.table["hash"], h))
+        if i < len(self.table) and self.table["hash"][i] == h:
+            return i
+        return None
+
+    def __contains__(self, raw_file):
+        return self.find(raw_file) is not None
+
+    def read(self, raw_file):
+        """
+        返回 (RGB 图像, 原图 (宽, 高))，不存在返回 None。
+        RGB 模式返回的数组是 mmap 上的只读视图。
+        """
+        import cv2
+        i = self.find(raw_file)
+        if i is None:
+            return None
+        entry = self.table[i]
+        data = np.frombuffer(self._mmap, dtype=np.uint8, count=int(entry["length"]), offset=int(entry["offset"]))
+        if self.mode == RGB:
+            img = data.reshape(int(entry["stored_height"]), int(entry["stored_width"]), 3)
+        else:
+            img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+            if img is None:
+                return None
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        return img, (int(entry["width"]), int(entry["height"]))
+
+    def close(self):
+        if self._mmap is None:
+            return
+        self.table = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # 仍有图像数组引用映射，随其释放
+        self._file.close()
+        self._mmap = None
+
+
+def _load(path, decode_size):
+    """读取一张图片，返回 (数据字节, 原宽, 原高, 存储宽, 存储高)，失败返回 None"""
+    import cv2
+    from image_index import read_image_size
+    try:
+        if decode_size is None:
+            with open(path, "rb") as f:
+                data = f.read()
+            size = read_image_size(path)
+            if size is None:
+                img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if img is None:
+                    return None
+                size = img.shape[1], img.shape[0]
+            return data, size[0], size[1], 0, 0
+        img = cv2.imread(path)
+        if img is None:
+            return None
+        h, w = img.shape[:2]
+        if (w, h) != decode_size:
+            img = cv2.resize(img, decode_size, interpolation=cv2.INTER_AREA)
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        return img.tobytes(), w, h, img.shape[1], img.shape[0]
+    except OSError:
+        return None
+
+
+def pack_images(json_path, out_path, resolve, decode_size=None, workers=None):
+    """
+    把 json_path 引用的图片（按 raw_file 去重）写入 out_path。resolve(raw_file) 返回图片路径或 None；
+    decode_size 为 (宽, 高) 时预先解码并缩放为 RGB。返回 (写入数, 缺失的 raw_file 列表)。
+    """
+    raw_files = list(dict.fromkeys(extract_raw_file(line) for _, line in iter_lines(json_path)))
+    workers = workers or min(32, (os.cpu_count() or 1) * 2)
+    entries = []
+    missing = []
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        out.write(_HEADER.pack(_MAGIC, ENCODED if decode_size is None else RGB, 0, 0))
+        for start in range(0, len(raw_files), CHUNK_IMAGES):
+            chunk = raw_files[start:start + CHUNK_IMAGES]
+            paths = [resolve(r) for r in chunk]
+            loaded = pool.map(lambda p: None if p is None else _load(p, decode_size), paths)
+            for raw_file, item in zip(chunk, loaded):
+                if item is None:
+                    missing.append(raw_file)
+                    continue
+                data, w, h, sw, sh = item
+                pos = out.tell()
+                offset = pos + (-pos) % ALIGN
+                out.seek(offset)
+                out.write(data)
+                entries.append((raw_file_hash(raw_file), offset, len(data), w, h, sw, sh))
+        table = np.array(entries, dtype=_ENTRY)
+        table.sort(order="hash")
+        if len(table) > 1 and (table["hash"][1:] == table["hash"][:-1]).any():
+            raise ValueError("raw_file hash collision; cannot pack this file")
+        table_offset = out.seek(0, os.SEEK_END)
+        out.write(table.tobytes())
+        out.seek(0)
+        out.write(_HEADER.pack(_MAGIC, ENCODED if decode_size is None else RGB, len(table), table_offset))
+    os.replace(tmp_path, out_path)
+    return len(entries), missing
+
+
+def main(argv=None):
+    from image_index import ImageRootIndex
+    from lane_rescale import parse_size
+    parser = argparse.ArgumentParser(description="Pack the images referenced by a TuSimple file into one file")
+    parser.add_argument("json_file")
+    parser.add_argument("--image-root", action="append", required=True,
+                        help="image root directory; repeat to add fallbacks in priority order")
+    parser.add_argument("-o", "--output", help=f"output path (default: json_file + {PACK_SUFFIX})")
+    parser.add_argument("--decode", help="store decoded RGB pixels resized to WxH")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    index = ImageRootIndex(args.image_root)
+    index.scan()
+    out_path = args.output or args.json_file + PACK_SUFFIX
+    count, missing = pack_images(args.json_file, out_path, index.resolve,
+                                 parse_size(args.decode) if args.decode else None, args.workers)
+    for raw_file in missing:
+        print(f"MISSING\t{raw_file}")
+    print(f"packed {count} images into {out_path}, {len(missing)} missing", file=sys.stderr)
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
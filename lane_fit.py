@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+车道线拟合：把点选的像素点拟合为 x = f(y)，在 h_samples 上取值。
+
+模型：
+    linear          分段线性插值（原有行为）
+    monotone_cubic  保形三次 Hermite 插值（PCHIP），不会在点之间过冲
+    catmull_rom     Catmull-Rom 样条，经过所有点且更平滑
+    poly2 / poly3   y 的二次/三次多项式最小二乘拟合，适合点有抖动的情况
+只在点的 y 范围内取值，与原来的线性插值一致。全部计算用 NumPy 向量化。
+"""
+from startup import np
+
+FIT_MODELS = ["linear", "monotone_cubic", "catmull_rom", "poly2", "poly3"]
+DEFAULT_FIT_MODEL = "linear"
+
+
+def _prepare(points):
+    """按 y 排序，同一 y 的多个点取 x 平均，返回 (ys, xs) 浮点数组"""
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    ys, inverse = np.unique(pts[:, 1], return_inverse=True)
+    xs = np.bincount(inverse, weights=pts[:, 0]) / np.bincount(inverse)
+    return ys, xs
+
+
+def _hermite(ys, xs, slopes, yq):
+    """三次 Hermite 插值求值"""
+    k = np.clip(np.searchsorted(ys, yq, side="right") - 1, 0, len(ys) - 2)
+    h = ys[k + 1] - ys[k]
+    t = (yq - ys[k]) / h
+    t2 = t * t
+    t3 = t2 * t
+    return ((2 * t3 - 3 * t2 + 1) * xs[k] + (t3 - 2 * t2 + t) * h * slopes[k]
+            + (-2 * t3 + 3 * t2) * xs[k + 1] + (t3 - t2) * h * slopes[k + 1])
+
+
+def _pchip_slopes(ys, xs):
+    """Fritsch-Carlson 保形斜率（与 scipy PchipInterpolator 相同的取法）"""
+    h = np.diff(ys)
+    delta = np.diff(xs) / h
+    n = len(ys)
+    slopes = np.zeros(n)
+    if n == 2:
+        slopes[:] = delta[0]
+        return slopes
+    w1 = 2 * h[1:] + h[:-1]
+    w2 = h[1:] + 2 * h[:-1]
+    same_sign = (np.sign(delta[:-1]) * np.sign(delta[1:])) > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        harmonic = (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:])
+    slopes[1:-1] = np.where(same_sign, harmonic, 0.0)
+    slopes[0] = _pchip_edge(h[0], h[1], delta[0], delta[1])
+    slopes[-1] = _pchip_edge(h[-1], h[-2], delta[-1], delta[-2])
+    return slopes
+
+
+def _pchip_edge(h0, h1, d0, d1):
+    """端点斜率：三点公式，并保证不破坏单调性"""
+    d = ((2 * h0 + h1) * d0 - h0 * d1) / (h0 + h1)
+    if np.sign(d) != np.sign(d0):
+        return 0.0
+    if np.sign(d0) != np.sign(d1) and abs(d) > abs(3 * d0):
+        return 3 * d0
+    return d
+
+
+def _catmull_rom_slopes(ys, xs):
+    """非均匀节点的 Catmull-Rom 切线：内部点取相邻两点的差商，端点单侧差商"""
+    slopes = np.empty(len(ys))
+    slopes[1:-1] = (xs[2:] - xs[:-2]) / (ys[2:] - ys[:-2])
+    slopes[0] = (xs[1] - xs[0]) / (ys[1] - ys[0])
+    slopes[-1] = (xs[-1] - xs[-2]) / (ys[-1] - ys[-2])
+    return slopes
+
+
+def fit_xs(points, yq, model=DEFAULT_FIT_MODEL):
+    """在 yq（升序数组）上计算拟合的 x，points 至少包含两个不同 y 的点"""
+    ys, xs = _prepare(points)
+    yq = np.asarray(yq, dtype=np.float64)
+    if len(ys) < 2 or model == "linear":
+        return np.interp(yq, ys, xs)
+    if model == "monotone_cubic":
+        return _hermite(ys, xs, _pchip_slopes(ys, xs), yq)
+    if model == "catmull_rom":
+        return _hermite(ys, xs, _catmull_rom_slopes(ys, xs), yq)
+    if model in ("poly2", "poly3"):
+        deg = min(int(model[-1]), len(ys) - 1)
+        # 以 y 的中点和跨度归一化，避免高次项数值病态
+        center, span = ys.mean(), max(np.ptp(ys), 1.0)
+        coeffs = np.polyfit((ys - center) / span, xs, deg)
+        return np.polyval(coeffs, (yq - center) / span)
+    raise ValueError(f"unknown fit model: {model}")
+
+
+def fit_lane(points, h_samples, model=DEFAULT_FIT_MODEL):
+    """
+    把车道线像素点拟合到 h_samples 上，只取点的 y 范围内的样本。
+    返回 [(x, y), ...]（整数），点数不足两个或与 h_samples 没有交集时返回空列表。
+    """
+    if len(points) < 2:
+        return []
+    ys = [pt[1] for pt in points]
+    min_y, max_y = min(ys), max(ys)
+    interp_h_samples = [y for y in h_samples if min_y <= y <= max_y]
+    if not interp_h_samples:
+        return []
+    interp_xs = fit_xs(points, interp_h_samples, model)
+    return [(int(round(x)), int(y)) for x, y in zip(interp_xs, interp_h_samples)]
+
+
+def fit_curve(points, model=DEFAULT_FIT_MODEL, step=4):
+    """用于预览的稠密曲线：在点的 y 范围内每 step 像素取一个点，返回 (xs, ys) 数组"""
+    ys = [pt[1] for pt in points]
+    min_y, max_y = min(ys), max(ys)
+    if len(points) < 2 or min_y == max_y:
+        return np.asarray([pt[0] for pt in points], dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    yq = np.append(np.arange(min_y, max_y, step, dtype=np.float64), max_y)
+    return fit_xs(points, yq, model), yq
@@ -8,16 +8,23 @@ os.environ["QT_QPA_PLATFORM_PLUGIN_PATH"] = os.path.join(
 )
 import json
 import copy
-import cv2
-import numpy as np
+import multiprocessing
+from startup import cv2, np, profiler, preload
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QFileDialog, QLabel, QPushButton, QWidget,
-    QVBoxLayout, QHBoxLayout, QListWidget, QMessageBox, QInputDialog, QListWidgetItem, QCheckBox,
-    QDialog, QFormLayout, QLineEdit, QDialogButtonBox, QComboBox, QShortcut, QProgressBar  # 新增 QProgressBar
+    QVBoxLayout, QHBoxLayout, QMessageBox, QInputDialog, QCheckBox,
+    QDialog, QFormLayout, QLineEdit, QDialogButtonBox, QComboBox, QShortcut, QProgressBar,  # 新增 QProgressBar
+    QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QListView, QTableView
 )
-from PyQt5.QtGui import QPixmap, QImage, QPainter, QColor, QPen, QKeySequence
-from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtGui import QColor, QPen, QKeySequence, QPolygonF
+from PyQt5.QtCore import Qt, QPointF, QSize, QThread, QTimer, pyqtSignal
 import logging
+from annotation_store import AnnotationStore, StaleStoreError, open_store_for, is_store_path
+from collab_server import RemoteAnnotationStore, LeaseError, is_collab_url
+from zoom_canvas import ZoomCanvas
+from lane_panel import LaneListModel, LanePointModel
+# 依赖 numpy/cv2 的模块（feature_index、anno_merge、phash_index 等）在用到时才导入，缩短启动时间
+profiler.mark("imports")
 
 LANE_COLORS = [
     QColor(255, 0, 0), QColor(0, 255, 0), QColor(0, 0, 255),
@@ -27,18 +34,18 @@ LANE_COLORS = [
 LANE_COLOR_NAMES = ["red", "green", "blue", "purple", "yellow", "cyan"]
 
 
-TUSIMPLE_IMG_SIZE = (1280, 720)
+TUSIMPLE_IMG_SIZE = (1280, 720)  # 默认显示尺寸；图像缺失且记录没有 width/height 时按此尺寸显示
 
 LANG_EN = "EN"
 LANG_CN = "CN"
 CFG_LANGS = [LANG_EN, LANG_CN]
 
-# 日志初始化
+# 日志初始化（日志文件在第一次写入时才打开）
 logging.basicConfig(
     level=logging.DEBUG,
     format="%(asctime)s [%(levelname)s] %(message)s",
     handlers=[
-        logging.FileHandler("app.log", encoding="utf-8"),
+        logging.FileHandler("app.log", encoding="utf-8", delay=True),
         logging.StreamHandler()
     ]
 )
@@ -121,40 +128,23 @@ class ConfigDialog(QDialog):
         """最大车道线数改变时的处理"""
         try:
             max_lanes = int(text)
-            self.parent.config["max_lanes"] = max_lanes
+            truncated = self.parent.apply_max_lanes(max_lanes)
             self.parent.save_config()
-            
-            # 如果当前车道线数超过新的最大值，删除多余的车道线
-            if len(self.parent.lane_points) > max_lanes:
-                self.parent.lane_points = self.parent.lane_points[:max_lanes]
-                self.parent.update_lane_list()
-                self.parent.update_canvas()
+            self.parent.record_event("config", "max_lanes", max_lanes)
+            if truncated:
                 QMessageBox.information(self, "提示", f"已将车道线数量限制为{max_lanes}条")
         except ValueError:
             pass
     
     def on_canvas_size_changed(self, text):
-        """画布尺寸改变时的处理"""
+        """画布尺寸改变时的处理：只改变画布缩放，不再调整窗口或重新加载图像"""
         canvas_scale = float(text.replace("x", ""))
-        # 更新画布大小
-        canvas_width = int(round(TUSIMPLE_IMG_SIZE[0] * canvas_scale))
-        canvas_height = int(round(TUSIMPLE_IMG_SIZE[1] * canvas_scale))
-        self.parent.canvas.setFixedSize(canvas_width, canvas_height)
-        
-        # 更新窗口大小
-        base_width = 1600
-        base_height = 900
-        window_width = int(round(base_width * canvas_scale))
-        window_height = int(round(base_height * canvas_scale))
-        self.parent.resize(window_width, window_height)
+        self.parent.canvas.default_zoom = canvas_scale
+        self.parent.canvas.set_zoom(canvas_scale)
         
         # 更新配置
         self.parent.config["canvas_size"] = text
         self.parent.save_config()
-        
-        # 重新加载图像以应用新的缩放
-        self.parent.load_image()
-        self.parent.update_canvas()
     
     def get_config(self):
         """获取配置信息"""
@@ -171,27 +161,242 @@ class ConfigDialog(QDialog):
             "lang": "CN" if self.lang_combo.currentText() == "中文" else "EN"
         }
 
+class DiffReviewDialog(QDialog):
+    """标注文件比较结果列表，双击跳转到对应图片"""
+    def __init__(self, rows, other_path, parent=None):
+        super().__init__(parent)
+        self.lang_manager = parent.lang_manager
+        self.parent = parent
+        self.setWindowTitle(self.lang_manager.get_text("diff_title", filename=os.path.basename(other_path)))
+        self.resize(900, 500)
+
+        self.table = QTableWidget(len(rows), 3, self)
+        self.table.setHorizontalHeaderLabels([
+            self.lang_manager.get_text("diff_col_index"),
+            self.lang_manager.get_text("diff_col_raw_file"),
+            self.lang_manager.get_text("diff_col_diff")])
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        for row, (idx, raw_file, text) in enumerate(rows):
+            index_item = QTableWidgetItem()
+            index_item.setData(Qt.DisplayRole, idx)  # 按数值排序
+            self.table.setItem(row, 0, index_item)
+            self.table.setItem(row, 1, QTableWidgetItem(raw_file))
+            self.table.setItem(row, 2, QTableWidgetItem(text))
+        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        self.table.setSortingEnabled(True)
+        self.table.sortItems(0, Qt.AscendingOrder)
+        self.table.cellDoubleClicked.connect(self.on_row_double_clicked)
+
+        layout = QVBoxLayout()
+        layout.addWidget(QLabel(self.lang_manager.get_text("label_diff_summary", count=len(rows))))
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def on_row_double_clicked(self, row, column):
+        idx = self.table.item(row, 0).data(Qt.DisplayRole)
+        self.parent.goto_index(idx)
+
+class EvalReviewDialog(QDialog):
+    """逐帧评测结果，默认按准确率从差到好排列，双击或"下一个"跳转到对应图片"""
+    def __init__(self, scores, pred_path, parent=None):
+        super().__init__(parent)
+        self.lang_manager = parent.lang_manager
+        self.parent = parent
+        self.setWindowTitle(self.lang_manager.get_text("eval_title", filename=os.path.basename(pred_path)))
+        self.resize(900, 500)
+
+        order = scores.worst_first()
+        self.table = QTableWidget(len(order), 5, self)
+        self.table.setHorizontalHeaderLabels([
+            self.lang_manager.get_text("diff_col_index"),
+            self.lang_manager.get_text("diff_col_raw_file"),
+            self.lang_manager.get_text("eval_col_accuracy"),
+            self.lang_manager.get_text("eval_col_fp"),
+            self.lang_manager.get_text("eval_col_fn")])
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        for row, idx in enumerate(order):
+            values = [int(idx), None, round(float(scores.accuracy[idx]), 4),
+                      round(float(scores.fp[idx]), 4), round(float(scores.fn[idx]), 4)]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(scores.raw_files[idx] if value is None else "")
+                if value is not None:
+                    item.setData(Qt.DisplayRole, value)  # 按数值排序
+                self.table.setItem(row, col, item)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        # 行已按 worst_first 插入；不指定排序列，点击表头后才按该列重新排序
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table.setSortingEnabled(True)
+        self.table.cellDoubleClicked.connect(self.on_row_double_clicked)
+
+        summary = scores.summary()
+        next_btn = QPushButton(self.lang_manager.get_text("btn_next_worst"))
+        next_btn.clicked.connect(self.goto_next_row)
+        top = QHBoxLayout()
+        top.addWidget(QLabel(self.lang_manager.get_text("label_eval_summary",
+            accuracy=summary["accuracy"], fp=summary["fp"], fn=summary["fn"],
+            frames=summary["frames"], missing=summary["missing"])), 1)
+        top.addWidget(next_btn)
+
+        layout = QVBoxLayout()
+        layout.addLayout(top)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def on_row_double_clicked(self, row, column):
+        idx = self.table.item(row, 0).data(Qt.DisplayRole)
+        self.parent.goto_index(idx)
+
+    def goto_next_row(self):
+        """按表格当前排序跳到下一行"""
+        if self.table.rowCount() == 0:
+            return
+        row = self.table.currentRow() + 1
+        if row >= self.table.rowCount():
+            row = 0
+        self.table.selectRow(row)
+        self.on_row_double_clicked(row, 0)
+
+class PHashBuildThread(QThread):
+    """后台计算近重复帧索引"""
+    progress = pyqtSignal(int, int)
+    done = pyqtSignal(object, object)
+
+    def __init__(self, index, raw_files, threshold, parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.raw_files = raw_files
+        self.threshold = threshold
+
+    def run(self):
+        groups = None
+        try:
+            self.index.build(self.raw_files, progress=self.progress.emit)
+            groups = self.index.groups(self.threshold)
+        except Exception as e:
+            logging.exception(f"构建近重复帧索引异常: {e}")
+        self.done.emit(self.index, groups)
+
+class ImagePrefetcher:
+    """在后台线程预先解码下一张图片（cv2 解码时释放 GIL），切换时直接取用"""
+    def __init__(self):
+        self.pool = None
+        self.path = None
+        self.future = None
+
+    def request(self, path):
+        if path == self.path:
+            return
+        from concurrent.futures import ThreadPoolExecutor
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self.path = path
+        self.future = self.pool.submit(self._decode, path)
+
+    @staticmethod
+    def _decode(path):
+        img = cv2.imread(path)
+        return None if img is None else cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+    def take(self, path):
+        """取出 path 的预解码结果（RGB），没有预取过返回 None"""
+        if path != self.path or self.future is None:
+            return None
+        future, self.path, self.future = self.future, None, None
+        try:
+            return future.result()
+        except Exception as e:
+            logging.warning(f"预读图片失败: {path} : {e}")
+            return None
+
+class ImageIndexThread(QThread):
+    """后台扫描图像根目录并检查缺失/尺寸不符的图像"""
+    done = pyqtSignal(object, object, object)
+
+    def __init__(self, index, raw_files, expected_sizes, parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.raw_files = raw_files
+        self.expected_sizes = expected_sizes
+
+    def run(self):
+        missing, mis_sized = None, None
+        try:
+            self.index.scan()
+            missing, mis_sized = self.index.check(self.raw_files, self.expected_sizes, aspect_only=True)
+        except Exception as e:
+            logging.exception(f"扫描图像目录异常: {e}")
+        self.done.emit(self.index, missing, mis_sized)
+
+class PreannotationThread(QThread):
+    """启动预标注工作进程并在后台接收结果"""
+    ready = pyqtSignal(object)
+    result = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, client, parent=None):
+        super().__init__(parent)
+        self.client = client
+
+    def run(self):
+        try:
+            self.ready.emit(self.client.start())
+        except Exception as e:
+            logging.exception(f"启动预标注工作进程失败: {e}")
+            self.client.close()
+            self.failed.emit(str(e))
+            return
+        self.client.read_loop(self.result.emit)
+        self.client.close()
+
+class AnnotationLoadThread(QThread):
+    """后台读取标注文件并构建特征索引"""
+    progress = pyqtSignal(int)
+    done = pyqtSignal(object)
+    failed = pyqtSignal(object)  # 异常对象
+
+    def __init__(self, file_path, use_sqlite_store, reimport=None, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self.use_sqlite_store = use_sqlite_store
+        self.reimport = reimport
+
+    def run(self):
+        try:
+            result = read_annotation_file(self.file_path, self.use_sqlite_store, self.progress.emit,
+                                          self.reimport)
+        except StaleStoreError as e:
+            self.failed.emit(e)  # 由界面询问是否重新导入
+            return
+        except Exception as e:
+            logging.exception(f"后台加载标注文件失败: {e}")
+            self.failed.emit(e)
+            return
+        self.done.emit(result)
+
 class LanguageManager:
+    RES_FILES = {"CN": "res/res_cn.json", "EN": "res/res_en.json"}
+
     def __init__(self):
         self.resources = {}
         self.current_lang = "CN"
-        self.load_resources()
 
-    def load_resources(self):
-        """加载语言资源文件"""
+    def load_resources(self, lang=None):
+        """按需加载语言资源文件，只读取当前使用的语言"""
+        lang = lang or self.current_lang
+        if lang in self.resources:
+            return self.resources[lang]
         try:
-            res_cn_path = resource_path("res/res_cn.json")
-            res_en_path = resource_path("res/res_en.json")
-            print(f"res_cn_path: {res_cn_path}")
-            print(f"res_en_path: {res_en_path}")
-            with open(res_cn_path, "r", encoding="utf-8") as f:
-                self.resources["CN"] = json.load(f)
-            with open(res_en_path, "r", encoding="utf-8") as f:
-                self.resources["EN"] = json.load(f)
+            res_path = resource_path(self.RES_FILES[lang])
+            logging.debug(f"res_path: {res_path}")
+            with open(res_path, "r", encoding="utf-8") as f:
+                self.resources[lang] = json.load(f)
         except Exception as e:
             print(f"加载语言资源文件失败: {e}")
-            self.resources["CN"] = {}
-            self.resources["EN"] = {}
+            self.resources[lang] = {}
+        return self.resources[lang]
 
     def set_language(self, lang):
         """设置当前语言"""
@@ -200,7 +405,7 @@ class LanguageManager:
 
     def get_text(self, key, **kwargs):
         """获取指定key的文本，支持格式化参数"""
-        text = self.resources.get(self.current_lang, {}).get(key, key)
+        text = self.load_resources().get(key, key)
         if kwargs:
             try:
                 return text.format(**kwargs)
@@ -209,6 +414,8 @@ class LanguageManager:
         return text
 
 class LaneLabelTool(QMainWindow):
+    collab_notice = pyqtSignal(object)  # 协作服务端的推送（在读取线程中收到，转到界面线程处理）
+
     def __init__(self):
         logging.info("LaneLabelTool initializing...")
         try:
@@ -252,14 +459,35 @@ class LaneLabelTool(QMainWindow):
             self.progress_bar.setMaximum(100)
             self.progress_bar.setValue(0)
             self.progress_total_label = QLabel("0")  # 默认显示0
+            self.feature_index = None  # 打开文件时构建的逐记录特征索引
+            self.filter_indices = None  # 当前过滤条件匹配的记录下标，None表示不过滤
+            self.filter_expression = ""  # 计算 filter_indices 所用的表达式
+            self.phash_index = None  # 近重复帧索引
+            self.dup_groups = None  # dup_groups[i] 为记录 i 所在近重复组的首个下标
+            self.phash_thread = None
+            self.preview_curve = None  # 鼠标悬停时的拟合预览曲线 (xs, ys)，原图坐标
+            self.load_thread = None  # 后台加载标注文件的线程
+            self.prediction_index = None  # 预测文件的 raw_file 索引（RawFileIndex），只读叠加层
+            self.prediction_lanes = []  # 当前图片的预测车道线 [[(x, y), ...], ...]
+            self.image_index = None  # 图像根目录索引（ImageRootIndex），扫描完成前为 None
+            self.image_index_thread = None
+            self.image_index_key = None  # 当前索引对应的 (根目录, raw_file 列表, 期望尺寸)
+            self.image_missing = False  # 当前图片在索引中不存在
+            self.annotation_size = None  # 当前记录标注所用的分辨率 (宽, 高)，None 表示与图像一致
+            self.review_status = None  # 逐条记录的审核状态（ReviewStatus），随标注文件打开
+            self.image_pack = None  # 打包图像（ImagePack），有则优先从中读取图片
+            self.syncing_lane_list = False  # update_lane_list 同步列表期间，选中行变化不是用户操作
+            self.prefetcher = ImagePrefetcher()
+            self.preannotation_thread = None  # 预标注工作进程的通信线程
+            self.preannotation_queue = None  # 当前位置之后的预标注请求队列，工作进程就绪后创建
+            from session_replay import SessionRecorder
+            self.session_recorder = SessionRecorder.from_config(self.config)  # 会话录制，未配置时为 None
             self.init_ui()
+            self.collab_notice.connect(self.on_collab_notice)
+            profiler.mark("window init")
 
-            # 自动根据cache内容加载标注文件和图像
-            if self.cache.get("json_file_path"):
-                try:
-                    self._open_annotation(self.cache["json_file_path"])
-                except Exception as e:
-                    logging.exception(f"自动加载标注文件失败: {e}")
+            # 自动根据cache内容加载标注文件和图像：窗口显示后在后台加载，不阻塞启动
+            QTimer.singleShot(0, self.on_window_ready)
         except Exception as e:
             logging.exception(f"LaneLabelTool 初始化异常: {e}")
             raise
@@ -279,8 +507,21 @@ class LaneLabelTool(QMainWindow):
         #next_btn = QPushButton(self.lang_manager.get_text("btn_next"))
         #next_btn.clicked.connect(self.next_image)
         
+        compare_btn = QPushButton(self.lang_manager.get_text("btn_compare"))
+        compare_btn.clicked.connect(self.compare_annotation)
+        eval_btn = QPushButton(self.lang_manager.get_text("btn_evaluate"))
+        eval_btn.clicked.connect(self.evaluate_predictions)
+        load_pred_btn = QPushButton(self.lang_manager.get_text("btn_load_predictions"))
+        load_pred_btn.clicked.connect(self.load_prediction_file)
+        connect_btn = QPushButton(self.lang_manager.get_text("btn_connect_server"))
+        connect_btn.clicked.connect(self.connect_collab_server)
+
         left_buttons.addWidget(open_btn)
+        left_buttons.addWidget(connect_btn)
         left_buttons.addWidget(save_copy_btn)  # 移回左侧
+        left_buttons.addWidget(compare_btn)
+        left_buttons.addWidget(eval_btn)
+        left_buttons.addWidget(load_pred_btn)
         #left_buttons.addWidget(prev_btn)
         #left_buttons.addWidget(next_btn)
         
@@ -311,9 +552,23 @@ class LaneLabelTool(QMainWindow):
         path_layout.addWidget(self.path_label)
 
         right_layout = QVBoxLayout()
-        self.lane_list = QListWidget()
-        self.lane_list.setSelectionMode(QListWidget.SingleSelection)  # 保持单选模式
-        self.lane_list.currentRowChanged.connect(self.select_lane)
+        # 车道线列表和点表为 model/view：数据变化时只刷新变化的行
+        self.lane_model = LaneListModel(LANE_COLORS, LANE_COLOR_NAMES,
+            lambda index, count, color: self.lang_manager.get_text("lane_item", index=index, count=count, color=color),
+            self)
+        self.lane_list = QListView()
+        self.lane_list.setModel(self.lane_model)
+        self.lane_list.setSelectionMode(QAbstractItemView.SingleSelection)  # 保持单选模式
+        self.lane_list.selectionModel().currentRowChanged.connect(self.on_lane_row_changed)
+        self.point_model = LanePointModel(["y", "x"], self)
+        self.point_model.point_edited.connect(self.edit_lane_point)
+        self.point_table = QTableView()
+        self.point_table.setModel(self.point_model)
+        self.point_table.verticalHeader().setVisible(False)
+        self.point_table.verticalHeader().setDefaultSectionSize(20)
+        self.point_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.point_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.point_table.setVisible(False)
 
         self.select_all_checkbox = QCheckBox(self.lang_manager.get_text("checkbox_select_all"))
         self.select_all_checkbox.setChecked(True)
@@ -339,23 +594,42 @@ class LaneLabelTool(QMainWindow):
         next_img_btn.clicked.connect(self.next_image)
 
         show_points_btn = QPushButton(self.lang_manager.get_text("btn_show_points"))
-        show_points_btn.clicked.connect(self.show_current_lane_points)
+        show_points_btn.setCheckable(True)
+        show_points_btn.toggled.connect(self.point_table.setVisible)
 
         # 新增：整理当前车道线按钮
         organize_btn = QPushButton(self.lang_manager.get_text("btn_organize"))
         organize_btn.clicked.connect(self.organize_current_lane)
 
+        # 拟合模型选择与实时预览
+        from lane_fit import FIT_MODELS, DEFAULT_FIT_MODEL
+        fit_layout = QHBoxLayout()
+        self.fit_model_combo = QComboBox()
+        for model in FIT_MODELS:
+            self.fit_model_combo.addItem(self.lang_manager.get_text(f"fit_model_{model}"), model)
+        current_model = self.config.get("fit_model", DEFAULT_FIT_MODEL)
+        self.fit_model_combo.setCurrentIndex(max(0, self.fit_model_combo.findData(current_model)))
+        self.fit_model_combo.currentIndexChanged.connect(self.on_fit_model_changed)
+        self.preview_checkbox = QCheckBox(self.lang_manager.get_text("checkbox_live_preview"))
+        self.preview_checkbox.setChecked(self.config.get("live_preview", True))
+        self.preview_checkbox.stateChanged.connect(self.on_preview_toggled)
+        fit_layout.addWidget(QLabel(self.lang_manager.get_text("label_fit_model")))
+        fit_layout.addWidget(self.fit_model_combo, 1)
+        fit_layout.addWidget(self.preview_checkbox)
+
         lane_list_label = QLabel(f"<b>{self.lang_manager.get_text('label_lane_list')}</b>")
         lane_list_label.setTextFormat(Qt.RichText)  # 确保使用富文本格式
         right_layout.addWidget(lane_list_label)
         right_layout.addWidget(self.select_all_checkbox)
         right_layout.addWidget(self.lane_list)
+        right_layout.addWidget(self.point_table)
         right_layout.addWidget(add_lane_btn)
         right_layout.addWidget(del_lane_btn)
         right_layout.addWidget(clear_points_btn)
         right_layout.addWidget(undo_btn)
         right_layout.addWidget(redo_btn)
         # 新增：添加上一张/下一张按钮
+        right_layout.addLayout(fit_layout)
         right_layout.addWidget(organize_btn)  # 新增：整理按钮
         right_layout.addWidget(show_points_btn)
         #right_layout.addLayout(progress_layout)
@@ -366,6 +640,64 @@ class LaneLabelTool(QMainWindow):
         nav_btn_layout.addWidget(next_img_btn)
         right_layout.addLayout(nav_btn_layout)
 
+        # 审核模式：A 通过、R 驳回，直接保存并跳到下一张
+        self.review_checkbox = QCheckBox(self.lang_manager.get_text("checkbox_review_mode"))
+        self.review_checkbox.stateChanged.connect(self.on_review_mode_changed)
+        right_layout.addWidget(self.review_checkbox)
+
+        # 过滤导航：上一张/下一张只在匹配的记录间跳转
+        filter_layout = QHBoxLayout()
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText(self.lang_manager.get_text("filter_input"))
+        self.filter_input.returnPressed.connect(self.apply_filter)
+        filter_btn = QPushButton(self.lang_manager.get_text("filter_btn"))
+        filter_btn.clicked.connect(self.apply_filter)
+        filter_layout.addWidget(self.filter_input)
+        filter_layout.addWidget(filter_btn)
+        right_layout.addLayout(filter_layout)
+        self.filter_status_label = QLabel("")
+        right_layout.addWidget(self.filter_status_label)
+
+        # 近重复帧：从最近的已标注重复帧复制车道线，或导航时跳过重复帧
+        dup_layout = QHBoxLayout()
+        self.build_dup_btn = QPushButton(self.lang_manager.get_text("btn_build_dup_index"))
+        self.build_dup_btn.clicked.connect(self.build_duplicate_index)
+        copy_dup_btn = QPushButton(self.lang_manager.get_text("btn_copy_dup_lanes"))
+        copy_dup_btn.clicked.connect(self.copy_lanes_from_duplicate)
+        dup_layout.addWidget(self.build_dup_btn)
+        dup_layout.addWidget(copy_dup_btn)
+        right_layout.addLayout(dup_layout)
+        self.skip_dup_checkbox = QCheckBox(self.lang_manager.get_text("checkbox_skip_duplicates"))
+        right_layout.addWidget(self.skip_dup_checkbox)
+        self.dup_status_label = QLabel("")
+        right_layout.addWidget(self.dup_status_label)
+        self.image_check_label = QLabel("")  # 图像目录检查结果：缺失/尺寸不符的数量
+        right_layout.addWidget(self.image_check_label)
+
+        # 预测叠加层：半透明显示预测车道线，可逐条提升为标注车道线
+        pred_layout = QHBoxLayout()
+        self.prediction_checkbox = QCheckBox(self.lang_manager.get_text("checkbox_show_predictions"))
+        self.prediction_checkbox.setChecked(True)
+        self.prediction_checkbox.stateChanged.connect(self.update_canvas)
+        self.prediction_combo = QComboBox()
+        self.prediction_combo.currentIndexChanged.connect(self.update_canvas)
+        promote_btn = QPushButton(self.lang_manager.get_text("btn_promote_prediction"))
+        promote_btn.clicked.connect(self.promote_prediction_lane)
+        pred_layout.addWidget(self.prediction_checkbox)
+        pred_layout.addWidget(self.prediction_combo, 1)
+        pred_layout.addWidget(promote_btn)
+        right_layout.addLayout(pred_layout)
+        # 预标注：本地工作进程预先推理后面的图片，结果作为预测叠加层显示
+        preannotate_layout = QHBoxLayout()
+        self.preannotate_checkbox = QCheckBox(self.lang_manager.get_text("checkbox_preannotate"))
+        self.preannotate_checkbox.toggled.connect(self.on_preannotate_toggled)
+        self.preannotate_status_label = QLabel("")
+        preannotate_layout.addWidget(self.preannotate_checkbox)
+        preannotate_layout.addWidget(self.preannotate_status_label, 1)
+        right_layout.addLayout(preannotate_layout)
+        self.collab_label = QLabel("")  # 协作模式下当前记录的租用状态
+        right_layout.addWidget(self.collab_label)
+
         progress_layout = QHBoxLayout()
         progress_layout.addWidget(self.progress_bar)
         #progress_layout.addStretch()  # 添加弹性空间
@@ -383,17 +715,21 @@ class LaneLabelTool(QMainWindow):
         right_layout.addStretch()
 
         main_layout = QHBoxLayout()
-        self.canvas = QLabel()
+        # 可缩放画布：滚轮缩放，右键/中键拖动平移
+        self.canvas = ZoomCanvas()
         
-        # 根据配置设置画布尺寸
+        # 根据配置设置画布初始尺寸
         canvas_scale = float(self.config["canvas_size"].replace("x", ""))
         canvas_width = int(round(TUSIMPLE_IMG_SIZE[0] * canvas_scale))
         canvas_height = int(round(TUSIMPLE_IMG_SIZE[1] * canvas_scale))
-        self.canvas.setFixedSize(canvas_width, canvas_height)
+        self.canvas.preferred_size = QSize(canvas_width, canvas_height)
+        self.canvas.default_zoom = canvas_scale  # 换图时使用配置的缩放，不自动适应窗口
         
-        self.canvas.setMouseTracking(True)
-        self.canvas.mousePressEvent = self.on_canvas_click
-        main_layout.addWidget(self.canvas)
+        self.canvas.overlay_painter = self.paint_overlays
+        self.canvas.clicked.connect(self.on_canvas_click)
+        self.canvas.hovered.connect(self.on_canvas_hover)
+        self.canvas.left.connect(self.clear_fit_preview)
+        main_layout.addWidget(self.canvas, 1)
         main_layout.addLayout(right_layout)
 
         central_widget = QWidget()
@@ -416,6 +752,15 @@ class LaneLabelTool(QMainWindow):
         redo_shortcut.activated.connect(self.redo)
         save_copy_shortcut = QShortcut(QKeySequence("Ctrl+S"), self)
         save_copy_shortcut.activated.connect(self.save_copy2)
+        fit_view_shortcut = QShortcut(QKeySequence("Ctrl+0"), self)
+        fit_view_shortcut.activated.connect(self.canvas.fit_to_view)
+        # 审核模式快捷键，只在审核模式下启用；review_status 依赖 numpy，在按键时才导入
+        self.accept_shortcut = QShortcut(QKeySequence("A"), self)
+        self.accept_shortcut.activated.connect(self.accept_current)
+        self.reject_shortcut = QShortcut(QKeySequence("R"), self)
+        self.reject_shortcut.activated.connect(self.reject_current)
+        self.accept_shortcut.setEnabled(False)
+        self.reject_shortcut.setEnabled(False)
 
 
     def load_cache(self):
@@ -436,8 +781,18 @@ class LaneLabelTool(QMainWindow):
         return default_cache
 
     def update_progress_bar(self):
-        """更新进度条"""
+        """更新进度条：有审核状态时按已审核记录数计算，否则按当前下标"""
         total_images = len(self.annotation_data)
+        if self.review_status is not None:
+            from review_status import ACCEPTED, REJECTED, EDITED
+            reviewed = self.review_status.reviewed()
+            counts = self.review_status.counts
+            self.progress_bar.setValue(int(reviewed * 100 / max(total_images, 1)))
+            self.progress_total_label.setText(f"{reviewed}/{total_images}")
+            self.progress_bar.setToolTip(self.lang_manager.get_text("tooltip_review_counts",
+                accepted=int(counts[ACCEPTED]), rejected=int(counts[REJECTED]),
+                edited=int(counts[EDITED])))
+            return
         current_index = self.current_index
         progress = int((current_index / total_images) * 100)
         self.progress_bar.setValue(progress)
@@ -456,24 +811,118 @@ class LaneLabelTool(QMainWindow):
     def open_annotation(self):
         file_path, _ = QFileDialog.getOpenFileName(
             self, self.lang_manager.get_text("dialog_open_file"), 
-            self.last_json_path, "JSON Files (*.json)"
+            self.last_json_path, "Annotation Files (*.json *.db)"
         )
         if not file_path:
             return
-        self._open_annotation(file_path)
+        try:
+            self._open_annotation(file_path)
+        except StaleStoreError as e:
+            reimport = self.ask_reimport(file_path, e)
+            if reimport is None:
+                return
+            self._open_annotation(file_path, reimport=reimport)
         self.save_cache()
+        self.record_event("open", os.path.abspath(file_path), self.current_index)
 
-    def _open_annotation(self, file_path):
-        self.last_json_path = os.path.dirname(file_path)
-        self.json_file_path = file_path
-        self.annotation_data = []
-        with open(file_path, "r") as f:
-            lines = f.readlines()
-            for line in lines:
-                self.annotation_data.append(json.loads(line))
+    def ask_reimport(self, file_path, error):
+        """
+        源文件在导入后被修改：询问是重新导入（丢弃存储中的修改）还是继续使用存储。
+        返回 open_store_for 的 reimport 参数，取消时返回 None。
+        """
+        reply = QMessageBox.question(
+            self, self.lang_manager.get_text("dialog_warning"),
+            self.lang_manager.get_text("msg_store_stale", filename=os.path.basename(file_path), edited=error.edited),
+            QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.No)
+        if reply == QMessageBox.Cancel:
+            return None
+        return reply == QMessageBox.Yes
+
+    def connect_collab_server(self):
+        """连接协作服务端（collab_server.py serve），地址形如 collab://用户名@host:port"""
+        url, ok = QInputDialog.getText(
+            self, self.lang_manager.get_text("dialog_connect_server"),
+            self.lang_manager.get_text("label_collab_url"),
+            text=self.config.get("collab_url", "collab://127.0.0.1:6200"))
+        url = url.strip()
+        if not ok or not url:
+            return
+        if not is_collab_url(url):
+            url = "collab://" + url
+        from multiprocessing import AuthenticationError
+        try:
+            self._open_annotation(url)
+        except (OSError, ConnectionError, EOFError, AuthenticationError) as e:
+            logging.exception(f"连接协作服务端失败: {url}")
+            QMessageBox.warning(self, self.lang_manager.get_text("dialog_warning"),
+                                self.lang_manager.get_text("msg_collab_connect_failed", url=url, error=str(e)))
+            return
+        self.config["collab_url"] = url
+        self.save_config()
+
+    def on_window_ready(self):
+        """窗口第一次显示后：后台预加载 numpy/cv2，并异步打开上次的标注文件"""
+        profiler.mark("window shown")
+        preload(np, cv2)
+        file_path = self.cache.get("json_file_path")
+        if file_path and (is_collab_url(file_path) or os.path.exists(file_path)):
+            self.open_annotation_async(file_path)
+        else:
+            profiler.dump()
+
+    def open_annotation_async(self, file_path, reimport=None):
+        """在后台线程读取标注文件，界面显示加载进度，读取完成后再切换到该文件"""
+        if self.load_thread is not None:
+            return
+        self.path_label.setText(self.lang_manager.get_text(
+            "label_loading", filename=os.path.basename(file_path), percent=0))
+        self.load_thread = AnnotationLoadThread(
+            file_path, self.config.get("use_sqlite_store", False), reimport, self)
+        self.load_thread.progress.connect(
+            lambda percent: self.path_label.setText(self.lang_manager.get_text(
+                "label_loading", filename=os.path.basename(file_path), percent=percent)))
+        self.load_thread.done.connect(lambda result: self.on_annotation_loaded(file_path, result))
+        self.load_thread.failed.connect(lambda error: self.on_annotation_load_failed(file_path, error))
+        self.load_thread.start()
+
+    def on_annotation_loaded(self, file_path, result):
+        self.load_thread = None
+        profiler.mark("annotation loaded")
+        try:
+            self._apply_annotation(file_path, result)
+            self.record_event("open", os.path.abspath(file_path), self.current_index)
+        except Exception as e:
+            logging.exception(f"自动加载标注文件失败: {e}")
+        profiler.mark("first image")
+        profiler.dump()
+
+    def on_annotation_load_failed(self, file_path, error):
+        self.load_thread = None
+        if isinstance(error, StaleStoreError):
+            # 与手动打开相同：询问后按选择重新读取
+            reimport = self.ask_reimport(file_path, error)
+            if reimport is not None:
+                self.open_annotation_async(file_path, reimport)
+                return
+        self.path_label.setText(str(error))
+        profiler.dump()
+
+    def _open_annotation(self, file_path, reimport=None):
+        result = read_annotation_file(file_path, self.config.get("use_sqlite_store", False), reimport=reimport)
+        self._apply_annotation(file_path, result)
+
+    def _apply_annotation(self, file_path, result):
+        """切换到已读取的标注数据，result 为 read_annotation_file 的返回值"""
+        self.close_annotation_store()
+        self.annotation_data, self.json_file_path, self.feature_index = result
+        if isinstance(self.annotation_data, RemoteAnnotationStore):
+            self.annotation_data.on_change = self.collab_notice.emit
+        else:
+            self.last_json_path = os.path.dirname(file_path)
+        self.collab_label.setText("")
         
         # 如果是打开上次的文件，恢复上次的索引位置
-        if file_path == self.cache.get("json_file_path"):
+        if self.json_file_path == self.cache.get("json_file_path"):
             saved_index = self.cache.get("current_index", 0)
             if 0 <= saved_index < len(self.annotation_data):
                 self.current_index = saved_index
@@ -490,12 +939,172 @@ class LaneLabelTool(QMainWindow):
         self.project_id_label.setText(
             self.lang_manager.get_text("label_project_id", id=self.config['project_id']))
         self.json_file_label.setText(
-            self.lang_manager.get_text("label_json_file", filename=os.path.basename(file_path)))
+            self.lang_manager.get_text("label_json_file", filename=os.path.basename(self.json_file_path)))
+        self.apply_filter()
+        self.open_review_status()
+        self.open_image_pack()
+        if self.preannotation_queue is not None:
+            self.preannotation_queue.reset()  # 下标对应的是旧文件的记录
         self.load_image_and_lanes()
+        self.build_image_index()
         
         #self.last_saved_lane_points = json.dumps(self.lane_points)
         #self.save_cache()  # 保存新的缓存信息
 
+    def annotation_base_path(self):
+        """原标注文件路径：工作副本去掉 _{project_id}_tmp.json 后缀，旁路文件按它命名"""
+        base_path = self.json_file_path
+        copy_suffix = f"_{self.config['project_id']}_tmp.json"
+        if base_path.endswith(copy_suffix):
+            base_path = base_path[:-len(copy_suffix)]
+        return base_path
+
+    def open_image_pack(self):
+        """打开配置的 image_pack，或标注文件旁的 .imgpack（由 image_pack.py 生成）"""
+        from image_pack import ImagePack, PACK_SUFFIX
+        if self.image_pack is not None:
+            self.image_pack.close()
+            self.image_pack = None
+        path = self.config.get("image_pack")
+        if not path and not isinstance(self.annotation_data, RemoteAnnotationStore):
+            path = self.annotation_base_path() + PACK_SUFFIX
+        if not path or not os.path.exists(path):
+            return
+        try:
+            self.image_pack = ImagePack(path)
+            logging.info(f"使用打包图像: {path}, {len(self.image_pack)} 张")
+        except (OSError, ValueError) as e:
+            logging.warning(f"无法打开打包图像: {path} : {e}")
+
+    def open_review_status(self):
+        """打开（或创建）标注文件旁的审核状态文件；工作副本与原文件共用同一个"""
+        from review_status import ReviewStatus, REVIEW_SUFFIX
+        if self.review_status is not None:
+            self.review_status.close()
+            self.review_status = None
+        if isinstance(self.annotation_data, RemoteAnnotationStore):
+            return  # 服务端存储没有本地旁路文件
+        base_path = self.annotation_base_path()
+        try:
+            self.review_status = ReviewStatus(base_path + REVIEW_SUFFIX, len(self.annotation_data))
+        except OSError as e:
+            logging.warning(f"无法打开审核状态文件: {base_path + REVIEW_SUFFIX} : {e}")
+
+    def on_review_mode_changed(self, state):
+        """进入审核模式时启用 A/R 快捷键，并跳到当前位置之后第一条未审核的记录"""
+        from review_status import UNSEEN
+        enabled = state == Qt.Checked
+        self.accept_shortcut.setEnabled(enabled)
+        self.reject_shortcut.setEnabled(enabled)
+        if enabled and self.review_status is not None and self.annotation_data:
+            if self.review_status.get(self.current_index) != UNSEEN:
+                idx = self.review_status.next_with(self.current_index, UNSEEN)
+                if idx is not None:
+                    self.goto_index(idx)
+            self.prefetch_neighbor()
+
+    def accept_current(self):
+        from review_status import ACCEPTED
+        self.review_current(ACCEPTED)
+
+    def reject_current(self):
+        from review_status import REJECTED
+        self.review_current(REJECTED)
+
+    def review_current(self, status):
+        """
+        审核当前记录并跳到下一张：有修改时直接保存（不弹确认框）并记为已修改，
+        否则记为 status（通过/驳回）。
+        """
+        from review_status import ACCEPTED, EDITED
+        if not self.annotation_data or self.review_status is None:
+            return
+        if self.last_saved_lane_points is not None and self.lane_points != self.last_saved_lane_points:
+            if not self._save_copy():
+                return
+            self.record_event("save")
+            if status == ACCEPTED:
+                status = EDITED
+        self.review_status.set(self.current_index, status)
+        idx = self.neighbor_index(1)
+        if idx is None:
+            self.update_progress_bar()
+            return
+        self.current_index = idx
+        self.save_cache()
+        self.load_image_and_lanes()
+        self.reset_undo_redo()
+        self.record_event("goto", idx)
+        self.prefetch_neighbor()
+
+    def prefetch_neighbor(self):
+        """预读下一张图片"""
+        idx = self.neighbor_index(1)
+        if idx is None:
+            return
+        raw_file = self.annotation_data[idx]["raw_file"]
+        if self.image_pack is not None and raw_file in self.image_pack:
+            return  # 打包图像通过 mmap 读取，不需要预读
+        path, missing = self.resolve_image_path(raw_file)
+        if not missing:
+            self.prefetcher.request(path)
+
+    def build_image_index(self):
+        """后台扫描 image_root 及备用根目录；完成后按索引解析图片路径，导航时不再访问文件系统"""
+        from image_index import ImageRootIndex
+        if not self.annotation_data:
+            return
+        roots = [self.config["image_root"]] + list(self.config.get("image_root_fallbacks", []))
+        from lane_rescale import record_size
+        if isinstance(self.annotation_data, list):
+            raw_files = [ann["raw_file"] for ann in self.annotation_data]
+            # 只检查记录了 width/height 的图像尺寸，其他记录的标注坐标即图像坐标
+            expected_sizes = [record_size(ann) for ann in self.annotation_data]
+        else:
+            # SQLite 存储不在后台线程中逐条读取
+            raw_files = list(self.feature_index.raw_files)
+            expected_sizes = None
+        key = (roots, raw_files, expected_sizes)
+        if key == self.image_index_key and (self.image_index is not None or self.image_index_thread is not None):
+            return  # 重新打开同一文件：沿用已有的索引和检查结果（或正在进行的扫描）
+        self.image_index_key = key
+        self.image_check_label.setText(self.lang_manager.get_text("label_image_scanning"))
+        self.image_index_thread = ImageIndexThread(
+            ImageRootIndex(roots), raw_files, expected_sizes, self)
+        self.image_index_thread.done.connect(self.on_image_index_built)
+        self.image_index_thread.start()
+
+    def on_image_index_built(self, index, missing, mis_sized):
+        if self.sender() is not self.image_index_thread:
+            return  # 根目录已更改，丢弃过期的结果
+        self.image_index_thread = None
+        if missing is None:
+            self.image_index_key = None
+            self.image_check_label.setText("")
+            return
+        self.image_index = index
+        if self.annotation_data:
+            # 索引就绪前按 image_root 拼接的路径可能不对（图片在备用根目录中），重新读取当前图片
+            path, image_missing = self.resolve_image_path(self.annotation_data[self.current_index]["raw_file"])
+            if path != self.image_path:
+                self.image_path, self.image_missing = path, image_missing
+                self.load_image()
+        self.image_check_label.setText(self.lang_manager.get_text(
+            "label_image_check", missing=len(missing), mis_sized=len(mis_sized)))
+        if missing:
+            logging.warning(f"缺失图片 {len(missing)} 张, 例如 index={missing[:10]}")
+        if mis_sized:
+            logging.warning(f"尺寸不符的图片 {len(mis_sized)} 张, 例如 index={mis_sized[:10]}")
+
+    def resolve_image_path(self, raw_file):
+        """返回 (显示用路径, 是否确定缺失)；索引未就绪时按 image_root 拼接"""
+        if self.image_index is not None:
+            path = self.image_index.resolve(raw_file)
+            if path is not None:
+                return path, False
+            return os.path.join(self.config["image_root"], raw_file), True
+        return os.path.join(self.config["image_root"], raw_file), False
+
     def save_annotation(self):
         if not self.annotation_data:
             return
@@ -523,10 +1132,13 @@ class LaneLabelTool(QMainWindow):
 
         self.last_json_path = os.path.dirname(file_path)
         self.save_cache()  # 退出前保存缓存
-        with open(file_path, "w") as f:
-            for ann in self.annotation_data:
-                json.dump(ann, f)
-                f.write("\n")
+        if isinstance(self.annotation_data, AnnotationStore):
+            self.annotation_data.export_jsonl(file_path)
+        else:
+            with open(file_path, "w") as f:
+                for ann in self.annotation_data:
+                    json.dump(ann, f)
+                    f.write("\n")
         QMessageBox.information(
             self, 
             self.lang_manager.get_text("dialog_success"), 
@@ -541,6 +1153,7 @@ class LaneLabelTool(QMainWindow):
         """
         if not self.h_samples or not self.lane_points:
             return
+        from lane_fit import fit_lane, DEFAULT_FIT_MODEL
         new_lane_points = []
         for lane_idx, lane in enumerate(self.lane_points):
             if not lane or len(lane) < 2:
@@ -551,41 +1164,86 @@ class LaneLabelTool(QMainWindow):
             if all(y in self.h_samples for y in lane_ys) and len(lane) == len(self.h_samples):
                 new_lane_points.append(lane)
                 continue
-            # 需要插值
-            points = sorted(lane, key=lambda x: x[1])
-            xs = [pt[0] for pt in points]
-            ys = [pt[1] for pt in points]
-            min_y, max_y = min(ys), max(ys)
-            interp_h_samples = [y for y in self.h_samples if min_y <= y <= max_y]
-            if len(interp_h_samples) == 0:
+            # 需要插值，使用当前选择的拟合模型
+            new_points = fit_lane(lane, self.h_samples, self.config.get("fit_model", DEFAULT_FIT_MODEL))
+            if len(new_points) == 0:
                 print(self.lang_manager.get_text("msg_lane_deleted", 
                     index=lane_idx+1))
                 continue
-            interp_xs = np.interp(interp_h_samples, ys, xs)
-            new_points = [(int(round(x)), int(y)) for x, y in zip(interp_xs, interp_h_samples)]
             new_lane_points.append(new_points)
         self.lane_points = new_lane_points
         self.update_lane_list()
         self.update_canvas()
 
+    def neighbor_index(self, step, start=None):
+        """
+        返回 start（默认当前图片）的上一张(step=-1)/下一张(step=1)的下标，有过滤条件时只在匹配记录间跳转，
+        勾选跳过重复帧时跳过非组内首帧的近重复帧。
+        """
+        from feature_index import next_match
+        skip_dups = self.skip_dup_checkbox.isChecked() and self.dup_groups is not None
+        idx = self.current_index if start is None else start
+        while True:
+            if self.filter_indices is not None:
+                idx = next_match(self.filter_indices, idx, step)
+            else:
+                idx = idx + step
+                if not 0 <= idx < len(self.annotation_data):
+                    idx = None
+            if idx is None:
+                return None
+            if not skip_dups or idx >= len(self.dup_groups) or self.dup_groups[idx] == idx:
+                return idx
+
     def prev_image(self):
-        if self.current_index > 0:
+        idx = self.neighbor_index(-1)
+        if idx is not None:
             if not self.check_unsaved_changes():
                 return
-            self.current_index -= 1
+            self.current_index = idx
             self.save_cache()  # 保存当前索引
             self.load_image_and_lanes()
             self.reset_undo_redo()
+            self.record_event("goto", idx)
 
     def next_image(self):
-        if self.current_index < len(self.annotation_data) - 1:
+        idx = self.neighbor_index(1)
+        if idx is not None:
             #print(f"next_image: {self.current_index}")
             if not self.check_unsaved_changes():
                 return
-            self.current_index += 1
+            self.current_index = idx
             self.save_cache()  # 保存当前索引
             self.load_image_and_lanes()
             self.reset_undo_redo()
+            self.record_event("goto", idx)
+
+    def apply_filter(self):
+        """根据过滤输入框的表达式计算匹配记录，空表达式表示取消过滤"""
+        from feature_index import QueryError
+        text = self.filter_input.text().strip()
+        if not text or self.feature_index is None:
+            self.filter_indices = None
+            self.filter_expression = ""
+            self.filter_status_label.setText("")
+            return
+        try:
+            self.filter_indices = self.feature_index.query(text)
+        except QueryError as e:
+            QMessageBox.warning(self, self.lang_manager.get_text("dialog_warning"),
+                self.lang_manager.get_text("msg_invalid_filter", error=str(e)))
+            return
+        self.filter_expression = text
+        self.filter_status_label.setText(
+            self.lang_manager.get_text("label_filter_matches", count=len(self.filter_indices)))
+
+    def refresh_filter(self):
+        """特征索引更新后按已生效的表达式重新计算匹配记录（不读取输入框中尚未应用的内容）"""
+        if self.filter_indices is None or self.feature_index is None:
+            return
+        self.filter_indices = self.feature_index.query(self.filter_expression)
+        self.filter_status_label.setText(
+            self.lang_manager.get_text("label_filter_matches", count=len(self.filter_indices)))
 
     def goto_image_by_index(self):
         text = self.goto_image_input.text()
@@ -598,10 +1256,132 @@ class LaneLabelTool(QMainWindow):
             QMessageBox.warning(self, self.lang_manager.get_text("dialog_warning"), 
                 self.lang_manager.get_text("msg_image_index_out_of_range"))
             return
+        self.goto_index(idx)
+
+    def goto_index(self, idx):
+        """跳转到指定下标的图片"""
+        if not 0 <= idx < len(self.annotation_data) or not self.check_unsaved_changes():
+            return
         self.current_index = idx
         self.save_cache()  # 保存当前索引
         self.load_image_and_lanes()
         self.reset_undo_redo()
+        self.record_event("goto", idx)
+
+    def build_duplicate_index(self):
+        """后台计算所有 raw_file 的感知哈希（磁盘缓存增量更新），完成后分组"""
+        from phash_index import PHashIndex, CACHE_SUFFIX as PHASH_CACHE_SUFFIX
+        if self.feature_index is None or self.phash_thread is not None:
+            return
+        # 缓存按原标注文件命名，保存副本后仍能命中；协作服务端没有本地路径，不缓存
+        cache_path = None
+        if not isinstance(self.annotation_data, RemoteAnnotationStore):
+            cache_path = self.annotation_base_path() + PHASH_CACHE_SUFFIX
+        roots = [self.config["image_root"]] + list(self.config.get("image_root_fallbacks", []))
+        index = PHashIndex(roots, cache_path)
+        self.build_dup_btn.setEnabled(False)
+        self.phash_thread = PHashBuildThread(index, list(self.feature_index.raw_files),
+                                             self.config.get("dup_threshold", 6), self)
+        self.phash_thread.progress.connect(self.on_phash_progress)
+        self.phash_thread.done.connect(self.on_phash_built)
+        self.phash_thread.start()
+
+    def on_phash_progress(self, done, total):
+        self.dup_status_label.setText(
+            self.lang_manager.get_text("label_dup_progress", done=done, total=total))
+
+    def on_phash_built(self, index, groups):
+        self.phash_thread = None
+        self.build_dup_btn.setEnabled(True)
+        if groups is None:
+            return
+        self.phash_index = index
+        self.dup_groups = groups
+        redundant = int((self.dup_groups != np.arange(len(self.dup_groups))).sum())
+        self.dup_status_label.setText(
+            self.lang_manager.get_text("label_dup_summary", count=redundant))
+
+    def copy_lanes_from_duplicate(self):
+        """用最近的已标注近重复帧的车道线替换当前车道线"""
+        if self.phash_index is None:
+            QMessageBox.warning(self, self.lang_manager.get_text("dialog_warning"),
+                self.lang_manager.get_text("msg_dup_index_missing"))
+            return
+        labeled = self.feature_index.lanes > 0
+        src_idx = self.phash_index.nearest(self.current_index, labeled,
+                                           self.config.get("dup_threshold", 6))
+        if src_idx is None:
+            QMessageBox.information(self, self.lang_manager.get_text("dialog_info"),
+                self.lang_manager.get_text("msg_no_labeled_duplicate"))
+            return
+        src = self.annotation_data[src_idx]
+        self.push_undo()
+        self.lane_points = [[(x, y) for x, y in zip(lane, src["h_samples"]) if x >= 0]
+                            for lane in src["lanes"]]
+        self.current_lane = 0
+        self.update_lane_list()
+        self.update_canvas()
+        self.record_event("set_lanes", self.lane_points)
+        self.dup_status_label.setText(
+            self.lang_manager.get_text("label_dup_copied", index=src_idx))
+
+    def compare_annotation(self):
+        """与另一个标注文件（如其他标注员的副本）按 raw_file 逐条比较，列出有差异的记录"""
+        from tusimple_io import RawFileIndex
+        from anno_merge import diff_record, format_diff
+        if not self.annotation_data:
+            QMessageBox.warning(self, self.lang_manager.get_text("dialog_warning"),
+                self.lang_manager.get_text("msg_no_data"))
+            return
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, self.lang_manager.get_text("dialog_compare_file"),
+            self.last_json_path, "JSON Files (*.json)")
+        if not file_path:
+            return
+        tol, ok = QInputDialog.getInt(self, self.lang_manager.get_text("dialog_compare_file"),
+            self.lang_manager.get_text("msg_diff_tolerance"), 0, 0, 100)
+        if not ok:
+            return
+        other = RawFileIndex(file_path)
+        rows = []
+        for idx, ann in enumerate(self.annotation_data):
+            other_ann = other.get(ann.get("raw_file", ""))
+            if other_ann is None:
+                rows.append((idx, ann.get("raw_file", ""), self.lang_manager.get_text("msg_diff_missing")))
+                continue
+            diffs = diff_record(ann, other_ann, tol)
+            if diffs:
+                rows.append((idx, ann.get("raw_file", ""), format_diff(diffs)))
+        other.close()
+        dialog = DiffReviewDialog(rows, file_path, self)
+        dialog.show()
+
+    def evaluate_predictions(self):
+        """以当前标注为真值，按 TuSimple 官方指标评测一个预测文件，按准确率从差到好列出各帧"""
+        from tusimple_io import RawFileIndex
+        from tusimple_eval import evaluate_records
+        if not self.annotation_data:
+            QMessageBox.warning(self, self.lang_manager.get_text("dialog_warning"),
+                self.lang_manager.get_text("msg_no_data"))
+            return
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, self.lang_manager.get_text("dialog_eval_file"),
+            self.last_json_path, "JSON Files (*.json)")
+        if not file_path:
+            return
+        try:
+            preds = RawFileIndex(file_path)
+            gts = list(self.annotation_data)
+            scores = evaluate_records(gts, [preds.get(ann.get("raw_file", "")) for ann in gts])
+            preds.close()
+        except Exception as e:
+            logging.exception(f"评测失败: {file_path} : {e}")
+            QMessageBox.warning(self, self.lang_manager.get_text("dialog_warning"),
+                self.lang_manager.get_text("msg_eval_failed", error=str(e)))
+            return
+        logging.info(f"评测 {file_path}: {scores.summary()}")
+        dialog = EvalReviewDialog(scores, file_path, self)
+        dialog.show()
 
     def check_unsaved_changes(self):
         """
@@ -620,7 +1400,8 @@ class LaneLabelTool(QMainWindow):
             if reply == QMessageBox.Yes:
                 # 保存到annotation_data
                 #self.save_annotation()
-                self._save_copy()
+                if self._save_copy():
+                    self.record_event("save")
                 return True
             elif reply == QMessageBox.No:
                 return True
@@ -650,13 +1431,25 @@ class LaneLabelTool(QMainWindow):
                 if not found:
                     lane_xs.append(-2)  # 按tusimple格式，未标注点为-2
             lanes.append(lane_xs)
-        self.annotation_data[self.current_index]['lanes'] = lanes
+        # 整条记录写回，SQLite 存储下即为单条记录的事务写入
+        ann = self.annotation_data[self.current_index]
+        ann['lanes'] = lanes
+        self.annotation_data[self.current_index] = ann
+        if self.feature_index is not None:
+            self.feature_index.update(self.current_index, ann,
+                edited=self.lane_points != self.last_saved_lane_points)
+            self.refresh_filter()  # 车道线数、已编辑等特征变化后匹配集合也可能变化
 
     def load_image_and_lanes(self):
         try:
             logging.info(f"加载标注数据 index={self.current_index}")
-            ann = self.annotation_data[self.current_index]
-            self.image_path = os.path.join(self.config["image_root"], ann["raw_file"])
+            if isinstance(self.annotation_data, RemoteAnnotationStore):
+                ann = self.annotation_data.load(self.current_index)  # 记下版本号，保存时检查冲突
+            else:
+                ann = self.annotation_data[self.current_index]
+            from lane_rescale import record_size
+            self.image_path, self.image_missing = self.resolve_image_path(ann["raw_file"])
+            self.annotation_size = record_size(ann)
             self.h_samples = ann["h_samples"]
             self.lane_points = []
             for lane in ann["lanes"]:
@@ -666,9 +1459,13 @@ class LaneLabelTool(QMainWindow):
                         points.append((x, y))
                 self.lane_points.append(points)
             self.current_lane = 0
+            self.preview_curve = None
             self.select_all_checkbox.setChecked(True)
             self.update_lane_list()
-            self.load_image()
+            self.focus_collab_record()
+            self.load_prediction_lanes(ann["raw_file"])
+            self.plan_preannotation()
+            self.load_image(ann["raw_file"])
             self.update_canvas()
             self.last_saved_lane_points = copy.deepcopy(self.lane_points)
             self.update_progress_bar()
@@ -693,46 +1490,269 @@ class LaneLabelTool(QMainWindow):
         except Exception as e:
             logging.exception(f"加载图片和车道线异常: {e}")
 
-    def load_image(self):
+    def focus_collab_record(self):
+        """协作模式下租用当前记录；已被别人租用时提示，此时保存会被服务端拒绝"""
+        if not isinstance(self.annotation_data, RemoteAnnotationStore):
+            return
+        try:
+            ok, holder = self.annotation_data.focus(self.current_index)
+        except (OSError, ConnectionError, EOFError) as e:
+            logging.warning(f"租用记录失败: index={self.current_index} : {e}")
+            self.collab_label.setText(self.lang_manager.get_text("label_collab_disconnected"))
+            return
+        self.collab_label.setText("" if ok else self.lang_manager.get_text("label_collab_locked", user=holder))
+
+    def on_collab_notice(self, msg):
+        """其他客户端修改或租用了记录：当前记录未修改时直接重新读取，否则只提示"""
+        if not isinstance(self.annotation_data, RemoteAnnotationStore) or msg.get("idx") != self.current_index:
+            return
+        op = msg.get("op")
+        if op == "leased":
+            self.collab_label.setText(self.lang_manager.get_text("label_collab_locked", user=msg["user"]))
+        elif op == "released":
+            self.focus_collab_record()
+        elif op == "changed":
+            if self.lane_points == self.last_saved_lane_points:
+                self.load_image_and_lanes()
+            else:
+                self.collab_label.setText(self.lang_manager.get_text("label_collab_changed", user=msg["user"]))
+
+    def load_image(self, raw_file=None):
         logging.info(f"加载图片: {self.image_path}")
+        annotation_size = self.annotation_size
         try:
-            img = cv2.imread(self.image_path)
+            # 优先从打包图像读取；索引中不存在的图片不再尝试读取；预读过的直接取用（已是 RGB）
+            img = None
+            if raw_file is None and self.annotation_data:
+                raw_file = self.annotation_data[self.current_index]["raw_file"]
+            if self.image_pack is not None and raw_file is not None:
+                packed = self.image_pack.read(raw_file)
+                if packed is not None:
+                    img, original_size = packed
+                    # 预先缩放过的图像：没有记录 width/height 的标注坐标仍是原图坐标
+                    if annotation_size is None and original_size != (img.shape[1], img.shape[0]):
+                        annotation_size = original_size
+            if img is None and not self.image_missing:
+                img = self.prefetcher.take(self.image_path)
+                if img is None:
+                    img = cv2.imread(self.image_path)
+                    if img is not None:
+                        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
             if img is None:
                 logging.error(f"图片加载失败: {self.image_path}")
-                self.image = np.zeros((TUSIMPLE_IMG_SIZE[1], TUSIMPLE_IMG_SIZE[0], 3), dtype=np.uint8)
+                self.image = self.blank_image()
             else:
                 img_h, img_w = img.shape[:2]
                 logging.info(f"图片尺寸: {img_w}x{img_h}")
-                assert img_h == TUSIMPLE_IMG_SIZE[1] and img_w == TUSIMPLE_IMG_SIZE[0], f"Image size mismatch, img_h: {img_h}, img_w: {img_w}"
-                self.image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                
-                # 根据画布缩放比例调整图像大小
-                canvas_scale = float(self.config["canvas_size"].replace("x", ""))
-                if canvas_scale != 1.0:
-                    new_width = int(round(img_w * canvas_scale))
-                    new_height = int(round(img_h * canvas_scale))
-                    self.image = cv2.resize(self.image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+                # 任意分辨率均可；与记录的 width/height 不同时由画布做坐标换算，这里保留原始分辨率
+                self.image = img
         except Exception as e:
             logging.exception(f"加载图片异常: {self.image_path} : {e}")
-            self.image = np.zeros((TUSIMPLE_IMG_SIZE[1], TUSIMPLE_IMG_SIZE[0], 3), dtype=np.uint8)
+            self.image = self.blank_image()
+        self.canvas.set_image(self.image, annotation_size=annotation_size)
+
+    def blank_image(self):
+        """图片缺失时显示的黑色图像，尺寸取记录的分辨率"""
+        w, h = self.annotation_size or TUSIMPLE_IMG_SIZE
+        return np.zeros((h, w, 3), dtype=np.uint8)
+
+    def load_prediction_file(self):
+        """选择预测文件作为只读叠加层；只建 raw_file 索引，切换图片时按需解析单条记录"""
+        from tusimple_io import RawFileIndex
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, self.lang_manager.get_text("dialog_prediction_file"),
+            self.last_json_path, "JSON Files (*.json)")
+        if not file_path:
+            return
+        try:
+            index = RawFileIndex(file_path)
+        except Exception as e:
+            logging.exception(f"读取预测文件失败: {file_path} : {e}")
+            QMessageBox.warning(self, self.lang_manager.get_text("dialog_warning"),
+                self.lang_manager.get_text("msg_prediction_failed", error=str(e)))
+            return
+        if self.prediction_index is not None:
+            self.prediction_index.close()
+        self.prediction_index = index
+        logging.info(f"加载预测文件: {file_path}, {len(index)} 条记录")
+        if self.annotation_data:
+            self.load_prediction_lanes(self.annotation_data[self.current_index]["raw_file"])
+            self.update_canvas()
+
+    def load_prediction_lanes(self, raw_file):
+        """查找当前图片的预测车道线并刷新下拉列表"""
+        self.prediction_lanes = []
+        pred = None
+        if self.prediction_index is not None:
+            pred = self.prediction_index.get(raw_file)
+        elif self.preannotation_queue is not None:
+            # 没有加载预测文件时显示预标注结果
+            pred = self.preannotation_queue.get(self.current_index)
+            if pred is not None and pred["raw_file"] != raw_file:
+                pred = None
+        if pred is not None:
+            h_samples = pred.get("h_samples", [])
+            for lane in pred.get("lanes", []):
+                points = [(x, y) for x, y in zip(lane, h_samples) if x >= 0]
+                if points:
+                    self.prediction_lanes.append(points)
+        self.prediction_combo.blockSignals(True)
+        self.prediction_combo.clear()
+        for idx, lane in enumerate(self.prediction_lanes):
+            self.prediction_combo.addItem(
+                self.lang_manager.get_text("prediction_item", index=idx+1, count=len(lane)))
+        self.prediction_combo.blockSignals(False)
+
+    def on_preannotate_toggled(self, checked):
+        """启动/停止预标注工作进程；模型由配置 preannotate_model 指定"""
+        from preannotate import PreannotationClient
+        if checked:
+            if self.preannotation_thread is not None:
+                return
+            client = PreannotationClient(self.config.get("preannotate_model", "stub"),
+                                         self.config.get("preannotate_batch", 4))
+            self.preannotation_thread = PreannotationThread(client, self)
+            self.preannotation_thread.ready.connect(self.on_preannotation_ready)
+            self.preannotation_thread.result.connect(self.on_preannotation_result)
+            self.preannotation_thread.failed.connect(self.on_preannotation_failed)
+            self.preannotation_thread.finished.connect(self.on_preannotation_finished)
+            self.preannotate_status_label.setText(self.lang_manager.get_text("label_preannotate_starting"))
+            self.preannotation_thread.start()
+        else:
+            self.stop_preannotation()
+
+    def stop_preannotation(self):
+        if self.preannotation_thread is None:
+            return
+        # 工作进程退出后线程自行结束；先解除引用，期间可以重新启动
+        thread, self.preannotation_thread = self.preannotation_thread, None
+        self.preannotation_queue = None
+        thread.client.shutdown()
+        self.preannotate_status_label.setText("")
+
+    def on_preannotation_ready(self, info):
+        from preannotate import PreannotationQueue
+        if self.sender() is not self.preannotation_thread or not self.preannotate_checkbox.isChecked():
+            return
+        self.preannotation_queue = PreannotationQueue(
+            self.preannotation_thread.client, self.config.get("preannotate_ahead", 16),
+            self.config.get("preannotate_batch", 4))
+        self.preannotate_status_label.setText(
+            self.lang_manager.get_text("label_preannotate_ready", model=info.get("model", "")))
+        self.plan_preannotation()
+
+    def on_preannotation_failed(self, error):
+        self.preannotate_checkbox.setChecked(False)
+        QMessageBox.warning(self, self.lang_manager.get_text("dialog_warning"),
+            self.lang_manager.get_text("msg_preannotate_failed", error=error))
+
+    def on_preannotation_finished(self):
+        if self.sender() is self.preannotation_thread:
+            self.preannotation_thread = None
+            self.preannotation_queue = None
+            if self.preannotate_checkbox.isChecked():
+                # 工作进程意外退出
+                self.preannotate_checkbox.blockSignals(True)
+                self.preannotate_checkbox.setChecked(False)
+                self.preannotate_checkbox.blockSignals(False)
+                self.preannotate_status_label.setText("")
+
+    def plan_preannotation(self):
+        """请求当前图片及其后 preannotate_ahead 张（按导航顺序）的预标注，取消已跳过的批次"""
+        if self.preannotation_queue is None or not self.annotation_data:
+            return
+        indices = [self.current_index]
+        while len(indices) < self.preannotation_queue.ahead:
+            idx = self.neighbor_index(1, indices[-1])
+            if idx is None:
+                break
+            indices.append(idx)
+
+        def make_item(idx):
+            ann = self.annotation_data[idx]
+            path, missing = self.resolve_image_path(ann["raw_file"])
+            if missing:
+                return None
+            return {"index": idx, "raw_file": ann["raw_file"], "path": os.path.abspath(path),
+                    "h_samples": ann["h_samples"]}
+
+        try:
+            self.preannotation_queue.plan(indices, make_item)
+        except OSError as e:
+            logging.warning(f"发送预标注请求失败: {e}")
+
+    def on_preannotation_result(self, msg):
+        if self.preannotation_queue is None:
+            return
+        if msg.get("error"):
+            logging.warning(f"预标注失败: {msg['error']}")
+        indices = self.preannotation_queue.on_result(msg)
+        if self.current_index in indices and self.prediction_index is None and self.annotation_data:
+            self.load_prediction_lanes(self.annotation_data[self.current_index]["raw_file"])
+            self.update_canvas()
+
+    def promote_prediction_lane(self):
+        """把下拉框选中的预测车道线复制为一条新的标注车道线"""
+        idx = self.prediction_combo.currentIndex()
+        if not (0 <= idx < len(self.prediction_lanes)):
+            return
+        if len(self.lane_points) >= self.config["max_lanes"]:
+            QMessageBox.warning(self, 
+                self.lang_manager.get_text("dialog_warning"),
+                self.lang_manager.get_text("msg_max_lanes", 
+                    max_lanes=self.config["max_lanes"]))
+            return
+        self.push_undo()
+        self.lane_points.append(list(self.prediction_lanes[idx]))
+        self.current_lane = len(self.lane_points) - 1
+        self.update_lane_list()
+        self.update_canvas()
+        self.record_event("set_lanes", self.lane_points)
 
     def update_lane_list(self):
-        self.lane_list.clear()
-        for idx, lane in enumerate(self.lane_points):
-            item_text = self.lang_manager.get_text("lane_item", 
-                index=idx+1, 
-                count=len(lane), 
-                color=LANE_COLOR_NAMES[idx % len(LANE_COLORS)])
-            item = QListWidgetItem(item_text)
-            color = LANE_COLORS[idx % len(LANE_COLORS)]
-            item.setForeground(color)
-            self.lane_list.addItem(item)
-        self.lane_list.setCurrentRow(self.current_lane)
+        """同步车道线列表和点表，只刷新变化的行"""
+        self.syncing_lane_list = True
+        try:
+            self.lane_model.sync(self.lane_points)
+            if self.lane_list.currentIndex().row() != self.current_lane:
+                self.lane_list.setCurrentIndex(self.lane_model.index(self.current_lane))
+        finally:
+            self.syncing_lane_list = False
+        self.update_point_table()
+
+    def on_lane_row_changed(self, current, previous):
+        # 删除/插入行引起的选中行变化不能改变 current_lane
+        if not self.syncing_lane_list:
+            self.select_lane(current.row())
+
+    def update_point_table(self):
+        lane = self.lane_points[self.current_lane] if 0 <= self.current_lane < len(self.lane_points) else []
+        self.point_model.sync(lane, getattr(self, "h_samples", []))
 
     def select_lane(self, idx):
         if 0 <= idx < len(self.lane_points):
             self.current_lane = idx
+            self.update_point_table()
             self.update_canvas()
+            self.record_event("select_lane", idx)
+
+    def edit_lane_point(self, y, old_x, new_x):
+        """点表中修改了 y 行的 x：old_x 为 None 表示新增点，new_x 为 None 表示删除点"""
+        if not (0 <= self.current_lane < len(self.lane_points)):
+            return
+        self.push_undo()
+        lane = self.lane_points[self.current_lane]
+        if old_x is not None:
+            for i, pt in enumerate(lane):
+                if int(pt[0]) == old_x and int(pt[1]) == y:
+                    del lane[i]
+                    break
+        if new_x is not None:
+            lane.append((new_x, y))
+            lane.sort(key=lambda pt: pt[1])
+        self.update_lane_list()
+        self.update_canvas()
+        self.record_event("edit_point", y, old_x, new_x)
 
     def add_lane(self):
         # 检查是否达到最大车道线数
@@ -748,6 +1768,7 @@ class LaneLabelTool(QMainWindow):
         self.current_lane = len(self.lane_points) - 1
         self.update_lane_list()
         self.update_canvas()
+        self.record_event("add_lane")
 
     def delete_lane(self):
         if len(self.lane_points) == 0:
@@ -757,49 +1778,113 @@ class LaneLabelTool(QMainWindow):
         self.current_lane = max(0, self.current_lane - 1)
         self.update_lane_list()
         self.update_canvas()
+        self.record_event("delete_lane")
 
     def clear_current_lane_points(self):
         if len(self.lane_points) == 0:
             return
         self.push_undo()
         self.lane_points[self.current_lane] = []
+        self.update_lane_list()
         self.update_canvas()
+        self.record_event("clear_lane")
 
-    def on_canvas_click(self, event):
-        if event.button() == Qt.LeftButton and self.current_lane < len(self.lane_points):
-            canvas_scale = float(self.config["canvas_size"].replace("x", ""))
-            # 将点击坐标转换回原始尺寸
-            x = int(round(event.pos().x() / canvas_scale))
-            y = int(round(event.pos().y() / canvas_scale))
+    def on_canvas_click(self, x, y):
+        """画布左键点击，x/y 为画布换算好的原图坐标"""
+        if self.current_lane < len(self.lane_points):
+            x = int(round(x))
+            y = int(round(y))
             self.push_undo()
             self.lane_points[self.current_lane].append((x, y))
             # sort points by y
             self.lane_points[self.current_lane].sort(key=lambda x: x[1])
             self.update_lane_list()  # 新增：及时更新车道线列表
             self.update_canvas()
+            self.record_event("click", x, y)
+
+    def on_canvas_hover(self, x, y):
+        """
+        鼠标悬停：把当前车道线已有的点加上光标位置重新拟合，作为预览曲线绘制。
+        只重绘新旧预览曲线覆盖的区域。
+        """
+        if not self.preview_checkbox.isChecked() or not (0 <= self.current_lane < len(self.lane_points)):
+            return
+        lane = self.lane_points[self.current_lane]
+        if not lane:
+            return
+        from lane_fit import fit_curve
+        self.record_event("hover", x, y)
+        points = list(lane) + [(x, y)]
+        old_curve = self.preview_curve
+        self.preview_curve = fit_curve(points, self.config.get("fit_model", "linear"))
+        self.canvas.update_image_region(self.preview_curve, old_curve)
+
+    def clear_fit_preview(self):
+        if self.preview_curve is not None:
+            old_curve = self.preview_curve
+            self.preview_curve = None
+            self.canvas.update_image_region(old_curve)
+            self.record_event("leave")
+
+    def on_fit_model_changed(self, index):
+        self.config["fit_model"] = self.fit_model_combo.itemData(index)
+        self.save_config()
+        self.record_event("config", "fit_model", self.config["fit_model"])
+
+    def apply_max_lanes(self, max_lanes):
+        """设置最大车道线数；当前车道线数超过新的最大值时删除多余的车道线并返回 True"""
+        self.config["max_lanes"] = max_lanes
+        if len(self.lane_points) <= max_lanes:
+            return False
+        self.lane_points = self.lane_points[:max_lanes]
+        self.update_lane_list()
+        self.update_canvas()
+        return True
+
+    def on_preview_toggled(self, state):
+        self.config["live_preview"] = state == Qt.Checked
+        self.save_config()
+        self.record_event("config", "live_preview", self.config["live_preview"])
+        self.clear_fit_preview()
 
     def update_canvas(self):
+        """叠加层在画布绘制时按当前视图变换绘制，这里只需请求重绘"""
         if self.image is None:
             return
-        img = self.image.copy()
-        painter = QPainter()
-        canvas_scale = float(self.config["canvas_size"].replace("x", ""))
-        img_h, img_w = img.shape[:2]
-        qimg = QImage(img.data, img_w, img_h, img.strides[0], QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(qimg)
-        painter.begin(pixmap)
+        self.canvas.update()
+
+    def paint_overlays(self, painter):
+        """在原图坐标系下绘制参考线和车道线；画笔为 cosmetic，线宽不随缩放变化"""
+        img_w, img_h = self.canvas.image_size()
 
         # 只画水平参考线
         if hasattr(self, "h_samples") and self.h_samples:
             pen = QPen(QColor(100, 100, 100), 1, Qt.DashLine)
-            painter.setPen(pen)
+            pen.setCosmetic(True)
+            text_pen = QPen(QColor(80, 80, 80))
             for i in range(len(self.h_samples)):
                 if (i % 4 == 0) or (i == len(self.h_samples) - 1):
-                    y = int(round(self.h_samples[i] * canvas_scale))
-                    painter.drawLine(0, y, img_w, y)
-                    painter.setPen(QColor(80, 80, 80))
-                    painter.drawText(5, y - 2, f"{y}")
+                    y = self.h_samples[i]
                     painter.setPen(pen)
+                    painter.drawLine(QPointF(0, y), QPointF(img_w, y))
+                    # 文字按屏幕坐标绘制，保持字号不变
+                    pos = painter.transform().map(QPointF(5, y))
+                    painter.save()
+                    painter.resetTransform()
+                    painter.setPen(text_pen)
+                    painter.drawText(QPointF(pos.x(), pos.y() - 2), f"{y}")
+                    painter.restore()
+
+        # 预测车道线（半透明虚线，画在标注下面），下拉框选中的一条加粗
+        if self.prediction_lanes and self.prediction_checkbox.isChecked():
+            selected = self.prediction_combo.currentIndex()
+            for idx, lane in enumerate(self.prediction_lanes):
+                color = QColor(LANE_COLORS[idx % len(LANE_COLORS)])
+                color.setAlpha(120)
+                pen = QPen(color, 5 if idx == selected else 2, Qt.DashDotLine)
+                pen.setCosmetic(True)
+                painter.setPen(pen)
+                painter.drawPolyline(QPolygonF([QPointF(x, y) for x, y in lane]))
 
         # 画车道线
         if self.select_all_checkbox is not None and self.select_all_checkbox.isChecked():
@@ -807,26 +1892,26 @@ class LaneLabelTool(QMainWindow):
         else:
             lane_indices = [self.current_lane] if 0 <= self.current_lane < len(self.lane_points) else []
 
+        radius = 2.0 / self.canvas.pixels_per_unit()  # 点的屏幕半径固定为2像素
         for idx in lane_indices:
             lane = self.lane_points[idx]
             color = LANE_COLORS[idx % len(LANE_COLORS)]
-            pen = QPen(color, max(1, int(3 * canvas_scale)))  # 线条宽度也随缩放调整
+            pen = QPen(color, 3)
+            pen.setCosmetic(True)
             painter.setPen(pen)
+            painter.setBrush(color)
             for i in range(1, len(lane)):
-                # 缩放坐标
-                x1 = int(round(lane[i-1][0] * canvas_scale))
-                y1 = int(round(lane[i-1][1] * canvas_scale))
-                x2 = int(round(lane[i][0] * canvas_scale))
-                y2 = int(round(lane[i][1] * canvas_scale))
-                painter.drawLine(QPoint(x1, y1), QPoint(x2, y2))
+                painter.drawLine(QPointF(lane[i-1][0], lane[i-1][1]), QPointF(lane[i][0], lane[i][1]))
             for pt in lane:
-                # 缩放点坐标
-                x = int(round(pt[0] * canvas_scale))
-                y = int(round(pt[1] * canvas_scale))
-                painter.setBrush(color)
-                painter.drawEllipse(QPoint(x, y), max(1, int(2 * canvas_scale)), max(1, int(2 * canvas_scale)))
-        painter.end()
-        self.canvas.setPixmap(pixmap)
+                painter.drawEllipse(QPointF(pt[0], pt[1]), radius, radius)
+
+        # 拟合预览曲线（虚线）
+        if self.preview_curve is not None and 0 <= self.current_lane < len(self.lane_points):
+            pen = QPen(LANE_COLORS[self.current_lane % len(LANE_COLORS)], 2, Qt.DashLine)
+            pen.setCosmetic(True)
+            painter.setPen(pen)
+            xs, ys = self.preview_curve
+            painter.drawPolyline(QPolygonF([QPointF(x, y) for x, y in zip(xs, ys)]))
 
     
     def reset_undo_redo(self):
@@ -845,6 +1930,7 @@ class LaneLabelTool(QMainWindow):
         self.lane_points = json.loads(self.undo_stack.pop())
         self.update_lane_list()  # 新增：及时更新车道线列表
         self.update_canvas()
+        self.record_event("undo")
 
     def redo(self):
         if not self.redo_stack:
@@ -853,6 +1939,12 @@ class LaneLabelTool(QMainWindow):
         self.lane_points = json.loads(self.redo_stack.pop())
         self.update_lane_list()  # 新增：及时更新车道线列表
         self.update_canvas()
+        self.record_event("redo")
+
+    def record_event(self, op, *args):
+        """会话录制：记录一次操作及操作后的车道线摘要，供 session_replay.py 回放"""
+        if self.session_recorder is not None:
+            self.session_recorder.log(op, args, self.lane_points)
 
     def on_select_all_changed(self, state):
         if state == Qt.Checked:
@@ -861,23 +1953,12 @@ class LaneLabelTool(QMainWindow):
             self.lane_list.setEnabled(True)
         self.update_canvas()
 
-    def show_current_lane_points(self):
-        if 0 <= self.current_lane < len(self.lane_points):
-            points = self.lane_points[self.current_lane]
-            if not points:
-                msg = self.lang_manager.get_text("msg_no_points")
-            else:
-                msg = "\n".join([f"({x}, {y})" for x, y in points])
-        else:
-            msg = self.lang_manager.get_text("msg_no_lane_selected")
-        QMessageBox.information(self, 
-            self.lang_manager.get_text("dialog_info"), msg)
-
     def organize_current_lane(self):
         """
-        对当前选中车道线的像素点进行线性插值，生成tusimple特征点（h_samples对应的x），
+        按当前拟合模型对选中车道线的像素点插值，生成tusimple特征点（h_samples对应的x），
         并用插值结果替换原有像素点列表。
         """
+        from lane_fit import fit_lane, DEFAULT_FIT_MODEL
         if not (0 <= self.current_lane < len(self.lane_points)):
             QMessageBox.warning(self, 
                 self.lang_manager.get_text("dialog_warning"),
@@ -889,42 +1970,42 @@ class LaneLabelTool(QMainWindow):
                 self.lang_manager.get_text("msg_insufficient_points"))
             return
 
-        # 取出并排序当前车道线的点
-        points = sorted(self.lane_points[self.current_lane], key=lambda x: x[1])
-        xs = [pt[0] for pt in points]
-        ys = [pt[1] for pt in points]
-
         # 只对h_samples范围内插值
-        min_y, max_y = min(ys), max(ys)
-        interp_h_samples = [y for y in self.h_samples if min_y <= y <= max_y]
-        if len(interp_h_samples) == 0:
+        model = self.config.get("fit_model", DEFAULT_FIT_MODEL)
+        new_points = fit_lane(self.lane_points[self.current_lane], self.h_samples, model)
+        if len(new_points) == 0:
             QMessageBox.warning(self, 
                 self.lang_manager.get_text("dialog_warning"),
                 self.lang_manager.get_text("msg_no_intersection"))
             return
 
-        # 线性插值
-        interp_xs = np.interp(interp_h_samples, ys, xs)
-        new_points = [(int(round(x)), int(y)) for x, y in zip(interp_xs, interp_h_samples)]
-
         # 替换原有点
         self.push_undo()
         self.lane_points[self.current_lane] = new_points
         self.update_lane_list()  # 新增：及时更新车道线列表
         self.update_canvas()
+        self.record_event("organize_lane")
         QMessageBox.information(self, 
             self.lang_manager.get_text("dialog_success"),
             self.lang_manager.get_text("msg_interpolation_success", 
-                count=len(new_points)))
+                count=len(new_points), model=self.lang_manager.get_text(f"fit_model_{model}")))
+
+    def switch_to_copy(self, copy_filepath):
+        """
+        保存后以副本作为当前文件。内存中的记录与刚写入的副本完全相同，不重新读取：
+        重新读取会重建特征索引（丢失已编辑标记）并重新扫描图像目录。
+        """
+        self.json_file_path = copy_filepath
+        self.json_file_label.setText(
+            self.lang_manager.get_text("label_json_file", filename=os.path.basename(copy_filepath)))
 
     def save_copy(self):
         copy_filepath = self._save_copy()
         if not copy_filepath:
             return  # 修复：副本保存失败时不再继续
-        # reopen the copy file
-        self.json_file_path = copy_filepath
-        self._open_annotation(copy_filepath)
+        self.switch_to_copy(copy_filepath)
         self.save_cache()
+        self.record_event("save_copy")
         #print(f"save_copy, current_index: {self.current_index}")        
         QMessageBox.information(self, 
                 self.lang_manager.get_text("dialog_success"),
@@ -935,10 +2016,9 @@ class LaneLabelTool(QMainWindow):
         copy_filepath = self._save_copy()
         if not copy_filepath:
             return  # 修复：副本保存失败时不再继续
-        # reopen the copy file
-        self.json_file_path = copy_filepath
-        self._open_annotation(copy_filepath)
+        self.switch_to_copy(copy_filepath)
         self.save_cache()
+        self.record_event("save_copy")
         # Do NOT show the dialog here, because it will be shown in the save_copy function
 
     def _save_copy(self):
@@ -960,6 +2040,18 @@ class LaneLabelTool(QMainWindow):
             )
             return
 
+        if isinstance(self.annotation_data, (AnnotationStore, RemoteAnnotationStore)):
+            # SQLite 存储（或协作服务端）即工作副本：只写当前记录，不重写整个文件
+            self.auto_interpolate_all_lanes_to_h_samples()
+            try:
+                self.save_current_lane_points_to_annotation()
+            except (LeaseError, ConnectionError, OSError) as e:
+                QMessageBox.warning(self, self.lang_manager.get_text("dialog_warning"),
+                                    self.lang_manager.get_text("msg_collab_save_failed", error=str(e)))
+                return
+            self.last_saved_lane_points = copy.deepcopy(self.lane_points)
+            return self.annotation_data.db_path
+
         # 获取当前json文件名
         current_json = self.json_file_path
 
@@ -990,6 +2082,11 @@ class LaneLabelTool(QMainWindow):
         #self.save_cache()
         return copy_filepath
 
+    def close_annotation_store(self):
+        """关闭当前打开的 SQLite 标注存储或协作连接（如果有）"""
+        if isinstance(self.annotation_data, (AnnotationStore, RemoteAnnotationStore)):
+            self.annotation_data.close()
+
     def closeEvent(self, event):
         reply = QMessageBox.question(
             self, 
@@ -1000,14 +2097,31 @@ class LaneLabelTool(QMainWindow):
         )
         if reply == QMessageBox.Yes:
             self.save_cache()
+            self.close_annotation_store()
+            if self.session_recorder is not None:
+                self.session_recorder.close()
+            if self.review_status is not None:
+                self.review_status.close()
+            if self.image_pack is not None:
+                self.image_pack.close()
+            thread = self.preannotation_thread
+            if thread is not None:
+                self.stop_preannotation()
+                thread.wait(3000)
             event.accept()
         else:
             event.ignore()
 
     def show_config_dialog(self):
+        old_image_root = self.config.get("image_root")
         dialog = ConfigDialog(self.config, self)
         
-        if dialog.exec_() == QDialog.Accepted:
+        result = dialog.exec_()
+        if self.config.get("image_root") != old_image_root:
+            # 根目录在对话框中即时生效，重新建立图像索引
+            self.image_index = None
+            self.build_image_index()
+        if result == QDialog.Accepted:
             old_lang = self.config.get("lang", "CN")
             new_config = dialog.get_config()
             
@@ -1028,7 +2142,17 @@ class LaneLabelTool(QMainWindow):
             "project_id": "tusimple_lane",
             "max_lanes": 6,
             "canvas_size": "x1.0",  # 新增默认画布尺寸
-            "lang": "CN"
+            "lang": "CN",
+            "use_sqlite_store": False,  # 打开json时导入SQLite旁路存储
+            "dup_threshold": 6,  # 近重复帧的pHash汉明距离阈值
+            "fit_model": "linear",  # 车道线拟合模型，见 lane_fit.FIT_MODELS
+            "live_preview": True,  # 鼠标悬停时显示拟合预览
+            "image_root_fallbacks": [],  # image_root 中找不到图片时依次查找的备用根目录
+            "preannotate_model": "stub",  # 预标注模型："stub" 或 "module:factory"，见 preannotate.py
+            "preannotate_ahead": 16,  # 预标注当前位置之后的图片数
+            "preannotate_batch": 4,  # 每个预标注请求的图片数
+            "image_pack": "",  # 打包图像文件路径，空表示使用标注文件旁的 .imgpack（如果存在）
+            "record_session": ""  # 会话录制目录，空表示不录制，见 session_replay.py
         }
         
         if os.path.exists(config_file):
@@ -1054,6 +2178,39 @@ class LaneLabelTool(QMainWindow):
         with open("config.json", "w") as f:
             json.dump(self.config, f, indent=4)
 
+def read_annotation_file(file_path, use_sqlite_store=False, progress=None, reimport=None):
+    """
+    读取标注文件并构建特征索引，不访问界面，可以在后台线程调用。
+    返回 (annotation_data, json_file_path, feature_index)；progress(percent) 汇报读取进度。
+    reimport 见 annotation_store.open_store_for：源文件更新而存储中有修改时默认抛出 StaleStoreError。
+    """
+    from feature_index import FeatureIndex
+    if is_collab_url(file_path):
+        # 连接协作服务端，记录按需读取
+        annotation_data = RemoteAnnotationStore(file_path)
+    elif is_store_path(file_path):
+        # 直接打开 SQLite 标注存储
+        annotation_data = AnnotationStore(file_path)
+    elif use_sqlite_store:
+        # 导入到 SQLite 旁路存储，后续保存写入存储而不是重写整个文件
+        annotation_data = open_store_for(file_path, reimport)
+        file_path = annotation_data.db_path
+    else:
+        annotation_data = []
+        total = max(1, os.path.getsize(file_path))
+        read = 0
+        last_percent = -1
+        with open(file_path, "rb") as f:
+            for line in f:
+                read += len(line)
+                if line.strip():
+                    annotation_data.append(json.loads(line))
+                percent = read * 100 // total
+                if progress is not None and percent != last_percent:
+                    progress(percent)
+                    last_percent = percent
+    return annotation_data, file_path, FeatureIndex.build(annotation_data)
+
 def resource_path(relative_path):
     """获取资源文件的绝对路径，兼容PyInstaller打包和源码运行"""
     if hasattr(sys, '_MEIPASS'):
@@ -1061,9 +2218,12 @@ def resource_path(relative_path):
     return os.path.join(os.path.abspath("."), relative_path)
 
 if __name__ == "__main__":
+    # 预标注工作进程用 multiprocessing 启动，打包后的程序需要先处理子进程的启动参数
+    multiprocessing.freeze_support()
     try:
         logging.info("程序启动")
         app = QApplication(sys.argv)
+        profiler.mark("QApplication")
         win = LaneLabelTool()
         win.show()
         sys.exit(app.exec_())
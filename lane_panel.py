@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+车道线面板的 Qt 模型：车道线列表（LaneListModel）和当前车道线的点表（LanePointModel）。
+
+两个模型都以行元组快照表示内容，sync 时与新快照比较公共前缀/后缀，
+只对中间变化的行发出 dataChanged / rowsInserted / rowsRemoved，视图只重绘这些行。
+点表每行对应一个 h_sample（没有点时 x 为空），不在 h_samples 上的点单独成行（灰色显示）；
+编辑 x 不直接修改数据，而是发出 point_edited，由编辑器统一处理撤销和重绘。
+"""
+from bisect import bisect_left
+
+from PyQt5.QtGui import QColor
+from PyQt5.QtCore import Qt, QAbstractListModel, QAbstractTableModel, QModelIndex, pyqtSignal
+
+OFF_GRID_COLOR = QColor(128, 128, 128)
+
+
+def _sync_rows(model, old, new, last_column=0):
+    """把 model 的行从 old 更新为 new（均为列表），只通知变化的行；返回 new"""
+    n_old, n_new = len(old), len(new)
+    prefix = 0
+    limit = min(n_old, n_new)
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and old[n_old - 1 - suffix] == new[n_new - 1 - suffix]:
+        suffix += 1
+    old_mid = n_old - prefix - suffix
+    new_mid = n_new - prefix - suffix
+    common = min(old_mid, new_mid)
+    if new_mid < old_mid:
+        model.beginRemoveRows(QModelIndex(), prefix + common, prefix + old_mid - 1)
+        model._rows = old[:prefix + common] + old[prefix + old_mid:]
+        model.endRemoveRows()
+    elif new_mid > old_mid:
+        model.beginInsertRows(QModelIndex(), prefix + common, prefix + new_mid - 1)
+        model._rows = old[:prefix + common] + new[prefix + common:prefix + new_mid] + old[prefix + old_mid:]
+        model.endInsertRows()
+    model._rows = new
+    if common:
+        model.dataChanged.emit(model.index(prefix, 0), model.index(prefix + common - 1, last_column))
+    return new
+
+
+class LaneListModel(QAbstractListModel):
+    """车道线列表：每行显示序号、点数和颜色"""
+
+    def __init__(self, colors, color_names, text_fn, parent=None):
+        super().__init__(parent)
+        self.colors = colors
+        self.color_names = color_names
+        self.text_fn = text_fn  # text_fn(index, count, color_name) -> 显示文字
+        self._rows = []  # [(下标, 点数)]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        idx, count = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return self.text_fn(idx + 1, count, self.color_names[idx % len(self.colors)])
+        if role == Qt.ForegroundRole:
+            return self.colors[idx % len(self.colors)]
+        return None
+
+    def sync(self, lanes):
+        """按当前车道线更新，只通知点数或位置变化的行"""
+        _sync_rows(self, self._rows, [(i, len(lane)) for i, lane in enumerate(lanes)])
+
+
+class LanePointModel(QAbstractTableModel):
+    """当前车道线的点表：第 0 列为 y（只读），第 1 列为 x（可编辑，输入负数删除该点）"""
+    point_edited = pyqtSignal(int, object, object)  # y, 原 x（None 表示原来没有点）, 新 x（None 表示删除）
+
+    def __init__(self, headers, parent=None):
+        super().__init__(parent)
+        self.headers = headers
+        self._rows = []  # [(y, x 或 None, 是否在 h_samples 上)]，按 y 排序
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 2
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+
+    def flags(self, index):
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() == 1:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        y, x, on_grid = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            value = y if index.column() == 0 else x
+            return "" if value is None else str(value)
+        if role == Qt.EditRole:
+            return y if index.column() == 0 else (-2 if x is None else x)
+        if role == Qt.ForegroundRole and not on_grid:
+            return OFF_GRID_COLOR
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or index.column() != 1:
+            return False
+        try:
+            new_x = int(value)
+        except (TypeError, ValueError):
+            return False
+        y, old_x, _ = self._rows[index.row()]
+        new_x = new_x if new_x >= 0 else None
+        if new_x != old_x:
+            self.point_edited.emit(y, old_x, new_x)
+        return True
+
+    def row_of(self, y):
+        """y 所在的第一行，用于定位视图"""
+        row = bisect_left(self._rows, (y,))
+        return row if row < len(self._rows) and self._rows[row][0] == y else -1
+
+    def sync(self, lane, h_samples):
+        """按车道线的点和 h_samples 更新，只通知变化的行"""
+        grid = set(h_samples or [])
+        rows = [(int(p[1]), int(p[0]), int(p[1]) in grid) for p in lane]
+        used = {r[0] for r in rows}
+        rows += [(y, None, True) for y in grid if y not in used]
+        # None 不能与 int 比较：同一 y 只会有点或空行之一，按 (y, x) 排序时把 None 视为 -1
+        rows.sort(key=lambda r: (r[0], -1 if r[1] is None else r[1]))
+        _sync_rows(self, self._rows, rows, last_column=1)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+标注分辨率换算：把 lanes / h_samples 从一种分辨率映射到另一种（如 1920x1080 -> 1280x720）。
+
+记录可以带 "width"/"height" 字段说明标注所用的分辨率，没有时视为与图像一致。
+换算按批进行：同一批中 h_samples 长度相同的记录打包为数组一次计算；
+可选地重新采样到新的 h_samples 网格（相邻两点都有效时线性插值）。
+
+命令行用法：
+    python lane_rescale.py culane.json out.json --src 1640x590 --dst 1280x720 --h-samples 160:720:10
+"""
+import sys
+import json
+import argparse
+import numpy as np
+
+from tusimple_io import iter_lines
+
+BATCH_SIZE = 4096
+
+
+def record_size(ann):
+    """记录标注所用的分辨率 (宽, 高)，没有记录时返回 None"""
+    if "width" in ann and "height" in ann:
+        return int(ann["width"]), int(ann["height"])
+    return None
+
+
+def parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def parse_h_samples(text):
+    """"start:stop:step"（stop 不含）转为 h_samples 列表"""
+    start, stop, step = (int(v) for v in text.split(":"))
+    return list(range(start, stop, step))
+
+
+def _resample(ys, xs, target):
+    """
+    ys: (n, L) 升序采样行；xs: (n, G, L) 车道线 x，<0 表示无效；target: (M,) 新采样行。
+    返回 (n, G, M)，取不到值的位置为 -2。
+    """
+    L = ys.shape[1]
+    t = target[None, :]
+    k = (ys[:, None, :] <= t[..., None]).sum(axis=2) - 1  # 每个目标行左侧最近的采样下标
+    ke = np.clip(k, 0, L - 1)
+    exact = np.take_along_axis(ys, ke, axis=1) == t
+    xe = np.take_along_axis(xs, np.broadcast_to(ke[:, None, :], xs.shape[:2] + ke.shape[1:]), axis=2)
+    k = np.clip(k, 0, max(L - 2, 0))
+    k1 = np.minimum(k + 1, L - 1)
+    y0 = np.take_along_axis(ys, k, axis=1)
+    y1 = np.take_along_axis(ys, k1, axis=1)
+    x0 = np.take_along_axis(xs, np.broadcast_to(k[:, None, :], xs.shape[:2] + k.shape[1:]), axis=2)
+    x1 = np.take_along_axis(xs, np.broadcast_to(k1[:, None, :], xs.shape[:2] + k.shape[1:]), axis=2)
+    inside = (t >= ys[:, :1]) & (t <= ys[:, -1:])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        w = np.where(y1 > y0, (t - y0) / (y1 - y0), 0.0)
+    interp = x0 + (x1 - x0) * w[:, None, :]
+    valid = (x0 >= 0) & (x1 >= 0) & inside[:, None, :]
+    # 目标行正好落在原采样行上时，只需该点有效
+    on_sample = exact[:, None, :] & (xe >= 0) & inside[:, None, :]
+    return np.where(valid, interp, np.where(on_sample, xe, -2.0))
+
+
+def _rescale_group(records, scales, h_samples):
+    """records 的 h_samples 长度相同；scales 为每条记录的 (sx, sy)"""
+    n = len(records)
+    g_max = max([len(r.get("lanes", [])) for r in records] + [1])
+    L = len(records[0]["h_samples"])
+    ys = np.array([r["h_samples"] for r in records], dtype=np.float64).reshape(n, L)
+    xs = np.full((n, g_max, L), -2.0)
+    for i, r in enumerate(records):
+        lanes = r.get("lanes", [])
+        if lanes:
+            xs[i, :len(lanes)] = lanes
+    sx = scales[:, 0][:, None]
+    sy = scales[:, 1][:, None]
+    ys = ys * sy
+    xs = np.where(xs >= 0, xs * sx[..., None], -2.0)
+    if h_samples is not None:
+        new_ys = np.broadcast_to(np.asarray(h_samples, dtype=np.float64), (n, len(h_samples)))
+        xs = _resample(ys, xs, np.asarray(h_samples, dtype=np.float64))
+    else:
+        new_ys = ys
+    new_ys = np.rint(new_ys).astype(np.int64)
+    xs = np.where(xs >= 0, np.rint(xs), -2).astype(np.int64)
+    out = []
+    for i, r in enumerate(records):
+        lanes = xs[i, :len(r.get("lanes", []))]
+        # 重新采样后整条车道线都取不到值的，去掉
+        lanes = [lane.tolist() for lane in lanes if h_samples is None or (lane >= 0).any()]
+        out.append((new_ys[i].tolist(), lanes))
+    return out
+
+
+def rescale_records(records, dst_size, src_size=None, h_samples=None):
+    """
+    把记录换算到 dst_size 分辨率。每条记录的源分辨率取自其 width/height 字段，
+    没有时使用 src_size。h_samples 不为 None 时重新采样到该网格。返回新的记录列表（原记录不修改）。
+    """
+    scales = []
+    for r in records:
+        src = record_size(r) or src_size
+        if src is None:
+            raise ValueError(f"unknown source resolution for {r.get('raw_file', '')}; pass --src")
+        scales.append((dst_size[0] / src[0], dst_size[1] / src[1]))
+    scales = np.array(scales, dtype=np.float64).reshape(-1, 2)
+    groups = {}
+    for i, r in enumerate(records):
+        groups.setdefault(len(r.get("h_samples", [])), []).append(i)
+    result = [None] * len(records)
+    for members in groups.values():
+        converted = _rescale_group([records[i] for i in members], scales[members], h_samples)
+        for i, (new_h, lanes) in zip(members, converted):
+            ann = dict(records[i])
+            ann["h_samples"] = new_h
+            ann["lanes"] = lanes
+            ann["width"], ann["height"] = dst_size
+            result[i] = ann
+    return result
+
+
+def rescale_file(in_path, out_path, dst_size, src_size=None, h_samples=None):
+    """流式换算整个文件，每次处理 BATCH_SIZE 条记录，返回记录数"""
+    total = 0
+    batch = []
+    with open(out_path, "w") as out:
+        def flush():
+            for ann in rescale_records(batch, dst_size, src_size, h_samples):
+                json.dump(ann, out)
+                out.write("\n")
+            batch.clear()
+
+        for _, line in iter_lines(in_path):
+            batch.append(json.loads(line))
+            total += 1
+            if len(batch) >= BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rescale TuSimple lanes/h_samples to another resolution")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--dst", required=True, help="target resolution WxH")
+    parser.add_argument("--src", help="source resolution WxH for records without width/height")
+    parser.add_argument("--h-samples", help="resample onto start:stop:step rows (stop exclusive)")
+    args = parser.parse_args(argv)
+
+    total = rescale_file(args.input, args.output, parse_size(args.dst),
+                         parse_size(args.src) if args.src else None,
+                         parse_h_samples(args.h_samples) if args.h_samples else None)
+    print(f"rescaled {total} records to {args.dst}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+近重复帧检测：对所有 raw_file 图像计算 64 位感知哈希(pHash)，用多索引哈希按汉明距离查询。
+
+哈希结果按 raw_file 缓存在磁盘（记录文件 mtime/size），再次构建时只计算变化的图像；
+计算用线程池并行，OpenCV 解码时释放 GIL，整体受 I/O 限制。
+
+命令行用法：
+    python phash_index.py label.json --image-root datasets/TUSimple/tusimple --threshold 6
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+DEFAULT_THRESHOLD = 6  # 汉明距离不超过该值视为近重复
+CACHE_SUFFIX = ".phash.json"
+
+
+def image_phash(path):
+    """计算图像的 64 位 pHash，读取失败返回 None"""
+    # JPEG 可以在解码时直接缩小 8 倍，减少解码开销
+    img = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is None:
+        return None
+    small = cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])  # 中值不含直流分量
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class MultiIndexHash:
+    """
+    多索引哈希：64 位哈希切成 8 段 8 位，每段按值排序建表。
+    汉明距离不超过 7 时至少有一段完全相同（抽屉原理），只需核对这些候选；
+    更大的半径退化为全量向量化比较。
+    """
+    CHUNKS = 8
+
+    def __init__(self, hashes, items):
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.items = np.asarray(items, dtype=np.int64)
+        self.chunk_values = []
+        self.chunk_order = []
+        for j in range(self.CHUNKS):
+            values = ((self.hashes >> np.uint64(8 * j)) & np.uint64(0xFF)).astype(np.uint8)
+            order = np.argsort(values, kind="stable")
+            self.chunk_values.append(values[order])
+            self.chunk_order.append(order)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def search(self, h, radius):
+        """返回距离不超过 radius 的 [(距离, 条目), ...]，按距离升序"""
+        if len(self.hashes) == 0:
+            return []
+        h = np.uint64(h)
+        if radius < self.CHUNKS:
+            candidates = []
+            for j in range(self.CHUNKS):
+                value = int((h >> np.uint64(8 * j)) & np.uint64(0xFF))
+                lo = np.searchsorted(self.chunk_values[j], value, side="left")
+                hi = np.searchsorted(self.chunk_values[j], value, side="right")
+                candidates.append(self.chunk_order[j][lo:hi])
+            positions = np.concatenate(candidates)
+        else:
+            positions = np.arange(len(self.hashes))
+        dists = np.bitwise_count(self.hashes[positions] ^ h)
+        keep = dists <= radius
+        # 候选可能在多段中重复出现，过滤后再去重（此时数量很少）
+        positions, first = np.unique(positions[keep], return_index=True)
+        dists = dists[keep][first]
+        order = np.argsort(dists, kind="stable")
+        return [(int(d), int(i)) for d, i in zip(dists[order], self.items[positions[order]])]
+
+
+class PHashIndex:
+    """annotation 记录下标 -> pHash，以及基于多索引哈希的近重复查询"""
+
+    def __init__(self, image_root, cache_path=None):
+        # image_root 可以是多个根目录（按优先级），图片取第一个存在的
+        self.image_roots = [image_root] if isinstance(image_root, str) else list(image_root)
+        self.cache_path = cache_path
+        self.cache = {}  # raw_file -> [mtime, size, hash]
+        self.hashes = {}  # 记录下标 -> hash
+        self.table = MultiIndexHash([], [])
+        self._load_cache()
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r") as f:
+                data = json.load(f)
+            if data.get("image_roots", [data.get("image_root")]) == self.image_roots:
+                self.cache = data.get("hashes", {})
+        except Exception as e:
+            logging.warning(f"读取 pHash 缓存失败: {self.cache_path} : {e}")
+
+    def save_cache(self):
+        if not self.cache_path:
+            return
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"image_roots": self.image_roots, "hashes": self.cache}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def _hash_one(self, raw_file):
+        """命中缓存时只 stat 一次；文件变化或未缓存时重新计算"""
+        for root in self.image_roots:
+            path = os.path.join(root, raw_file)
+            try:
+                st = os.stat(path)
+                break
+            except OSError:
+                continue
+        else:
+            return raw_file, None, False
+        cached = self.cache.get(raw_file)
+        if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+            return raw_file, cached, False
+        h = image_phash(path)
+        return raw_file, (None if h is None else [st.st_mtime, st.st_size, h]), True
+
+    def build(self, raw_files, progress=None, workers=None):
+        """
+        为 raw_files（按记录下标排列）计算哈希并建树。progress(done, total) 用于汇报进度。
+        返回新计算的图像数。
+        """
+        workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        total = len(raw_files)
+        computed = 0
+        self.hashes = {}
+        unique = list(dict.fromkeys(raw_files))
+        results = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for done, (raw_file, entry, fresh) in enumerate(pool.map(self._hash_one, unique), 1):
+                if entry is not None:
+                    results[raw_file] = entry[2]
+                    if fresh:
+                        self.cache[raw_file] = entry
+                        computed += 1
+                if progress is not None and (done % 256 == 0 or done == len(unique)):
+                    progress(done, len(unique))
+        for idx, raw_file in enumerate(raw_files):
+            h = results.get(raw_file)
+            if h is not None:
+                self.hashes[idx] = h
+        self.table = MultiIndexHash(list(self.hashes.values()), list(self.hashes.keys()))
+        if computed:
+            self.save_cache()
+        logging.info(f"pHash 索引: {len(self.hashes)}/{total} 条记录, 新计算 {computed} 张")
+        return computed
+
+    def duplicates(self, idx, threshold=DEFAULT_THRESHOLD):
+        """返回与记录 idx 近重复的 [(距离, 下标), ...]，不含自身"""
+        h = self.hashes.get(idx)
+        if h is None:
+            return []
+        return [(d, j) for d, j in self.table.search(h, threshold) if j != idx]
+
+    def nearest(self, idx, candidates, threshold=DEFAULT_THRESHOLD):
+        """在 candidates（下标集合或布尔数组）中找与 idx 最近的近重复记录，找不到返回 None"""
+        for d, j in self.duplicates(idx, threshold):
+            if candidates[j]:
+                return j
+        return None
+
+    def groups(self, threshold=DEFAULT_THRESHOLD):
+        """
+        按近重复关系（传递闭包）分组，返回数组 rep，rep[i] 为记录 i 所在组的最小下标；
+        没有哈希的记录自成一组。
+        """
+        n = max(self.hashes) + 1 if self.hashes else 0
+        parent = np.arange(n)
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for idx in self.hashes:
+            for _, j in self.duplicates(idx, threshold):
+                ri, rj = find(idx), find(j)
+                if ri != rj:
+                    parent[max(ri, rj)] = min(ri, rj)
+        return np.array([find(i) for i in range(n)], dtype=np.int64)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Near-duplicate frame detection for TuSimple files")
+    parser.add_argument("json_file")
+    parser.add_argument("--image-root", action="append", required=True,
+                        help="image root directory; repeat to add fallbacks in priority order")
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    with open(args.json_file, "r") as f:
+        raw_files = [json.loads(line)["raw_file"] for line in f if line.strip()]
+    index = PHashIndex(args.image_root, args.json_file + CACHE_SUFFIX)
+    index.build(raw_files, workers=args.workers)
+    rep = index.groups(args.threshold)
+    members = {}
+    for i, r in enumerate(rep):
+        members.setdefault(int(r), []).append(i)
+    dup_groups = [m for m in members.values() if len(m) > 1]
+    for m in dup_groups:
+        print(" ".join(raw_files[i] for i in m))
+    print(f"{len(dup_groups)} duplicate groups, {sum(len(m) - 1 for m in dup_groups)} redundant frames",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预标注工作进程协议：模型在独立的本地进程中运行（multiprocessing.Process，打包成单文件后
+同样可用），编辑器通过管道按批发送图片，收到 TuSimple 格式的车道线。
+
+消息（dict）：
+    编辑器 -> 工作进程
+        {"op": "predict", "id": 批次号, "items": [{"index", "raw_file", "path", "h_samples"}, ...]}
+        {"op": "cancel", "ids": [批次号, ...]}     尚未开始的批次直接丢弃
+        {"op": "shutdown"}
+    工作进程 -> 编辑器
+        {"op": "ready", "model": 名称, "max_batch": n}
+        {"op": "result", "id": 批次号, "results": [{"index", "raw_file", "lanes", "h_samples", "run_time"}],
+         "error": None 或错误信息}
+工作进程每次把已收到的请求合并成不超过 max_batch 的一批交给模型，摊薄模型的固定开销。
+
+模型是任意提供 predict(items) -> [lanes, ...] 的对象，用 "module:factory" 指定；
+"stub" 为测试用的假模型。
+
+命令行用法：
+    python preannotate.py bench --model stub --frames 2000 --batch 8
+"""
+import time
+import zlib
+import logging
+import argparse
+import importlib
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+
+DEFAULT_MAX_BATCH = 8
+
+
+class StubModel:
+    """
+    假模型：按 raw_file 的哈希生成几条确定的直线车道线。
+    batch_overhead / item_cost（秒）模拟模型每批的固定开销和每张图的开销。
+    """
+    name = "stub"
+
+    def __init__(self, batch_overhead=0.0, item_cost=0.0):
+        self.batch_overhead = batch_overhead
+        self.item_cost = item_cost
+
+    def predict(self, items):
+        time.sleep(self.batch_overhead + self.item_cost * len(items))
+        results = []
+        for item in items:
+            seed = zlib.crc32(item["raw_file"].encode("utf-8"))
+            h_samples = item["h_samples"]
+            lanes = []
+            for j in range(2 + seed % 3):
+                x0 = 200 + 300 * j + seed % 50
+                slope = ((seed >> (4 * j)) % 9 - 4) / 4.0
+                lanes.append([int(x0 + slope * (y - h_samples[0])) if y >= h_samples[len(h_samples) // 4] else -2
+                              for y in h_samples])
+            results.append(lanes)
+        return results
+
+
+def load_model(spec, **kwargs):
+    """按 "stub" 或 "module:factory" 创建模型"""
+    if spec == "stub":
+        return StubModel(**kwargs)
+    module_name, _, attr = spec.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr or "create_model")
+    return factory()
+
+
+# ---- 工作进程 ----
+def serve(conn, model, max_batch=DEFAULT_MAX_BATCH):
+    """工作进程主循环：读取所有已到达的消息，合并请求成批推理，直到 shutdown 或连接断开"""
+    pending = deque()  # [(批次号, items)]
+    conn.send({"op": "ready", "model": getattr(model, "name", type(model).__name__),
+               "max_batch": max_batch})
+    while True:
+        # 有待处理的批次时不阻塞，只收取已到达的消息（主要是 cancel）
+        while not pending or conn.poll():
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                return
+            op = msg.get("op")
+            if op == "shutdown":
+                return
+            if op == "predict":
+                pending.append((msg["id"], msg["items"]))
+            elif op == "cancel":
+                cancelled = set(msg["ids"])
+                pending = deque(p for p in pending if p[0] not in cancelled)
+        # 合并若干个完整批次，总数不超过 max_batch（至少取一个）
+        batches = [pending.popleft()]
+        count = len(batches[0][1])
+        while pending and count + len(pending[0][1]) <= max_batch:
+            batches.append(pending.popleft())
+            count += len(batches[-1][1])
+        items = [item for _, batch_items in batches for item in batch_items]
+        start = time.perf_counter()
+        try:
+            outputs, error = model.predict(items), None
+        except Exception as e:
+            logging.exception(f"预标注模型异常: {e}")
+            outputs, error = [[] for _ in items], str(e)
+        run_time = (time.perf_counter() - start) * 1000 / max(len(items), 1)
+        pos = 0
+        for batch_id, batch_items in batches:
+            results = []
+            for item, lanes in zip(batch_items, outputs[pos:pos + len(batch_items)]):
+                results.append({"index": item["index"], "raw_file": item["raw_file"], "lanes": lanes,
+                                "h_samples": item["h_samples"], "run_time": run_time})
+            pos += len(batch_items)
+            conn.send({"op": "result", "id": batch_id, "results": results, "error": error})
+
+
+def _worker_main(conn, model_spec, max_batch, model_kwargs):
+    """编辑器启动的工作进程入口"""
+    model = load_model(model_spec, **model_kwargs)
+    with conn:
+        serve(conn, model, max_batch)
+
+
+# ---- 编辑器端 ----
+class PreannotationClient:
+    """
+    启动工作进程并与之通信。请求和取消可在任意线程调用；结果由 read_loop（在后台线程中运行）
+    交给 on_result(消息)。
+    """
+
+    def __init__(self, model_spec="stub", max_batch=DEFAULT_MAX_BATCH, model_kwargs=None):
+        self.model_spec = model_spec
+        self.max_batch = max_batch
+        self.model_kwargs = dict(model_kwargs or {})
+        self.conn = None
+        self.process = None
+        self.info = None  # 工作进程的 ready 消息
+        self._next_id = 0
+        self._send_lock = threading.Lock()
+
+    def start(self, timeout=30):
+        """启动工作进程并等待 ready 消息（最多 timeout 秒），返回该消息"""
+        # spawn：编辑器已有 Qt 和后台线程，fork 出的子进程可能继承被占用的锁
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child_conn, self.model_spec, self.max_batch, self.model_kwargs),
+            daemon=True)
+        self.process.start()
+        child_conn.close()
+        # 工作进程退出时 poll 也会返回，随后 recv 抛出 EOFError
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"预标注工作进程 {timeout} 秒内未就绪")
+        self.info = self.conn.recv()
+        return self.info
+
+    def request(self, items, on_send=None):
+        """发送一批图片，返回批次号；on_send(批次号) 在消息发出前调用（结果可能在 request 返回前到达）"""
+        with self._send_lock:
+            self._next_id += 1
+            batch_id = self._next_id
+            if on_send is not None:
+                on_send(batch_id)
+            self.conn.send({"op": "predict", "id": batch_id, "items": items})
+        return batch_id
+
+    def cancel(self, ids):
+        if ids:
+            with self._send_lock:
+                self.conn.send({"op": "cancel", "ids": list(ids)})
+
+    def read_loop(self, on_result):
+        """阻塞读取结果直到连接关闭"""
+        while True:
+            try:
+                msg = self.conn.recv()
+            except (EOFError, OSError):
+                return
+            if msg.get("op") == "result":
+                on_result(msg)
+
+    def shutdown(self):
+        """请工作进程退出；read_loop 随后因连接关闭而返回"""
+        if self.conn is not None:
+            try:
+                with self._send_lock:
+                    self.conn.send({"op": "shutdown"})
+            except OSError:
+                pass
+
+    def close(self):
+        if self.conn is not None:
+            self.shutdown()
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+            self.process = None
+
+
+class PreannotationQueue:
+    """
+    维护当前位置之后 ahead 张图片的预标注：缺少的按 batch 张一批请求，
+    已不在窗口内的在途批次取消。结果按记录下标缓存（LRU，最多 cache_size 条）。
+    """
+
+    def __init__(self, client, ahead=16, batch=4, cache_size=512):
+        self.client = client
+        self.ahead = ahead
+        self.batch = batch
+        self.cache_size = cache_size
+        self.results = OrderedDict()  # 记录下标 -> 结果
+        self.in_flight = {}  # 批次号 -> 记录下标集合
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """切换标注文件时清空结果并取消所有在途批次"""
+        with self._lock:
+            stale = list(self.in_flight)
+            self.in_flight.clear()
+            self.results.clear()
+        self.client.cancel(stale)
+
+    def get(self, idx):
+        with self._lock:
+            result = self.results.get(idx)
+            if result is not None:
+                self.results.move_to_end(idx)
+            return result
+
+    def plan(self, indices, make_item):
+        """
+        indices 为当前位置起按浏览顺序排列的下标（取前 ahead 个），make_item(idx) 生成请求项
+        （返回 None 表示跳过，如图片缺失）。返回本次新发出的批次号列表。
+        """
+        window = list(indices)[:self.ahead]
+        wanted = set(window)
+        with self._lock:
+            stale = [bid for bid, members in self.in_flight.items() if not members & wanted]
+            for bid in stale:
+                del self.in_flight[bid]
+            requested = set().union(*self.in_flight.values()) if self.in_flight else set()
+            missing = [i for i in window if i not in self.results and i not in requested]
+        self.client.cancel(stale)
+        sent = []
+        for start in range(0, len(missing), self.batch):
+            items = [item for item in (make_item(i) for i in missing[start:start + self.batch])
+                     if item is not None]
+            if not items:
+                continue
+            with self._lock:
+                bid = self.client.request(items)
+                self.in_flight[bid] = {item["index"] for item in items}
+            sent.append(bid)
+        return sent
+
+    def on_result(self, msg):
+        """保存结果，返回本批包含的记录下标；已取消的批次返回空列表"""
+        with self._lock:
+            if self.in_flight.pop(msg["id"], None) is None:
+                return []
+            for result in msg["results"]:
+                self.results[result["index"]] = result
+                self.results.move_to_end(result["index"])
+            while len(self.results) > self.cache_size:
+                self.results.popitem(last=False)
+        return [result["index"] for result in msg["results"]]
+
+
+def benchmark(model_spec, frames, batch, batch_overhead, item_cost):
+    """通过完整的协议跑 frames 张假图片，返回 (吞吐 帧/秒, 批次延迟列表 毫秒)"""
+    kwargs = {"batch_overhead": batch_overhead, "item_cost": item_cost} if model_spec == "stub" else {}
+    client = PreannotationClient(model_spec, max_batch=batch, model_kwargs=kwargs)
+    client.start()
+    h_samples = list(range(160, 720, 10))
+    sent_at = {}
+    latencies = []
+    done = threading.Event()
+
+    def on_result(msg):
+        latencies.append((time.perf_counter() - sent_at[msg["id"]]) * 1000)
+        if len(latencies) == len(sent_at) and len(sent_at) * batch >= frames:
+            done.set()
+
+    reader = threading.Thread(target=client.read_loop, args=(on_result,), daemon=True)
+    reader.start()
+    start = time.perf_counter()
+    for first in range(0, frames, batch):
+        items = [{"index": i, "raw_file": f"clips/bench/{i}.jpg", "path": "", "h_samples": h_samples}
+                 for i in range(first, min(first + batch, frames))]
+        client.request(items, on_send=lambda batch_id: sent_at.__setitem__(batch_id, time.perf_counter()))
+    done.wait()
+    elapsed = time.perf_counter() - start
+    client.close()
+    return frames / elapsed, latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-annotation worker protocol")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_bench = sub.add_parser("bench", help="measure protocol throughput and latency")
+    p_bench.add_argument("--model", default="stub", help="'stub' or module:factory")
+    p_bench.add_argument("--frames", type=int, default=2000)
+    p_bench.add_argument("--batch", type=int, default=DEFAULT_MAX_BATCH)
+    p_bench.add_argument("--stub-overhead", type=float, default=0.0, help="stub model seconds per batch")
+    p_bench.add_argument("--stub-item-cost", type=float, default=0.0, help="stub model seconds per image")
+
+    args = parser.parse_args(argv)
+    fps, latencies = benchmark(args.model, args.frames, args.batch, args.stub_overhead, args.stub_item_cost)
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{args.frames} frames, batch {args.batch}: {fps:.0f} frames/s, "
+          f"batch latency p50 {p50:.1f} ms, p95 {p95:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
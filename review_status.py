@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+逐条记录的审核状态，存放在标注文件旁的 ".review" 文件中。
+
+每条记录 2 位（未看/通过/驳回/已修改），100 万条记录约 250KB；文件通过 mmap 映射，
+修改单条记录只改一个字节，由操作系统按页写回。各状态数量在打开时用查表一次统计，
+之后随修改增量更新，进度显示不需要重新扫描。
+"""
+import os
+import mmap
+import struct
+import numpy as np
+
+UNSEEN = 0
+ACCEPTED = 1
+REJECTED = 2
+EDITED = 3
+STATUS_NAMES = ["unseen", "accepted", "rejected", "edited"]
+
+REVIEW_SUFFIX = ".review"
+_MAGIC = b"LRV1"
+_HEADER = struct.Struct("<4sI")  # magic, 记录数
+_SCAN_CHUNK = 1024  # next_with 首次展开的字节数（4096 条记录），之后每次加倍
+
+# 每个字节中 4 个 2 位状态各自的取值，以及每个字节值含有的各状态个数
+_BYTE_VALUES = np.arange(256, dtype=np.uint8)
+_FIELDS = np.stack([(_BYTE_VALUES >> (2 * k)) & 3 for k in range(4)], axis=1)
+_BYTE_COUNTS = np.stack([(_FIELDS == s).sum(axis=1) for s in range(4)], axis=1)
+
+
+class ReviewStatus:
+    """2 位/记录的状态位图，count 为记录数；文件记录数不同时按 count 扩展或截断"""
+
+    def __init__(self, path, count):
+        self.path = path
+        self.count = count
+        data_size = (count + 3) // 4
+        size = _HEADER.size + max(data_size, 1)
+        mode = "r+b" if os.path.exists(path) else "w+b"
+        self._file = open(path, mode)
+        old_count = 0
+        if mode == "r+b":
+            head = self._file.read(_HEADER.size)
+            if len(head) == _HEADER.size and _HEADER.unpack(head)[0] == _MAGIC:
+                old_count = _HEADER.unpack(head)[1]
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        self._mmap[:_HEADER.size] = _HEADER.pack(_MAGIC, count)
+        self.bits = np.frombuffer(self._mmap, dtype=np.uint8, offset=_HEADER.size, count=data_size)
+        if old_count == 0:
+            self.bits[:] = 0
+        elif old_count > count and count % 4:
+            # 截断时清掉最后一个字节中多余记录的位
+            self.bits[-1] &= np.uint8((1 << (2 * (count % 4))) - 1)
+        self.counts = _BYTE_COUNTS[self.bits].sum(axis=0).astype(np.int64)
+        # 末尾字节中的填充位按未看统计，去掉
+        self.counts[UNSEEN] -= data_size * 4 - count
+
+    def __len__(self):
+        return self.count
+
+    def get(self, idx):
+        return (int(self.bits[idx >> 2]) >> (2 * (idx & 3))) & 3
+
+    def set(self, idx, status):
+        old = self.get(idx)
+        if old == status:
+            return
+        shift = 2 * (idx & 3)
+        self.bits[idx >> 2] = (int(self.bits[idx >> 2]) & ~(3 << shift) & 0xFF) | (status << shift)
+        self.counts[old] -= 1
+        self.counts[status] += 1
+
+    def reviewed(self):
+        """已审核（非未看）的记录数"""
+        return self.count - int(self.counts[UNSEEN])
+
+    def statuses(self):
+        """全部记录的状态数组"""
+        return _FIELDS[self.bits].reshape(-1)[:self.count]
+
+    def next_with(self, current, status=UNSEEN, step=1):
+        """
+        从 current 之后（不含）按 step 方向查找第一条状态为 status 的记录，找不到返回 None。
+        从 current 向外分块展开位图，块大小逐次加倍，附近有匹配时不扫描整个文件。
+        """
+        chunk = _SCAN_CHUNK
+        if step > 0:
+            start = current + 1
+            byte = max(start, 0) >> 2
+            while byte < len(self.bits):
+                end = min(byte + chunk, len(self.bits))
+                values = _FIELDS[self.bits[byte:end]].reshape(-1)
+                skip = max(start - byte * 4, 0)
+                hits = np.flatnonzero(values[skip:] == status)
+                if len(hits):
+                    idx = byte * 4 + skip + int(hits[0])
+                    return idx if idx < self.count else None  # 末尾字节的填充位
+                byte, chunk = end, chunk * 2
+            return None
+        stop = min(current, self.count)  # 只看 [0, stop)
+        end = (max(stop, 0) + 3) >> 2
+        while end > 0:
+            byte = max(end - chunk, 0)
+            values = _FIELDS[self.bits[byte:end]].reshape(-1)
+            hits = np.flatnonzero(values[:stop - byte * 4] == status)
+            if len(hits):
+                return byte * 4 + int(hits[-1])
+            end, chunk = byte, chunk * 2
+        return None
+
+    def flush(self):
+        self._mmap.flush()
+
+    def close(self):
+        if self._mmap is not None:
+            self.bits = None
+            self._mmap.flush()
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+会话录制与回放：复现标注员遇到的卡顿，并作为交互延迟的回归测试。
+
+录制（可选）：config.json 中 "record_session" 设为目录后，编辑器把画布点击、悬停预览、车道线操作、
+撤销/重做、跳转和保存按发生顺序写入 <目录>/session_<时间>.jsonl，每行一个事件：
+    {"t": 距录制开始秒数, "op": 操作名, "args": [...], "digest": 操作后车道线的摘要}
+第一行是表头，记录当时的编辑器配置。只记录操作的结果（如跳转记录目标下标，而不是"下一张"），
+回放时不依赖过滤条件、近重复分组等界面状态。
+
+回放：在 offscreen 平台上创建 LaneLabelTool，打开同一标注文件的临时副本（保存写入临时目录，
+不修改原文件），按顺序调用与界面相同的方法，每个事件计时到界面事件处理完（含重绘），
+定期采样进程常驻内存。每个事件后核对车道线摘要，与录制时不一致即说明回放不再确定。
+
+命令行用法：
+    python session_replay.py sessions/session_20260101_120000.jsonl --json-out report.json
+    python session_replay.py session.jsonl --compare baseline.json --tolerance 1.5
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+
+SESSION_VERSION = 1
+NO_DIGEST_OPS = ("hover", "leave")  # 高频且不修改车道线的事件，不计算摘要
+SAMPLE_EVERY = 100
+TOLERANCE = 1.5
+
+
+def lanes_digest(lane_points):
+    """车道线的摘要；点是元组还是列表（撤销后）不影响结果"""
+    return hashlib.blake2b(json.dumps(lane_points).encode("utf-8"), digest_size=8).hexdigest()
+
+
+class SessionRecorder:
+    """把编辑器操作逐行追加到会话文件；第一次记录时才创建文件"""
+
+    def __init__(self, directory, config=None):
+        self.directory = directory
+        self.config = dict(config or {})
+        self.path = None
+        self._file = None
+        self._start = None
+
+    @classmethod
+    def from_config(cls, config):
+        directory = config.get("record_session")
+        return cls(directory, config) if directory else None
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, time.strftime("session_%Y%m%d_%H%M%S.jsonl"))
+        self._file = open(self.path, "w", buffering=1)  # 行缓冲：编辑器异常退出时也保留已记录的事件
+        self._start = time.perf_counter()
+        self.config.pop("record_session", None)
+        self._file.write(json.dumps({"version": SESSION_VERSION, "started": time.time(),
+                                     "config": self.config}) + "\n")
+
+    def log(self, op, args=(), lane_points=None):
+        if self._file is None:
+            self._open()
+        event = {"t": round(time.perf_counter() - self._start, 4), "op": op, "args": list(args)}
+        if lane_points is not None and op not in NO_DIGEST_OPS:
+            event["digest"] = lanes_digest(lane_points)
+        self._file.write(json.dumps(event) + "\n")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def load_session(path):
+    """返回 (表头, 事件列表)"""
+    with open(path, "r") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != SESSION_VERSION:
+            raise ValueError(f"unsupported session version: {header.get('version')}")
+        events = [json.loads(line) for line in f if line.strip()]
+    return header, events
+
+
+def _rss_bytes():
+    """进程常驻内存；没有 /proc 时退回 ru_maxrss（峰值）"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+class _Replayer:
+    """在临时工作目录中驱动 LaneLabelTool；事件名到编辑器方法的对应见 HANDLERS"""
+
+    def __init__(self, app, window, work_dir):
+        self.app = app
+        self.w = window
+        self.work_dir = work_dir
+        self.copies = {}  # 原标注文件路径 -> 临时副本路径
+
+    def wait_idle(self):
+        """等待后台加载、图像索引线程结束并处理完界面事件，使后续事件的起点一致"""
+        while self.w.load_thread is not None or self.w.image_index_thread is not None:
+            self.app.processEvents()
+            time.sleep(0.001)
+        self.app.processEvents()
+
+    def open(self, file_path, index):
+        from collab_server import is_collab_url
+        if is_collab_url(file_path):
+            raise ValueError(f"sessions on a collaboration server cannot be replayed: {file_path}")
+        if file_path not in self.copies:
+            copy_path = os.path.join(self.work_dir, f"{len(self.copies)}_{os.path.basename(file_path)}")
+            shutil.copyfile(file_path, copy_path)
+            self.copies[file_path] = copy_path
+        self.w._open_annotation(self.copies[file_path])
+        self.wait_idle()
+        if self.w.current_index != index:
+            self.w.goto_index(index)
+
+    def set_config(self, key, value):
+        """录制时在界面上修改的设置（拟合模型、最大车道线数、实时预览），按同样的方式应用"""
+        if key == "fit_model":
+            self.w.fit_model_combo.setCurrentIndex(self.w.fit_model_combo.findData(value))
+        elif key == "max_lanes":
+            self.w.apply_max_lanes(value)
+        elif key == "live_preview":
+            self.w.preview_checkbox.setChecked(value)
+        self.w.config[key] = value
+
+    def set_lanes(self, lanes):
+        self.w.push_undo()
+        self.w.lane_points = [[tuple(p) for p in lane] for lane in lanes]
+        self.w.current_lane = 0
+        self.w.update_lane_list()
+        self.w.update_canvas()
+
+    HANDLERS = {
+        "open": lambda r, path, index: r.open(path, index),
+        "click": lambda r, x, y: r.w.on_canvas_click(x, y),
+        "hover": lambda r, x, y: r.w.on_canvas_hover(x, y),
+        "leave": lambda r: r.w.clear_fit_preview(),
+        "select_lane": lambda r, idx: r.w.select_lane(idx),
+        "add_lane": lambda r: r.w.add_lane(),
+        "delete_lane": lambda r: r.w.delete_lane(),
+        "clear_lane": lambda r: r.w.clear_current_lane_points(),
+        "edit_point": lambda r, y, old_x, new_x: r.w.edit_lane_point(y, old_x, new_x),
+        "organize_lane": lambda r: r.w.organize_current_lane(),
+        "set_lanes": lambda r, lanes: r.set_lanes(lanes),
+        "undo": lambda r: r.w.undo(),
+        "redo": lambda r: r.w.redo(),
+        "goto": lambda r, idx: r.w.goto_index(idx),
+        "save": lambda r: r.w._save_copy(),
+        "save_copy": lambda r: r.w.save_copy2(),
+        "config": lambda r, key, value: r.set_config(key, value),
+    }
+
+    def run(self, events, sample_every=SAMPLE_EVERY, speed=0.0):
+        """返回 (各操作耗时, 内存采样, 不一致的事件序号, 基线采样)；基线为第一次打开文件完成后的采样"""
+        latencies = {}
+        memory = [(0, 0.0, _rss_bytes())]
+        baseline = None
+        mismatches = []
+        start = time.perf_counter()
+        for n, event in enumerate(events, 1):
+            if speed > 0:
+                delay = event["t"] / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            handler = self.HANDLERS.get(event["op"])
+            if handler is None:
+                raise ValueError(f"event {n}: unknown op {event['op']!r}")
+            t0 = time.perf_counter()
+            handler(self, *event["args"])
+            self.app.processEvents()  # 计入重绘等排队的界面事件
+            latencies.setdefault(event["op"], []).append((time.perf_counter() - t0) * 1000)
+            if event["op"] == "open":
+                self.wait_idle()
+                if baseline is None:
+                    baseline = (n, time.perf_counter() - start, _rss_bytes())
+                    memory.append(baseline)
+            if "digest" in event and lanes_digest(self.w.lane_points) != event["digest"]:
+                mismatches.append(n)
+            if n % sample_every == 0:
+                memory.append((n, time.perf_counter() - start, _rss_bytes()))
+        memory.append((len(events), time.perf_counter() - start, _rss_bytes()))
+        return latencies, memory, mismatches, baseline or memory[0]
+
+
+def replay(session_path, image_root=None, sample_every=SAMPLE_EVERY, speed=0.0):
+    """
+    在 offscreen 编辑器中回放会话，返回报告：
+    {"events", "ops": {操作: {count, mean_ms, p50_ms, p95_ms, max_ms}},
+     "memory": [[事件序号, 秒, 常驻内存 MB]], "memory_growth_mb", "mismatches": [事件序号]}
+    """
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    header, events = load_session(session_path)
+    session_path = os.path.abspath(session_path)
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    old_cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="lane_replay_")
+    try:
+        # 编辑器从当前目录读写 config.json / cache.json / res，全部放到临时目录
+        os.chdir(work_dir)
+        shutil.copytree(os.path.join(app_dir, "res"), "res")
+        config = dict(header.get("config", {}))
+        config["record_session"] = ""
+        config["use_sqlite_store"] = False
+        if image_root:
+            config["image_root"] = image_root
+        with open("config.json", "w") as f:
+            json.dump(config, f)
+        with open("cache.json", "w") as f:
+            json.dump({}, f)
+
+        sys.path.insert(0, app_dir)
+        from PyQt5.QtWidgets import QApplication, QMessageBox
+        # 回放不能弹出模态对话框："未保存"询问回答不保存（录制时选择保存会记录为 save 事件）
+        QMessageBox.question = staticmethod(lambda *a, **k: QMessageBox.No)
+        QMessageBox.information = staticmethod(lambda *a, **k: QMessageBox.Ok)
+        QMessageBox.warning = staticmethod(lambda *a, **k: QMessageBox.Ok)
+        from lane_label_tool import LaneLabelTool
+        app = QApplication.instance() or QApplication([sys.argv[0]])
+        window = LaneLabelTool()
+        window.show()
+        replayer = _Replayer(app, window, work_dir)
+        replayer.wait_idle()
+        latencies, memory, mismatches, baseline = replayer.run(events, sample_every, speed)
+        window.stop_preannotation()
+        window.close_annotation_store()
+        window.hide()
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    ops = {}
+    for op, values in sorted(latencies.items()):
+        values.sort()
+        ops[op] = {"count": len(values), "mean_ms": round(sum(values) / len(values), 3),
+                   "p50_ms": round(_percentile(values, 0.5), 3), "p95_ms": round(_percentile(values, 0.95), 3),
+                   "max_ms": round(values[-1], 3)}
+    # 以第一次打开文件刚完成时的采样为起点，排除模块导入和首个文件的读取
+    growth = (memory[-1][2] - baseline[2]) / 2**20
+    memory = [[n, round(t, 3), round(rss / 2**20, 1)] for n, t, rss in memory]
+    return {"session": session_path, "events": len(events), "ops": ops, "memory": memory,
+            "memory_growth_mb": round(growth, 1), "mismatches": mismatches}
+
+
+def compare_reports(report, baseline, tolerance=TOLERANCE):
+    """返回 p95 超过基线 tolerance 倍的操作 [(操作, 基线 p95, 本次 p95)]"""
+    regressions = []
+    for op, stats in report["ops"].items():
+        base = baseline.get("ops", {}).get(op)
+        if base is not None and stats["p95_ms"] > base["p95_ms"] * tolerance:
+            regressions.append((op, base["p95_ms"], stats["p95_ms"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded editing session offscreen and report latency")
+    parser.add_argument("session")
+    parser.add_argument("--image-root", help="override the image_root recorded with the session")
+    parser.add_argument("--sample-every", type=int, default=SAMPLE_EVERY, help="memory sample interval in events")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="follow recorded timing at this speed (1 = real time); 0 replays as fast as possible")
+    parser.add_argument("--json-out", help="write the report as JSON")
+    parser.add_argument("--compare", help="baseline report JSON; fail if any op's p95 exceeds it by --tolerance")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    report = replay(args.session, args.image_root, args.sample_every, args.speed)
+    print(f"{'op':<14}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for op, s in report["ops"].items():
+        print(f"{op:<14}{s['count']:>8}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['max_ms']:>10.2f}")
+    print(f"memory: {report['memory'][0][2]} MB -> {report['memory'][-1][2]} MB "
+          f"(growth after first open {report['memory_growth_mb']} MB)")
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    status = 0
+    if report["mismatches"]:
+        print(f"NOT DETERMINISTIC: lanes differ from the recording after {len(report['mismatches'])} events, "
+              f"first at event {report['mismatches'][0]}", file=sys.stderr)
+        status = 1
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        for op, base, now in compare_reports(report, baseline, args.tolerance):
+            print(f"REGRESSION\t{op}\tp95 {base:.2f} ms -> {now:.2f} ms", file=sys.stderr)
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
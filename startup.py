@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动加速工具：重量级模块的延迟导入，以及启动各阶段耗时统计。
+
+cv2 / numpy 在首次访问属性时才真正导入；窗口显示后再在后台线程预先导入，
+这样第一张图像加载时也不需要等待。
+"""
+import sys
+import time
+import logging
+import importlib
+import threading
+
+_PROCESS_START = time.perf_counter()
+
+
+class LazyModule:
+    """模块代理，首次访问属性时才导入真实模块"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+np = LazyModule("numpy")
+cv2 = LazyModule("cv2")
+
+
+def preload(*modules):
+    """在后台线程中导入指定模块（LazyModule 或模块名），返回线程对象"""
+    def run():
+        for m in modules:
+            start = time.perf_counter()
+            try:
+                if isinstance(m, LazyModule):
+                    m.load()
+                else:
+                    importlib.import_module(m)
+            except Exception as e:
+                logging.warning(f"预加载模块失败: {m} : {e}")
+                continue
+            profiler.mark(f"preload {getattr(m, '_name', m)}", since=start)
+
+    thread = threading.Thread(target=run, name="preload", daemon=True)
+    thread.start()
+    return thread
+
+
+class StartupProfiler:
+    """记录启动各阶段耗时；since 缺省时为距上一个阶段的间隔"""
+
+    def __init__(self):
+        self.enabled = "--profile-startup" in sys.argv
+        self.marks = []  # [(名称, 耗时秒, 距进程启动秒)]
+        self._last = _PROCESS_START
+        self._lock = threading.Lock()
+
+    def mark(self, name, since=None):
+        now = time.perf_counter()
+        with self._lock:
+            start = self._last if since is None else since
+            self.marks.append((name, now - start, now - _PROCESS_START))
+            if since is None:
+                self._last = now
+
+    def report(self):
+        """返回启动耗时报告文本"""
+        lines = [f"{'stage':<32}{'ms':>10}{'at ms':>10}"]
+        for name, duration, at in self.marks:
+            lines.append(f"{name:<32}{duration * 1000:>10.1f}{at * 1000:>10.1f}")
+        return "\n".join(lines)
+
+    def dump(self):
+        text = self.report()
+        logging.info("启动耗时:\n" + text)
+        if self.enabled:
+            print(text, flush=True)
+
+
+profiler = StartupProfiler()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TuSimple 车道线评测：按 raw_file 关联真值文件和预测文件，计算官方指标（Accuracy / FP / FN）。
+
+与官方 lane.py (LaneEval.bench) 的规则一致：
+    - 每条真值车道线的像素阈值为 20 / cos(θ)，θ 为该车道线 x 对 y 最小二乘拟合的倾角；
+    - 点准确率 = 命中点数 / len(h_samples)：真值和预测中小于 0 的值都先替换为 -100，
+      再按 |预测 - 真值| < 阈值 判断命中（两者都不存在时命中，只有一方存在时不命中）；
+    - 真值车道线与所有预测车道线取最高点准确率，低于 0.85 记为 FN，否则为匹配；
+    - 真值超过 4 条时去掉最差的一条，FN 也相应减 1；
+    - 预测车道线比真值多 2 条以上，或 run_time 超过 200ms 时，该帧记为 (0, 0, 1)。
+所有帧的所有车道线组合打包成 NumPy 数组一次计算；文件评测按字节分段多进程并行。
+
+命令行用法：
+    python tusimple_eval.py label.json pred.json --worst 20
+"""
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from tusimple_io import RawFileIndex, split_line_ranges, iter_lines
+
+PIXEL_THRESH = 20
+PT_THRESH = 0.85
+MAX_RUN_TIME = 200
+CHUNK_FRAMES = 4096  # 分块计算，限制中间数组的大小
+
+
+def _lanes_array(lanes, h_len, raw_file):
+    if not lanes:
+        return np.empty((0, h_len))
+    arr = np.asarray(lanes, dtype=np.float64)
+    if arr.ndim != 2 or arr.shape[1] != h_len:
+        raise ValueError(f"lane length does not match h_samples: {raw_file}")
+    return arr
+
+
+def _pack(gts, preds):
+    """把一批帧打包为定长数组，不足的车道线/采样点用掩码标记"""
+    n = len(gts)
+    h_max = max([len(g.get("h_samples", [])) for g in gts] + [1])
+    g_max = max([len(g.get("lanes", [])) for g in gts] + [1])
+    p_max = max([len(p.get("lanes", [])) for p in preds if p is not None] + [1])
+    ys = np.zeros((n, h_max))
+    h_valid = np.zeros((n, h_max), dtype=bool)
+    gt = np.full((n, g_max, h_max), -2.0)
+    gt_lane = np.zeros((n, g_max), dtype=bool)
+    pred = np.full((n, p_max, h_max), -2.0)
+    pred_lane = np.zeros((n, p_max), dtype=bool)
+    slow = np.zeros(n, dtype=bool)
+    for i, (g, p) in enumerate(zip(gts, preds)):
+        h_samples = g.get("h_samples", [])
+        h = len(h_samples)
+        ys[i, :h] = h_samples
+        h_valid[i, :h] = True
+        lanes = _lanes_array(g.get("lanes", []), h, g.get("raw_file", ""))
+        gt[i, :len(lanes), :h] = lanes
+        gt_lane[i, :len(lanes)] = True
+        if p is not None:
+            lanes = _lanes_array(p.get("lanes", []), h, g.get("raw_file", ""))
+            pred[i, :len(lanes), :h] = lanes
+            pred_lane[i, :len(lanes)] = True
+            slow[i] = p.get("run_time", 0) > MAX_RUN_TIME
+    return ys, h_valid, gt, gt_lane, pred, pred_lane, slow
+
+
+def _bench(ys, h_valid, gt, gt_lane, pred, pred_lane, slow):
+    """向量化的 LaneEval.bench，返回每帧 (accuracy, fp, fn)"""
+    # 每条真值车道线的倾角：x = k*y + b 的最小二乘斜率
+    valid = (gt >= 0) & h_valid[:, None, :]
+    count = valid.sum(axis=2)
+    safe_count = np.maximum(count, 1)
+    y = ys[:, None, :]
+    mean_y = np.where(valid, y, 0).sum(axis=2) / safe_count
+    mean_x = np.where(valid, gt, 0).sum(axis=2) / safe_count
+    dy = np.where(valid, y - mean_y[..., None], 0)
+    dx = np.where(valid, gt - mean_x[..., None], 0)
+    var = (dy * dy).sum(axis=2)
+    cov = (dy * dx).sum(axis=2)
+    k = np.where((count > 1) & (var > 0), cov / np.where(var > 0, var, 1), 0)
+    thresh = PIXEL_THRESH / np.cos(np.arctan(k))  # (帧, 真值)
+
+    # 每对 (真值, 预测) 的点准确率；与 LaneEval.line_accuracy 相同，负值先替换为 -100
+    g = np.where(gt < 0, -100.0, gt)[:, :, None, :]
+    p = np.where(pred < 0, -100.0, pred)[:, None, :, :]
+    match = np.abs(p - g) < thresh[..., None, None]
+    match &= h_valid[:, None, None, :]
+    h_len = np.maximum(h_valid.sum(axis=1), 1)
+    accs = match.sum(axis=3) / h_len[:, None, None]  # (帧, 真值, 预测)
+    accs = np.where(pred_lane[:, None, :], accs, 0)
+    max_acc = accs.max(axis=2)
+
+    n_gt = gt_lane.sum(axis=1)
+    n_pred = pred_lane.sum(axis=1)
+    matched = (gt_lane & (max_acc >= PT_THRESH)).sum(axis=1)
+    fn = (gt_lane & (max_acc < PT_THRESH)).sum(axis=1)
+    fp = n_pred - matched
+    fn = np.where((n_gt > 4) & (fn > 0), fn - 1, fn)
+    total = np.where(gt_lane, max_acc, 0).sum(axis=1)
+    worst = np.where(gt_lane, max_acc, np.inf).min(axis=1)
+    total = np.where(n_gt > 4, total - worst, total)
+    denom = np.maximum(np.minimum(n_gt, 4), 1)
+
+    accuracy = total / denom
+    fp_rate = np.where(n_pred > 0, fp / np.maximum(n_pred, 1), 0.0)
+    fn_rate = fn / denom
+    rejected = slow | (n_gt + 2 < n_pred)
+    accuracy[rejected] = 0.0
+    fp_rate[rejected] = 0.0
+    fn_rate[rejected] = 1.0
+    return accuracy, fp_rate, fn_rate
+
+
+class FrameScores:
+    """每帧评测结果（列式存放），下标为记录在真值文件中的行号"""
+
+    def __init__(self, raw_files, accuracy, fp, fn, missing):
+        self.raw_files = list(raw_files)
+        self.accuracy = np.asarray(accuracy, dtype=np.float64)
+        self.fp = np.asarray(fp, dtype=np.float64)
+        self.fn = np.asarray(fn, dtype=np.float64)
+        self.missing = np.asarray(missing, dtype=bool)  # 预测文件中没有该帧
+
+    def __len__(self):
+        return len(self.raw_files)
+
+    @classmethod
+    def concat(cls, parts):
+        if not parts:
+            return cls([], [], [], [], [])
+        return cls([r for p in parts for r in p.raw_files],
+                   np.concatenate([p.accuracy for p in parts]),
+                   np.concatenate([p.fp for p in parts]),
+                   np.concatenate([p.fn for p in parts]),
+                   np.concatenate([p.missing for p in parts]))
+
+    def summary(self):
+        """整体指标：各帧平均，与官方脚本一致"""
+        if len(self) == 0:
+            return {"accuracy": 0.0, "fp": 0.0, "fn": 0.0, "frames": 0, "missing": 0}
+        return {"accuracy": float(self.accuracy.mean()), "fp": float(self.fp.mean()),
+                "fn": float(self.fn.mean()), "frames": len(self), "missing": int(self.missing.sum())}
+
+    def worst_first(self):
+        """按准确率升序（相同时 FN、FP 高者在前）排列的帧下标"""
+        return np.lexsort((-self.fp, -self.fn, self.accuracy))
+
+
+def evaluate_records(gts, preds):
+    """
+    逐帧评测。gts 为真值记录列表，preds 为与之对应的预测记录列表（None 表示缺失，按没有预测车道线计）。
+    """
+    parts = []
+    for start in range(0, len(gts), CHUNK_FRAMES):
+        g = gts[start:start + CHUNK_FRAMES]
+        p = preds[start:start + CHUNK_FRAMES]
+        accuracy, fp, fn = _bench(*_pack(g, p))
+        parts.append(FrameScores([a.get("raw_file", "") for a in g], accuracy, fp, fn,
+                                 [x is None for x in p]))
+    return FrameScores.concat(parts)
+
+
+# ---- 并行处理：每个进程处理真值文件的一段字节范围 ----
+_worker_index = None
+
+
+def _init_worker(index):
+    global _worker_index
+    _worker_index = index
+
+
+def _eval_range(args):
+    gt_path, start, end = args
+    gts = [json.loads(line) for _, line in iter_lines(gt_path, start, end)]
+    preds = [_worker_index.get(g.get("raw_file", "")) for g in gts]
+    return evaluate_records(gts, preds)
+
+
+def evaluate_files(gt_path, pred_path, workers=None):
+    """评测两个标注文件，返回 FrameScores（按真值文件的记录顺序）"""
+    workers = workers or os.cpu_count() or 1
+    index = RawFileIndex(pred_path)
+    tasks = [(gt_path, start, end) for start, end in split_line_ranges(gt_path, workers)]
+    if workers <= 1 or len(tasks) <= 1:
+        _init_worker(index)
+        parts = [_eval_range(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(index,)) as pool:
+            parts = list(pool.map(_eval_range, tasks))
+    index.close()
+    return FrameScores.concat(parts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TuSimple lane accuracy evaluation")
+    parser.add_argument("gt_file", help="ground-truth annotation file")
+    parser.add_argument("pred_file", help="prediction file, joined by raw_file")
+    parser.add_argument("--worst", type=int, default=0, help="list the N worst frames")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    scores = evaluate_files(args.gt_file, args.pred_file, args.workers)
+    for idx in scores.worst_first()[:args.worst]:
+        print(f"{idx}\t{scores.raw_files[idx]}\tacc {scores.accuracy[idx]:.4f}\t"
+              f"fp {scores.fp[idx]:.2f}\tfn {scores.fn[idx]:.2f}")
+    print(json.dumps(scores.summary()))
+    if scores.missing.any():
+        print(f"{int(scores.missing.sum())} frames missing in {args.pred_file}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
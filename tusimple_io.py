@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TuSimple JSON-lines 文件的流式读取工具。
+
+RawFileIndex 只扫描一遍文件，记录 raw_file 哈希 -> 行首字节偏移（两个 NumPy 数组，
+每条记录 16 字节），之后按 raw_file 随机读取单条记录，不需要把整个文件解析进内存。
+"""
+import os
+import re
+import json
+import hashlib
+import numpy as np
+
+_RAW_FILE_RE = re.compile(rb'"raw_file"\s*:\s*"([^"\\]*)"')
+
+
+def raw_file_hash(raw_file):
+    """raw_file 的 64 位哈希"""
+    if isinstance(raw_file, str):
+        raw_file = raw_file.encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(raw_file, digest_size=8).digest(), "little")
+
+
+def extract_raw_file(line):
+    """从一行原始字节中取出 raw_file，不做完整 JSON 解析"""
+    m = _RAW_FILE_RE.search(line)
+    if m:
+        return m.group(1).decode("utf-8")
+    return json.loads(line).get("raw_file", "")
+
+
+def split_line_ranges(path, parts):
+    """把文件按字节切成 parts 段，每段边界对齐到行首，返回 [(start, end), ...]"""
+    size = os.path.getsize(path)
+    if size == 0 or parts <= 1:
+        return [(0, size)]
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, parts):
+            f.seek(size * i // parts)
+            f.readline()
+            pos = min(f.tell(), size)
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]]
+
+
+def iter_lines(path, start=0, end=None):
+    """流式读取 [start, end) 字节范围内的非空行，返回 (行首偏移, 原始字节)"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        pos = start
+        while end is None or pos < end:
+            line = f.readline()
+            if not line:
+                break
+            offset = pos
+            pos += len(line)
+            if line.strip():
+                yield offset, line
+
+
+class RawFileIndex:
+    """按 raw_file 查找记录的哈希索引（哈希与偏移按哈希排序存放，searchsorted 查找）"""
+
+    def __init__(self, path):
+        self.path = path
+        hashes = []
+        offsets = []
+        for offset, line in iter_lines(path):
+            hashes.append(raw_file_hash(extract_raw_file(line)))
+            offsets.append(offset)
+        hashes = np.array(hashes, dtype=np.uint64)
+        offsets = np.array(offsets, dtype=np.int64)
+        order = np.argsort(hashes, kind="stable")
+        self.hashes = hashes[order]
+        self.offsets = offsets[order]
+        self._file = None
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __getstate__(self):
+        # 传给子进程时不带打开的文件句柄
+        state = self.__dict__.copy()
+        state["_file"] = None
+        return state
+
+    def _read_at(self, offset):
+        if self._file is None:
+            self._file = open(self.path, "rb")
+        self._file.seek(int(offset))
+        return json.loads(self._file.readline())
+
+    def get(self, raw_file):
+        """返回 raw_file 对应的记录（dict），不存在返回 None；哈希碰撞时逐个核对"""
+        h = np.uint64(raw_file_hash(raw_file))
+        pos = int(np.searchsorted(self.hashes, h, side="left"))
+        while pos < len(self.hashes) and self.hashes[pos] == h:
+            ann = self._read_at(self.offsets[pos])
+            if ann.get("raw_file") == raw_file:
+                return ann
+            pos += 1
+        return None
+
+    def __contains__(self, raw_file):
+        return self.get(raw_file) is not None
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
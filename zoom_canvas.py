@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可缩放/平移的标注画布。
+
+图像按需构建多分辨率金字塔（每级边长减半），每级切成 TILE_SIZE 的图块，
+只把可见图块转换为 QPixmap 并绘制；图块缓存有上限，内存占用不随缩放增长。
+车道线等叠加层由外部回调在标注坐标系下绘制，画布只负责坐标变换。
+标注坐标系默认与图像像素一致；记录标注的分辨率与图像不同时（如标注为 1280x720、
+图像为 1920x1080），由 annotation_scale 在绘制和点击时换算，不需要缩放图像本身。
+
+交互：滚轮以光标为中心缩放，右键/中键拖动平移，左键点击发出标注坐标。
+"""
+import math
+from collections import OrderedDict
+
+from startup import cv2, np
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QPainter, QImage, QPixmap, QColor
+from PyQt5.QtCore import Qt, QPointF, QRectF, QSize, pyqtSignal
+
+TILE_SIZE = 256
+MAX_CACHED_TILES = 192  # 约 36MB (256*256*3*192)
+MIN_ZOOM = 0.1
+MAX_ZOOM = 16.0
+WHEEL_ZOOM_STEP = 1.25  # 滚轮每格缩放倍数
+
+
+class ImagePyramid:
+    """RGB 图像的惰性多分辨率金字塔及图块缓存"""
+
+    def __init__(self, image):
+        self.levels = [np.ascontiguousarray(image)]
+        self.height, self.width = image.shape[:2]
+        self.tiles = OrderedDict()  # (level, tx, ty) -> QPixmap，LRU
+
+    def level_image(self, level):
+        while len(self.levels) <= level:
+            prev = self.levels[-1]
+            h, w = prev.shape[:2]
+            if h <= TILE_SIZE and w <= TILE_SIZE:
+                break
+            self.levels.append(cv2.resize(prev, (max(1, w // 2), max(1, h // 2)),
+                                          interpolation=cv2.INTER_AREA))
+        return self.levels[min(level, len(self.levels) - 1)]
+
+    def level_for_scale(self, scale):
+        """选择分辨率不低于显示需要的最粗一级"""
+        if scale >= 1.0:
+            return 0
+        level = int(math.floor(math.log2(1.0 / scale)))
+        self.level_image(level)
+        return min(level, len(self.levels) - 1)
+
+    def tile(self, level, tx, ty):
+        key = (level, tx, ty)
+        pixmap = self.tiles.get(key)
+        if pixmap is not None:
+            self.tiles.move_to_end(key)
+            return pixmap
+        img = self.level_image(level)
+        block = np.ascontiguousarray(
+            img[ty * TILE_SIZE:(ty + 1) * TILE_SIZE, tx * TILE_SIZE:(tx + 1) * TILE_SIZE])
+        h, w = block.shape[:2]
+        qimg = QImage(block.data, w, h, block.strides[0], QImage.Format_RGB888)
+        pixmap = QPixmap.fromImage(qimg)  # fromImage 会复制数据，block 可以释放
+        self.tiles[key] = pixmap
+        if len(self.tiles) > MAX_CACHED_TILES:
+            self.tiles.popitem(last=False)
+        return pixmap
+
+
+class ZoomCanvas(QWidget):
+    """
+    视图状态：zoom 为屏幕像素/图像像素，offset 为控件左上角对应的图像坐标；
+    annotation_scale 为每个标注坐标单位对应的图像像素 (sx, sy)。
+    """
+    clicked = pyqtSignal(float, float)  # 左键点击的标注坐标
+    hovered = pyqtSignal(float, float)  # 未按键移动鼠标时的标注坐标
+    left = pyqtSignal()  # 鼠标离开画布
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pyramid = None
+        self.zoom = 1.0
+        self.default_zoom = None  # 配置的缩放（canvas_size）；None 表示换图时缩放到整图可见
+        self.offset = QPointF(0, 0)
+        self.annotation_scale = (1.0, 1.0)
+        self.overlay_painter = None  # 回调 f(painter)，painter 已变换到标注坐标
+        self.preferred_size = QSize(1280, 720)
+        self._pan_origin = None
+        self.setMouseTracking(True)
+        self.setFocusPolicy(Qt.ClickFocus)
+        self.setMinimumSize(320, 180)
+
+    def sizeHint(self):
+        return self.preferred_size
+
+    # ---- 图像与视图 ----
+    def set_image(self, image, keep_view=True, annotation_size=None):
+        """
+        更换显示的图像；keep_view 为 True 且尺寸与上一张相同时保持当前缩放和位置，
+        便于连续浏览时对比同一区域。否则按 default_zoom 缩放，未设置时缩放到整图可见。
+        annotation_size 为标注坐标系的 (宽, 高)，None 表示与图像相同。
+        """
+        same_size = (self.pyramid is not None and
+                     (self.pyramid.height, self.pyramid.width) == image.shape[:2])
+        self.pyramid = ImagePyramid(image)
+        if annotation_size is None:
+            self.annotation_scale = (1.0, 1.0)
+        else:
+            self.annotation_scale = (self.pyramid.width / annotation_size[0],
+                                     self.pyramid.height / annotation_size[1])
+        if not (keep_view and same_size):
+            if self.default_zoom is None:
+                self.fit_to_view()
+            else:
+                self.set_zoom(self.default_zoom)
+        self.update()
+
+    def image_size(self):
+        """标注坐标系下的图像尺寸"""
+        if self.pyramid is None:
+            return 0, 0
+        sx, sy = self.annotation_scale
+        return self.pyramid.width / sx, self.pyramid.height / sy
+
+    def pixels_per_unit(self):
+        """一个标注坐标单位在屏幕上的像素数（取 x 方向），用于保持点的屏幕大小不变"""
+        return self.zoom * self.annotation_scale[0]
+
+    def fit_to_view(self):
+        """缩放到整张图像可见，并居中"""
+        if self.pyramid is None:
+            return
+        zoom = min(self.width() / self.pyramid.width, self.height() / self.pyramid.height)
+        self.set_zoom(zoom)
+
+    def set_zoom(self, zoom, anchor=None):
+        """以控件坐标 anchor（默认控件中心）为不动点缩放"""
+        if self.pyramid is None:
+            self.zoom = zoom
+            return
+        zoom = max(MIN_ZOOM, min(MAX_ZOOM, zoom))
+        if anchor is None:
+            anchor = QPointF(self.width() / 2, self.height() / 2)
+        image_pt = self.widget_to_image(anchor)
+        self.zoom = zoom
+        self.offset = image_pt - anchor / zoom
+        self._clamp_offset()
+        self.update()
+
+    def _clamp_offset(self):
+        """图像比视图小时居中，否则不允许拖出图像边界"""
+        view_w = self.width() / self.zoom
+        view_h = self.height() / self.zoom
+        img_w, img_h = self.pyramid.width, self.pyramid.height
+        x = (img_w - view_w) / 2 if view_w >= img_w else min(max(self.offset.x(), 0), img_w - view_w)
+        y = (img_h - view_h) / 2 if view_h >= img_h else min(max(self.offset.y(), 0), img_h - view_h)
+        self.offset = QPointF(x, y)
+
+    def widget_to_image(self, pos):
+        return QPointF(pos.x() / self.zoom + self.offset.x(), pos.y() / self.zoom + self.offset.y())
+
+    def image_to_widget(self, pos):
+        return QPointF((pos.x() - self.offset.x()) * self.zoom, (pos.y() - self.offset.y()) * self.zoom)
+
+    def widget_to_annotation(self, pos):
+        pt = self.widget_to_image(pos)
+        sx, sy = self.annotation_scale
+        return QPointF(pt.x() / sx, pt.y() / sy)
+
+    def annotation_to_widget(self, pos):
+        sx, sy = self.annotation_scale
+        return self.image_to_widget(QPointF(pos.x() * sx, pos.y() * sy))
+
+    def update_image_region(self, *curves, margin=6):
+        """只重绘覆盖若干条曲线 (xs, ys)（标注坐标）的控件区域，None 会被忽略"""
+        rect = QRectF()
+        for curve in curves:
+            if curve is None or len(curve[0]) == 0:
+                continue
+            xs, ys = curve
+            top_left = self.annotation_to_widget(QPointF(float(np.min(xs)), float(np.min(ys))))
+            bottom_right = self.annotation_to_widget(QPointF(float(np.max(xs)), float(np.max(ys))))
+            rect = rect.united(QRectF(top_left, bottom_right))
+        if not rect.isNull():
+            self.update(rect.adjusted(-margin, -margin, margin, margin).toAlignedRect())
+
+    # ---- 绘制 ----
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(40, 40, 40))
+        if self.pyramid is None:
+            painter.end()
+            return
+        painter.scale(self.zoom, self.zoom)
+        painter.translate(-self.offset.x(), -self.offset.y())
+        # 缩小显示时平滑采样，放大时保持像素清晰便于精确点选
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, self.zoom < 2.0)
+
+        level = self.pyramid.level_for_scale(self.zoom)
+        factor = 2 ** level
+        level_img = self.pyramid.level_image(level)
+        level_h, level_w = level_img.shape[:2]
+        # 需要重绘的区域（图像坐标）换算为该级的图块范围
+        dirty = QRectF(event.rect())
+        visible = QRectF(self.widget_to_image(dirty.topLeft()), self.widget_to_image(dirty.bottomRight()))
+        tx0 = max(0, int(visible.left() / factor) // TILE_SIZE)
+        ty0 = max(0, int(visible.top() / factor) // TILE_SIZE)
+        tx1 = min((level_w - 1) // TILE_SIZE, int(visible.right() / factor) // TILE_SIZE)
+        ty1 = min((level_h - 1) // TILE_SIZE, int(visible.bottom() / factor) // TILE_SIZE)
+        # 每一级的边长是上一级整除 2，用实际比例映射回原图坐标，避免边缘错位
+        sx = self.pyramid.width / level_w
+        sy = self.pyramid.height / level_h
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                pixmap = self.pyramid.tile(level, tx, ty)
+                target = QRectF(tx * TILE_SIZE * sx, ty * TILE_SIZE * sy,
+                                pixmap.width() * sx, pixmap.height() * sy)
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+
+        if self.overlay_painter is not None:
+            painter.scale(*self.annotation_scale)
+            painter.setRenderHint(QPainter.Antialiasing, True)
+            self.overlay_painter(painter)
+        painter.end()
+
+    # ---- 交互 ----
+    def wheelEvent(self, event):
+        if self.pyramid is None:
+            return
+        steps = event.angleDelta().y() / 120.0
+        self.set_zoom(self.zoom * (WHEEL_ZOOM_STEP ** steps), QPointF(event.pos()))
+
+    def mousePressEvent(self, event):
+        if event.button() in (Qt.RightButton, Qt.MiddleButton):
+            self._pan_origin = (QPointF(event.pos()), QPointF(self.offset))
+            self.setCursor(Qt.ClosedHandCursor)
+        elif event.button() == Qt.LeftButton and self.pyramid is not None:
+            pt = self.widget_to_annotation(QPointF(event.pos()))
+            self.clicked.emit(pt.x(), pt.y())
+
+    def mouseMoveEvent(self, event):
+        if self._pan_origin is not None:
+            start, offset = self._pan_origin
+            delta = (QPointF(event.pos()) - start) / self.zoom
+            self.offset = offset - delta
+            self._clamp_offset()
+            self.update()
+        elif event.buttons() == Qt.NoButton and self.pyramid is not None:
+            pt = self.widget_to_annotation(QPointF(event.pos()))
+            self.hovered.emit(pt.x(), pt.y())
+
+    def leaveEvent(self, event):
+        self.left.emit()
+        super().leaveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if self._pan_origin is not None and event.button() in (Qt.RightButton, Qt.MiddleButton):
+            self._pan_origin = None
+            self.unsetCursor()
+
+    def resizeEvent(self, event):
+        if self.pyramid is not None:
+            self._clamp_offset()
+        super().resizeEvent(event)